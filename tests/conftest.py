@@ -0,0 +1,15 @@
+import pytest
+
+from tevcat.benchmark import syntheticData
+from tevcat.tevcat_all import TeVCat
+
+@pytest.fixture(scope='session')
+def catalog():
+    """
+    Returns a function building a TeVCat of `n` synthetic sources, which are
+    not validated
+    """
+    def load(n, seed=0):
+        return TeVCat.from_data('1.0', syntheticData(n, seed), validation='off')
+
+    return load
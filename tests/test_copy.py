@@ -0,0 +1,12 @@
+def test_copy_has_own_caches(catalog):
+    tevcat = catalog(50)
+    other = tevcat.copy()
+    other.getTable()['glon']
+    other.getTable().getHMSDMS()
+
+    table, copied = tevcat.getTable(), other.getTable()
+    assert copied is not table
+    assert copied['ra'] is table['ra']
+    assert 'galactic' in copied.frames and 'galactic' not in table.frames
+    assert table.hmsdms == None
+    assert len(copied.stats.spans) > len(table.stats.spans)
@@ -0,0 +1,23 @@
+import json
+import subprocess
+import sys
+
+# seconds allowed for import tevcat in a fresh interpreter
+budget = 0.5
+
+script = '''
+import json, sys, time
+start = time.perf_counter()
+import tevcat
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+def test_import():
+    output = subprocess.check_output([sys.executable, '-c', script])
+    result = json.loads(output.decode('utf-8').splitlines()[-1])
+
+    loaded = set(name.split('.')[0] for name in result['modules'])
+    for module in ('astropy', 'requests', 'ROOT', 'PIL'):
+        assert module not in loaded
+    assert result['elapsed'] < budget
@@ -0,0 +1,14 @@
+from tevcat.benchmark import measureMemory, syntheticData
+
+# sources of the synthetic catalog
+size = 10000
+
+# bytes per source retained by a TeVCat with its coordinates, hmsdms strings
+# and Source objects (about 470 when this was written)
+budget = 640
+
+def test_memory_per_source():
+    data = syntheticData(size)
+    result = measureMemory(data)
+
+    assert result['best'] < budget
@@ -0,0 +1,35 @@
+import copy
+import pickle
+
+from tevcat.benchmark import syntheticData
+from tevcat.shared import exportState
+from tevcat.tevcat_all import TeVCat
+
+def test_pickle_leaves_out_json(catalog):
+    tevcat = catalog(5000)
+    blob = pickle.dumps(tevcat, protocol=pickle.HIGHEST_PROTOCOL)
+    with_json = pickle.dumps(exportState(tevcat, include_json=True), protocol=pickle.HIGHEST_PROTOCOL)
+    assert len(blob) < 0.7*len(with_json)
+
+    restored = pickle.loads(blob)
+    assert restored.json_data == None
+    assert [str(source) for source in restored.getSources()[:20]] == [str(source) for source in tevcat.getSources()[:20]]
+
+def test_rebuilt_json_round_trips(catalog):
+    tevcat = catalog(500, 1)
+    restored = pickle.loads(pickle.dumps(tevcat))
+    rebuilt = TeVCat.from_data('1.0', restored.json, validation='off')
+    for name in tevcat.getTable().keys():
+        assert repr(rebuilt.getTable()[name].tolist()) == repr(tevcat.getTable()[name].tolist()), name
+
+def test_refresh_after_unpickling(catalog):
+    data = syntheticData(300, 2)
+    tevcat = catalog(300, 2)
+    restored = pickle.loads(pickle.dumps(tevcat))
+
+    new = copy.deepcopy(data)
+    new['sources'][3]['flux'] = 123.
+    changes = restored.refresh('1.1', new)
+    assert changes.getAdded() == [] and changes.getRemoved() == []
+    assert list(changes.getModified().keys()) == [int(new['sources'][3]['id'])]
+    assert restored.getSources()[3].getFlux() == 123.
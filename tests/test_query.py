@@ -0,0 +1,41 @@
+import numpy
+import pytest
+
+@pytest.fixture(scope='module')
+def tevcat(catalog):
+    return catalog(1000, 7)
+
+def getMask(tevcat, predicate):
+    """
+    Returns the mask of the sources satisfying `predicate` (a function of a
+    Source) by calling it on every source
+    """
+    return numpy.array([bool(predicate(source)) for source in tevcat.getSources()])
+
+def test_query(tevcat):
+    cases = [({'source_type_name': 'PWN'},
+              lambda source: source.getSourceTypeName() == 'PWN'),
+             ({'source_type_name': {'PWN', 'SNR'}, 'flux': (0.1, 1.)},
+              lambda source: source.getSourceTypeName() in ('PWN', 'SNR') and source.getFlux() != None and 0.1 <= source.getFlux() <= 1.),
+             ({'catalog': 'Newly Announced', 'discovered': (2000, 2010)},
+              lambda source: source.getCatalog().getName() == 'Newly Announced' and source.getDiscoveryDate() != None and 2000 <= int(source.getDiscoveryDate()[0]) <= 2010),
+             ({'observatory_name': {'H.E.S.S.', 'MAGIC'}, 'ext': 1},
+              lambda source: source.getObservatoryName() in ('H.E.S.S.', 'MAGIC') and source.isExtended()),
+             ({'flux': (None, 0.5), 'dec': lambda dec: dec > 0, 'search': 'crab'},
+              lambda source: source.getFlux() != None and source.getFlux() <= 0.5 and source.getPosition().dec.degree > 0 and 'crab' in str(source.getOtherNames()).lower()),
+             ({'spec_idx': 2.5, 'discovered': (None, 1995)},
+              lambda source: source.getSpectralIndex() == 2.5 and source.getDiscoveryDate() != None and int(source.getDiscoveryDate()[0]) <= 1995)]
+
+    for predicates, predicate in cases:
+        expected = getMask(tevcat, predicate)
+        assert expected.any(), predicates
+        assert numpy.all(tevcat.query(**predicates).getMask() == expected), predicates
+
+def test_select(tevcat):
+    names = {'Default Catalog', 'Newly Announced'}
+    expected = getMask(tevcat, lambda source: source.getCatalog().getName() in names and source.getSourceTypeName() == 'PWN')
+    assert numpy.all(tevcat.select(catalog=names, source_type_name='PWN', mask=True) == expected)
+    assert list(tevcat.select(catalog=names, source_type_name='PWN')) == list(numpy.nonzero(expected)[0])
+
+    expected = getMask(tevcat, lambda source: source.getObservatoryName() in ('VERITAS', 'Unknown Telescope'))
+    assert numpy.all(tevcat.select(observatory_name={'VERITAS', 'Unknown Telescope'}, mask=True) == expected)
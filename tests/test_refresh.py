@@ -0,0 +1,57 @@
+import copy
+
+import pytest
+
+from tevcat.benchmark import syntheticData
+from tevcat.tevcat_all import TeVCat
+from tevcat.validation import TeVCatWarning, ValidationError
+
+def test_diagnostics_point_into_merged_table():
+    data = syntheticData(100, seed=1)
+    data['sources'][10]['observatory_name'] = 'Old Telescope'
+    with pytest.warns(TeVCatWarning):
+        tevcat = TeVCat.from_data('1.0', data)
+    assert [d.index for d in tevcat.diagnostics if d.code == 'unknown_observatory'] == [10]
+
+    new = copy.deepcopy(data)
+    del new['sources'][0] # shifts all the rows
+    new['sources'][49]['observatory_name'] = 'New Telescope'
+    with pytest.warns(TeVCatWarning):
+        tevcat.refresh('1.1', new)
+
+    names = tevcat.getTable()['observatory_name']
+    found = dict((d.value, d.index) for d in tevcat.diagnostics if d.code == 'unknown_observatory')
+    assert found == {'Old Telescope': 9, 'New Telescope': 49}
+    assert names[9] == 'Old Telescope' and names[49] == 'New Telescope'
+
+def test_failed_strict_refresh_changes_nothing():
+    data = syntheticData(100, seed=2)
+    tevcat = TeVCat.from_data('1.0', data, validation='strict')
+    observatory_names = dict(tevcat.observatory_names)
+    source_type_names = dict(tevcat.source_type_names)
+
+    new = copy.deepcopy(data)
+    new['sources'][5]['discoverer'] = 999
+    new['sources'][6]['source_type'] = 999
+    with pytest.raises(ValidationError):
+        tevcat.refresh('1.1', new)
+
+    assert tevcat.version == '1.0'
+    assert tevcat.observatory_names == observatory_names
+    assert tevcat.source_type_names == source_type_names
+
+def test_invalid_discoverer_has_row():
+    data = syntheticData(100, seed=3)
+    data['sources'][7]['discoverer'] = 'unknown'
+    with pytest.warns(TeVCatWarning):
+        tevcat = TeVCat.from_data('1.0', data)
+    assert [d.index for d in tevcat.diagnostics if d.code == 'invalid_discoverer'] == [7]
+
+    new = copy.deepcopy(data)
+    del new['sources'][0]
+    new['sources'][20]['discoverer'] = 'other'
+    with pytest.warns(TeVCatWarning):
+        tevcat.refresh('1.1', new)
+
+    found = dict((d.value, d.index) for d in tevcat.diagnostics if d.code == 'invalid_discoverer')
+    assert found == {'unknown': 6, 'other': 20}
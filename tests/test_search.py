@@ -0,0 +1,30 @@
+import numpy
+import pytest
+
+from tevcat.benchmark import syntheticData
+from tevcat.tevcat_all import TeVCat
+
+@pytest.fixture(scope='module')
+def tevcat():
+    data = syntheticData(500, 8)
+    data['sources'][3]['canonical_name'] = 'Ünïcode Source'
+    data['sources'][4]['other_names'] = ['not', 'a', 'string']
+    return TeVCat.from_data('1.0', data, validation='off')
+
+def getNames(source):
+    return [source.getCanonicalName(), source.getOtherNames(), source.getCatalogName(),
+            source.getSourceTypeName(), source.getObservatoryName()]
+
+def test_search(tevcat):
+    for query in ['vela', 'Crab Nebula', 'J17', 'tev j0', 'x', 'ne', 'SNR', 'h.e.s.s', 'ünï', 'string', '', 'no such name']:
+        expected = [i for i, source in enumerate(tevcat.getSources())
+                    if any(query.lower() in str(name).lower() for name in getNames(source) if name != None)]
+        assert list(tevcat.search(query)) == expected, query
+        assert list(numpy.nonzero(tevcat.search(query, mask=True))[0]) == expected, query
+
+def test_prefix_search(tevcat):
+    for query in ['hess', 'mrk', 'syn', 'tev j1', 'ebula']:
+        expected = [i for i, source in enumerate(tevcat.getSources())
+                    if any(word.lower().startswith(query) for name in getNames(source) if name != None
+                           for word in [str(name)] + str(name).replace(',', ' ').split())]
+        assert list(tevcat.search(query, prefix=True)) == expected, query
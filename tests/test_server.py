@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from tevcat.server import QueryService, Server
+
+@pytest.fixture(scope='module')
+def service(catalog):
+    return QueryService(catalog(50))
+
+def request(service, data):
+    """
+    Sends raw request bytes to a new server and returns (status, JSON body)
+    """
+    async def run():
+        server = Server(service, port=0)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(data)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.server.close()
+            await server.server.wait_closed()
+        return response
+
+    header, body = asyncio.run(run()).split(b'\r\n\r\n', 1)
+    return int(header.split()[1]), json.loads(body)
+
+def test_get(service):
+    status, body = request(service, b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+    assert status == 200
+    assert body['sources'] == 50
+
+def test_malformed_content_length(service):
+    status, body = request(service, b'GET / HTTP/1.1\r\nContent-Length: abc\r\n\r\n')
+    assert status == 400
+
+def test_negative_content_length(service):
+    status, body = request(service, b'GET / HTTP/1.1\r\nContent-Length: -5\r\n\r\n')
+    assert status == 400
+
+def test_too_large_content_length(service):
+    status, body = request(service, b'GET / HTTP/1.1\r\nContent-Length: 1000000000\r\n\r\n')
+    assert status == 413
+
+class SlowService(QueryService):
+    def dispatch(self, tevcat, path, params):
+        if path == '/slow':
+            time.sleep(0.5)
+            return {}
+        return QueryService.dispatch(self, tevcat, path, params)
+
+def test_slow_request_does_not_block(service):
+    slow = SlowService(service.getTeVCat())
+    slow.respond('/')
+
+    async def get(port, target, finished):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(('GET %s HTTP/1.1\r\nConnection: close\r\n\r\n' % target).encode('latin-1'))
+        await reader.read()
+        writer.close()
+        finished.append(target)
+
+    async def run():
+        server = Server(slow, port=0)
+        await server.start()
+        finished = []
+        try:
+            slow_request = asyncio.ensure_future(get(server.port, '/slow', finished))
+            await asyncio.sleep(0.1)
+            await get(server.port, '/', finished)
+            await slow_request
+        finally:
+            server.server.close()
+            await server.server.wait_closed()
+        return finished
+
+    assert asyncio.run(run()) == ['/', '/slow']
@@ -0,0 +1,67 @@
+import multiprocessing
+
+import numpy
+import pytest
+
+from tevcat import shared
+
+@pytest.fixture(scope='module')
+def tevcat(catalog):
+    return catalog(200)
+
+def countPWN(handle):
+    return len(shared.attach(handle).query(source_type_name='PWN'))
+
+def test_attach(tevcat):
+    with tevcat.share() as block:
+        attached = shared.attach(block.handle)
+        assert shared.attach(block.handle) is attached
+        assert not attached.getTable()['ra'].flags.writeable
+        assert str(attached.getSources()[3]) == str(tevcat.getSources()[3])
+        del attached
+        shared.detach(block.handle)
+
+def test_workers(tevcat):
+    with tevcat.share() as block:
+        with multiprocessing.get_context('spawn').Pool(2) as pool:
+            counts = pool.map(countPWN, [block.handle]*4)
+    assert counts == [len(tevcat.query(source_type_name='PWN'))]*4
+
+def test_detach_invalidates(tevcat):
+    with tevcat.share() as block:
+        attached = shared.attach(block.handle)
+        source = attached.getSources()[0]
+        shared.detach(block.handle)
+
+        with pytest.raises(ValueError):
+            attached.getTable()['ra']
+        with pytest.raises(ValueError):
+            source.getCanonicalName()
+        with pytest.raises(ValueError):
+            attached.query(source_type_name='PWN')
+
+        # attached again from scratch
+        again = shared.attach(block.handle)
+        assert again is not attached
+        assert again.getSources()[0].getCanonicalName() == tevcat.getSources()[0].getCanonicalName()
+        del again
+        shared.detach(block.handle)
+
+def test_detach_with_arrays_in_use(tevcat):
+    with tevcat.share() as block:
+        ra = shared.attach(block.handle).getTable()['ra']
+        with pytest.raises(BufferError):
+            shared.detach(block.handle)
+        assert len(ra) == 200 and numpy.isfinite(ra).all() # still mapped
+        del ra
+
+def test_released_block_is_closed_later(tevcat):
+    with tevcat.share() as block:
+        head = shared.attach(block.handle).getTable()['ra'][:5]
+        with pytest.raises(BufferError):
+            shared.detach(block.handle)
+        assert shared._unclosed
+
+        del head
+        shared.closeReleased()
+        assert not shared._unclosed
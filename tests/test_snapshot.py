@@ -0,0 +1,64 @@
+import pytest
+
+from tevcat.benchmark import syntheticData
+from tevcat.tevcat_all import TeVCat, parseSource, sourceEntry
+from tevcat.validation import TeVCatWarning
+
+formats = [('fits', TeVCat.to_fits, TeVCat.from_fits),
+           ('arrow', TeVCat.to_arrow, TeVCat.from_arrow),
+           ('parquet', TeVCat.to_parquet, TeVCat.from_parquet)]
+
+@pytest.fixture(scope='module')
+def tevcat():
+    data = syntheticData(300, 9)
+    sources = data['sources']
+    sources[0]['canonical_name'] = 'Ünïcode Source'
+    sources[1]['canonical_name'] = 'Trailing space '
+    sources[2]['other_names'] = ['a list', 1]
+    sources[3]['notes'] = {'text': 'a note', 'links': [1, 2]}
+    sources[4]['private_notes'] = ''
+    sources[5]['observatory_name'] = 'Unknown Telescope'
+    sources[6]['discoverer'] = 'unknown'
+    with pytest.warns(TeVCatWarning):
+        tevcat = TeVCat.from_data('1.0', data)
+    tevcat.getTable().getHMSDMS()
+    return tevcat
+
+def checkTables(tevcat, loaded):
+    table, other = tevcat.getTable(), loaded.getTable()
+    assert sorted(other.keys()) == sorted(table.keys())
+    for name in table.keys():
+        assert repr(other[name].tolist()) == repr(table[name].tolist()), name
+    for frame in ('fk5', 'icrs', 'galactic'):
+        assert [column.tolist() for column in other.getFrame(frame)] == [column.tolist() for column in table.getFrame(frame)], frame
+    assert other.getHMSDMS() == table.getHMSDMS()
+    assert loaded.version == tevcat.version
+    assert [str(source) for source in loaded.getSources()] == [str(source) for source in tevcat.getSources()]
+    assert [loaded.getCatalog(i).getName() for i in loaded.catalogs] == [tevcat.getCatalog(i).getName() for i in tevcat.catalogs]
+
+@pytest.mark.parametrize('extension, write, read', formats)
+def test_round_trip(tevcat, tmp_path, extension, write, read):
+    if extension != 'fits':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path/('snapshot.' + extension))
+    write(tevcat, path)
+    loaded = read(path)
+    checkTables(tevcat, loaded)
+
+    assert loaded.validation == tevcat.validation
+    assert [d.asDict() for d in loaded.diagnostics] == [d.asDict() for d in tevcat.diagnostics]
+    assert loaded.observatory_names == tevcat.observatory_names
+    assert loaded.source_type_names == tevcat.source_type_names
+    assert loaded.json[u'sources'] == [sourceEntry(parseSource(source)) for source in tevcat.json[u'sources']]
+
+@pytest.mark.parametrize('extension, write, read', formats)
+def test_round_trip_with_json(tevcat, tmp_path, extension, write, read):
+    if extension != 'fits':
+        pytest.importorskip('pyarrow')
+    path = str(tmp_path/('snapshot.' + extension))
+    write(tevcat, path, include_json=True)
+    with pytest.warns(TeVCatWarning):
+        loaded = read(path, validation='warn')
+    checkTables(tevcat, loaded)
+    assert loaded.json == tevcat.json
+    assert [d.asDict() for d in loaded.diagnostics] == [d.asDict() for d in tevcat.diagnostics]
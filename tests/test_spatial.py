@@ -0,0 +1,69 @@
+import numpy
+import pytest
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+
+@pytest.fixture(scope='module')
+def tevcat(catalog):
+    return catalog(2000, 4)
+
+def getPositions(tevcat):
+    table = tevcat.getTable()
+    return SkyCoord(table['ra'], table['dec'], unit='deg', frame='fk5')
+
+def test_cone_search(tevcat):
+    positions = getPositions(tevcat)
+    for ra, dec, radius in [(83.6, 22.0, 15.), (0.5, -89.0, 5.), (359.9, 10.0, 20.), (200., 45., 0.)]:
+        separation = positions.separation(SkyCoord(ra, dec, unit='deg', frame='fk5')).degree
+        indices, found = tevcat.getSpatialIndex().coneSearch(ra, dec, radius)
+        assert set(indices) == set(numpy.nonzero(separation <= radius)[0])
+        assert list(indices) == list(tevcat.cone_search((ra, dec), radius))
+        assert numpy.allclose(found, separation[indices], rtol=0, atol=1e-8)
+        assert numpy.all(numpy.diff(found) >= 0)
+
+def test_cone_search_galactic(tevcat):
+    center = SkyCoord(10., -5., unit='deg', frame='galactic')
+    separation = getPositions(tevcat).separation(center).degree
+    indices = tevcat.cone_search(center, 12*u.deg)
+    assert set(indices) == set(numpy.nonzero(separation <= 12.)[0])
+
+def crossmatchPairs(tevcat, inputs, radius):
+    """
+    Returns the pairs (input, source) within `radius` [deg] of every source
+    and their separations by comparing all the pairs
+    """
+    positions = getPositions(tevcat)
+    separation = inputs[:, numpy.newaxis].separation(positions[numpy.newaxis, :]).degree
+    i, j = numpy.nonzero(separation <= radius)
+    return dict(((a, b), s) for a, b, s in zip(i, j, separation[i, j]))
+
+def checkPairs(result, expected):
+    i, j, separation = result
+    assert dict(((a, b), s) for a, b, s in zip(i, j, separation)).keys() == expected.keys()
+    assert numpy.allclose(separation, [expected[(a, b)] for a, b in zip(i, j)], rtol=0, atol=1e-8)
+    order = numpy.lexsort((separation, i))
+    assert numpy.all(order == numpy.arange(len(i)))
+
+def test_crossmatch(tevcat):
+    rng = numpy.random.default_rng(5)
+    ra = rng.uniform(0., 360., 300)
+    dec = numpy.degrees(numpy.arcsin(rng.uniform(-1., 1., 300)))
+    inputs = SkyCoord(ra, dec, unit='deg', frame='fk5')
+    expected = crossmatchPairs(tevcat, inputs, 3.)
+
+    checkPairs(tevcat.crossmatch(ra, dec, radius=3.), expected)
+    checkPairs(tevcat.crossmatch(ra, dec, radius=3.*u.deg, chunk_size=64), expected)
+    checkPairs(tevcat.crossmatch(inputs.galactic, radius=3., chunk_size=100), expected)
+
+def test_crossmatch_extended(tevcat):
+    rng = numpy.random.default_rng(6)
+    ra = rng.uniform(0., 360., 200)
+    dec = numpy.degrees(numpy.arcsin(rng.uniform(-1., 1., 200)))
+    i, j, separation = tevcat.crossmatch(ra, dec, radius=2., extended=True)
+
+    table = tevcat.getTable()
+    extent = numpy.maximum(table['size_x'], table['size_y'])
+    inputs = SkyCoord(ra, dec, unit='deg', frame='fk5')
+    all_pairs = crossmatchPairs(tevcat, inputs, 2. + extent.max())
+    expected = dict((pair, s) for pair, s in all_pairs.items() if s <= 2. + extent[pair[1]])
+    checkPairs((i, j, separation), expected)
@@ -4,7 +4,20 @@ http://tevcat.uchicago.edu/
 
 It retrieves the TeV source database from the TeVCat HTML. Basic getter methods
 and an all-sky viewer are offered.
+
+The viewer needs ROOT, which is imported only when tevcat.Viewer is accessed.
 """
 from __future__ import absolute_import
 
 from .tevcat_all import *
+from .refresher import AutoRefresher
+
+def __getattr__(name):
+    if name in ('Viewer', 'ImageCache'):
+        try:
+            from . import viewer
+        except ImportError as e:
+            raise AttributeError('tevcat.%s is not available (%s)' % (name, e))
+        return getattr(viewer, name)
+
+    raise AttributeError("module 'tevcat' has no attribute '%s'" % name)
@@ -0,0 +1,49 @@
+"""
+Command line interface
+
+    $ python -m tevcat serve [--snapshot FILE] [--offline] [--host HOST] [--port PORT]
+"""
+import argparse
+import sys
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tevcat', description='PyTeVCat command line interface')
+    commands = parser.add_subparsers(dest='command')
+
+    serve = commands.add_parser('serve', help='serve cone search, name search and queries over HTTP (see tevcat.server)')
+    serve.add_argument('--snapshot', help='snapshot file to load (.json, .fits, .arrow or .parquet) instead of the cache')
+    serve.add_argument('--cache-dir', help='cache directory (default: ~/.cache/tevcat or $TEVCAT_CACHE_DIR)')
+    serve.add_argument('--offline', action='store_true', help='use only the cache, without network access')
+    serve.add_argument('--refresh', type=float, help='refresh the catalog from TeVCat every REFRESH seconds')
+    serve.add_argument('--validation', default='warn', choices=('strict', 'warn', 'off'), help='validation mode (default: warn)')
+    serve.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    serve.add_argument('--port', type=int, default=8080, help='port to listen on (default: 8080)')
+    serve.add_argument('--cache-size', type=int, default=1024, help='number of cached responses (default: 1024)')
+    serve.add_argument('--quiet', action='store_true', help='do not log the requests')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        from .server import QueryService, loadTeVCat, serve
+
+        if args.refresh != None and (args.snapshot != None or args.offline):
+            parser.error('--refresh cannot be used with --snapshot or --offline')
+
+        tevcat = loadTeVCat(args.snapshot, args.cache_dir, args.offline, args.validation)
+        refresher = None
+        if args.refresh != None:
+            from .refresher import AutoRefresher
+
+            refresher = AutoRefresher(tevcat, args.refresh)
+            refresher.start()
+
+        service = QueryService(tevcat, refresher, args.cache_size)
+        serve(service, args.host, args.port, None if args.quiet else print)
+        if refresher != None:
+            refresher.stop()
+        return 0
+
+    parser.print_help()
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
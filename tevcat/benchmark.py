@@ -0,0 +1,327 @@
+"""
+Benchmarks of the main operations on synthetic catalogs
+
+The synthetic catalogs have the same fields as the TeVCat JSON data and can be
+generated at any scale (10^3 to 10^6 sources). The results are written as JSON
+so that they can be compared across commits.
+
+    $ python -m tevcat.benchmark --sizes 1000 10000 100000 --output new.json
+    $ python -m tevcat.benchmark --compare old.json new.json
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+from .tevcat_all import TeVCat, SourceTable, observatory_names, source_type_names, parsePage
+from . import validation
+from .hitmap import buildHitMap, pixelVectors
+from .projection import aitoff_forward
+
+catalog_names = ('Default Catalog', 'Newly Announced', 'Other Sources', 'Source Candidates')
+
+other_names = (None, 'Crab Nebula', 'Vela X, HESS J0835-455', 'Mrk 421', 'RX J1713.7-3946')
+
+def syntheticSources(n, seed=0):
+    """
+    Returns a list of `n` random source entries in the TeVCat JSON format.
+    The positions are uniform on the sky, and the IDs of the observatories and
+    the source types are those known by tevcat_all.py.
+    """
+    rng = numpy.random.default_rng(seed)
+
+    ra = rng.uniform(0., 360., n)
+    dec = numpy.degrees(numpy.arcsin(rng.uniform(-1., 1., n)))
+    discoverers = rng.choice(sorted(observatory_names), n)
+    source_types = rng.choice(sorted(source_type_names), n)
+    years = rng.integers(1989, 2026, n)
+    months = rng.integers(1, 13, n)
+    sizes = numpy.where(rng.random(n) < 0.3, numpy.round(rng.uniform(0.05, 1., n), 2), 0.)
+    fluxes = numpy.round(rng.uniform(0.01, 1.5, n), 3)
+    choices = rng.integers(0, 1 << 30, n)
+
+    sources = []
+    for i in range(n):
+        h, m = divmod(ra[i]/15.*60., 60.)
+        sign = '-' if dec[i] < 0 else '+'
+        d, dm = divmod(abs(dec[i])*60., 60.)
+        c = int(choices[i])
+        discoverer = int(discoverers[i])
+        source_type = int(source_types[i])
+        sources.append({u'canonical_name':   u'Synthetic %d' % i,
+                        u'observatory_name': observatory_names[discoverer],
+                        u'discoverer':       discoverer,
+                        u'variability':      (None, 0, 1)[c%3],
+                        u'image':            u'',
+                        u'size_x':           float(sizes[i]) if sizes[i] > 0 else None,
+                        u'size_y':           float(sizes[i]) if sizes[i] > 0 and c%2 else None,
+                        u'owner':            1,
+                        u'id':               i + 1,
+                        u'discovery_date':   None if c%7 == 0 else u'%d/%02d' % (years[i], months[i]),
+                        u'other_names':      other_names[c%len(other_names)],
+                        u'marker_id':        None,
+                        u'public':           1,
+                        u'spec_idx':         None if c%5 == 0 else 2.5,
+                        u'private_notes':    None,
+                        u'catalog_name':     u'TeV J%02d%02d%s%03d' % (int(h), int(m), sign, int(abs(dec[i])*10)),
+                        u'greens_cat':       u'',
+                        u'source_type':      source_type,
+                        u'src_rank':         None,
+                        u'coord_type':       None,
+                        u'source_type_name': source_type_names[source_type],
+                        u'distance':         None if c%4 else 1.5,
+                        u'coord_ra':         u'%02d %02d %05.2f' % (int(h), int(m), min((m%1)*60., 59.99)),
+                        u'coord_dec':        u'%s%02d %02d %04.1f' % (sign, int(d), int(dm), min((dm%1)*60., 59.9)),
+                        u'notes':            None,
+                        u'distance_mod':     None if c%4 else (u'z', u'kpc')[c%8//4],
+                        u'flux':             None if c%6 == 0 else float(fluxes[i]),
+                        u'ext':              int(sizes[i] > 0),
+                        u'catalog_id':       1 + c%len(catalog_names),
+                        u'eth':              None if c%3 else 250.})
+
+    return sources
+
+def syntheticData(n, seed=0):
+    """
+    Returns the decoded JSON data (sources and catalogs) of a synthetic
+    catalog
+    """
+    catalogs = {}
+    for i, name in enumerate(catalog_names, 1):
+        catalogs[str(i)] = {u'id': i, u'name': name, u'description': name, u'role_id': -1, u'public': 1}
+
+    return {u'sources': syntheticSources(n, seed), u'catalogs': catalogs}
+
+def syntheticPage(version, data):
+    """
+    Returns a TeVCat HTML page (bytes) holding the data as the real page does
+    """
+    payload = base64.b64encode(json.dumps(data).encode('utf-8'))
+
+    return b'\n'.join([b'<html>',
+                       b'TeVCat Version ' + version.encode('utf-8'),
+                       b'<script>',
+                       b'var dat  = "' + payload + b'AAAA";',
+                       b'var pytevcat = %d;' % len(payload),
+                       b'</script>',
+                       b'</html>'])
+
+def measure(function, repeat=3, setup=None):
+    """
+    Calls `function` `repeat` times and returns the statistics of the wall
+    time in seconds. If `setup` is given, its return value is passed to
+    `function` and its own time is not counted.
+    """
+    times = []
+    for i in range(repeat):
+        args = () if setup == None else (setup(),)
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+
+    return {'best': min(times), 'median': float(numpy.median(times)), 'mean': float(numpy.mean(times)), 'repeat': repeat}
+
+def measureMemory(data):
+    """
+    Returns the memory (bytes per source) retained and peaked while building
+    a TeVCat from decoded JSON data, with the Galactic coordinates, the hmsdms
+    strings and the Source objects created. The JSON data are not counted.
+    """
+    n = max(len(data[u'sources']), 1)
+    TeVCat.from_data(u'benchmark', syntheticData(10)) # astropy caches
+
+    tracemalloc.start()
+    try:
+        tevcat = TeVCat.from_data(u'benchmark', data)
+        tevcat.getTable()['glon']
+        tevcat.getTable().getHMSDMS()
+        tevcat.getSources()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'best': current/float(n), 'peak': peak/float(n), 'repeat': 1, 'unit': 'bytes'}
+
+def measureImport(repeat=5):
+    """
+    Measures the time of `import tevcat` in fresh interpreters, and checks
+    that neither astropy nor ROOT are imported by it
+    """
+    code = ('import sys, time\n'
+            't = time.perf_counter()\n'
+            'import tevcat\n'
+            't = time.perf_counter() - t\n'
+            'print(t, "astropy" in sys.modules, "ROOT" in sys.modules)\n')
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    times = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=path).split()
+        times.append(float(output[0]))
+        heavy = [name for name, loaded in zip(('astropy', 'ROOT'), output[1:]) if loaded == b'True']
+
+    return {'best': min(times), 'median': float(numpy.median(times)), 'mean': float(numpy.mean(times)), 'repeat': repeat,
+            'heavy_modules': heavy}
+
+def benchmarkSize(n, repeat=3, seed=0, queries=1000, positions=10000):
+    """
+    Runs all the benchmarks on a synthetic catalog of `n` sources and returns
+    the list of the results
+    """
+    results = []
+    def record(name, stats, **extra):
+        stats = dict(stats, name=name, size=n, **extra)
+        stats.setdefault('unit', 's')
+        results.append(stats)
+        print('%-16s %8d %10.4f %s' % (name, n, stats['best'], stats['unit']), file=sys.stderr)
+
+    data = syntheticData(n, seed)
+    page = syntheticPage(u'benchmark', data)
+    record('parse_page', measure(lambda: parsePage(page), repeat), bytes=len(page))
+    del page
+
+    tevcat = TeVCat.from_data(u'benchmark', data)
+    record('build', measure(lambda: TeVCat.from_data(u'benchmark', data), repeat))
+    record('memory', measureMemory(data))
+    record('validate', measure(lambda: validation.validate(tevcat.getTable(), dict(observatory_names), dict(source_type_names)), repeat))
+
+    table = tevcat.getTable()
+    names = [name for name, kind in SourceTable.fields] + list(SourceTable.coordinates)
+    fresh = lambda: SourceTable.fromColumns(dict((name, table[name]) for name in names))
+    record('frames', measure(lambda t: t.precomputeFrames(['icrs', 'fk4', 'galactic']), repeat, fresh))
+    record('hmsdms', measure(lambda t: t.getHMSDMS(), repeat, fresh))
+
+    record('source_getters', measure(lambda: [(s.getCanonicalName(), s.getFlux(), s.getDistance()) for s in tevcat.getSources()], repeat))
+
+    rng = numpy.random.default_rng(seed + 1)
+    lon = rng.uniform(0., 360., queries)
+    lat = numpy.degrees(numpy.arcsin(rng.uniform(-1., 1., queries)))
+
+    def buildSpatialIndex():
+        tevcat.spatial_indices = {}
+        tevcat.getSpatialIndex('fk5')
+    record('spatial_index', measure(buildSpatialIndex, repeat))
+    record('cone_search', measure(lambda: [tevcat.cone_search((lon[i], lat[i]), 1.) for i in range(queries)], repeat), queries=queries)
+    record('nearest', measure(lambda: [tevcat.nearest((lon[i], lat[i]), 5) for i in range(queries)], repeat), queries=queries)
+
+    lon = rng.uniform(0., 360., positions)
+    lat = numpy.degrees(numpy.arcsin(rng.uniform(-1., 1., positions)))
+    record('crossmatch', measure(lambda: tevcat.crossmatch(lon, lat, 0.1), repeat), positions=positions)
+
+    def buildSearchIndex():
+        tevcat.search_index = None
+        tevcat.getSearchIndex()
+    record('search_index', measure(buildSearchIndex, repeat))
+    index = tevcat.getSearchIndex()
+    record('search', measure(lambda: index.cache.clear() or [index.search(q) for q in ('crab', 'tev j12', 'synthetic 42', 'pwn')], repeat), queries=4)
+    record('search_prefix', measure(lambda: index.cache.clear() or [index.search(q, True) for q in ('crab', 'tev j12', 'synth', 'h.e')], repeat), queries=4)
+
+    def query():
+        tevcat.bitmap_indices = {}
+        tevcat.query(source_type_name={'PWN', 'SNR'}, flux=(0.1, None), glat=(-5, 5))
+    record('query', measure(query, repeat))
+
+    glon, glat = table['glon'], table['glat']
+    record('projection', measure(lambda: aitoff_forward(glon, glat), repeat))
+    pixelVectors(1440, 720)
+    record('hit_map', measure(lambda: buildHitMap(glon, glat), repeat))
+
+    return results
+
+def getCommit():
+    """
+    Returns the git commit of the source tree, or None
+    """
+    try:
+        path = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=path, stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes=(1000, 10000, 100000), repeat=3, seed=0, import_repeat=5):
+    """
+    Runs the benchmarks at all the sizes and returns a JSON-serializable
+    dictionary of the results and the environment
+    """
+    results = []
+    for n in sizes:
+        results += benchmarkSize(n, repeat, seed)
+
+    return {'commit': getCommit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'import': measureImport(import_repeat),
+            'results': results}
+
+def compare(old, new):
+    """
+    Returns a list of (name, size, old best time, new best time, new/old) for
+    the benchmarks found in both results
+    """
+    old_times = dict(((r['name'], r['size']), r['best']) for r in old['results'])
+    rows = []
+    for r in new['results']:
+        key = (r['name'], r['size'])
+        if key in old_times:
+            rows.append((r['name'], r['size'], old_times[key], r['best'], r['best']/old_times[key]))
+    rows.append(('import', 0, old['import']['best'], new['import']['best'], new['import']['best']/old['import']['best']))
+
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tevcat.benchmark', description='Benchmarks PyTeVCat with synthetic catalogs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='numbers of sources (default: 1000 10000 100000)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per benchmark (the best is reported)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic catalogs')
+    parser.add_argument('--output', help='JSON file to write the results to (default: stdout)')
+    parser.add_argument('--import-budget', type=float, default=0.5, help='maximum time of "import tevcat" in seconds')
+    parser.add_argument('--memory-budget', type=float, default=640., help='maximum memory per source in bytes')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=1.2, help='new/old ratio reported as a regression by --compare')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = 0
+        for name, size, old_time, new_time, ratio in compare(old, new):
+            flag = ' <-- slower' if ratio > args.threshold else ''
+            regressions += flag != ''
+            print('%-16s %8d %10.4f %10.4f %6.2f%s' % (name, size, old_time, new_time, ratio, flag))
+        return 1 if regressions else 0
+
+    results = run(args.sizes, args.repeat, args.seed)
+    text = json.dumps(results, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    status = 0
+    if results['import']['best'] > args.import_budget:
+        print('import tevcat took %.3f s, over the budget of %.3f s' % (results['import']['best'], args.import_budget), file=sys.stderr)
+        status = 1
+    if results['import']['heavy_modules']:
+        print('import tevcat loaded %s' % ', '.join(results['import']['heavy_modules']), file=sys.stderr)
+        status = 1
+    for result in results['results']:
+        if result['name'] == 'memory' and result['best'] > args.memory_budget:
+            print('%d sources took %.0f bytes per source, over the budget of %.0f bytes' % (result['size'], result['best'], args.memory_budget), file=sys.stderr)
+            status = 1
+
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Pixel hit-map of the all-sky map for hover lookups
+
+A hit-map is an int32 array with one element per pixel of the all-sky map,
+holding the index of the nearest source within a given radius of the sky
+position at the pixel center, or -1. It is built once per selection of
+sources, after which finding the source under the mouse cursor is a single
+array read.
+"""
+import numpy
+
+from .projection import aitoff_forward, aitoff_inverse
+from .spatial import unitVectors
+
+# unit vectors of the pixel centers, keyed by (xsize, ysize)
+_pixel_vectors = {}
+
+def pixelVectors(xsize, ysize):
+    """
+    Returns the (ysize, xsize, 3) array of the unit vectors (Galactic) of
+    the pixel centers, NaN outside of the sky. Row 0 is the bottom of the map.
+    """
+    try:
+        return _pixel_vectors[(xsize, ysize)]
+    except KeyError:
+        x = (numpy.arange(xsize) + .5)/xsize
+        y = (numpy.arange(ysize) + .5)/ysize
+        l, b = aitoff_inverse(x[numpy.newaxis, :], y[:, numpy.newaxis])
+        vectors = unitVectors(l, b)
+        vectors.setflags(write=False)
+        _pixel_vectors[(xsize, ysize)] = vectors
+        return vectors
+
+def circlePoints(l, b, radius, n=32):
+    """
+    Returns (l, b) arrays of shape (len(l), n) of points on the circles of
+    `radius` (deg) around the positions. l is in [-180, 180).
+    """
+    l = numpy.radians(numpy.asarray(l, dtype=numpy.float64))[:, numpy.newaxis]
+    b = numpy.radians(numpy.asarray(b, dtype=numpy.float64))[:, numpy.newaxis]
+    r = numpy.radians(radius)
+    theta = numpy.linspace(0., 2.*numpy.pi, n, endpoint=False)[numpy.newaxis, :]
+
+    b2 = numpy.arcsin(numpy.clip(numpy.sin(b)*numpy.cos(r) + numpy.cos(b)*numpy.sin(r)*numpy.cos(theta), -1., 1.))
+    l2 = l + numpy.arctan2(numpy.sin(theta)*numpy.sin(r)*numpy.cos(b), numpy.cos(r) - numpy.sin(b)*numpy.sin(b2))
+
+    return (numpy.degrees(l2) + 180.)%360. - 180., numpy.degrees(b2)
+
+def buildHitMap(l, b, indices=None, radius=3., xsize=1440, ysize=720):
+    """
+    Returns the hit-map of the sources at Galactic (l, b) in degrees. Only
+    the sources in `indices` (all by default) are used, and the values of the
+    map are indices into `l` and `b`. Among sources at the same distance,
+    the first one wins. hitmap[py, px] is the source at the normalized pad
+    coordinates ((px + .5)/xsize, (py + .5)/ysize).
+    """
+    l = numpy.asarray(l, dtype=numpy.float64)
+    b = numpy.asarray(b, dtype=numpy.float64)
+    indices = numpy.arange(len(l)) if indices is None else numpy.asarray(indices, dtype=numpy.intp)
+
+    hitmap = numpy.full((ysize, xsize), -1, dtype=numpy.int32)
+    if len(indices) == 0:
+        return hitmap
+
+    vectors = pixelVectors(xsize, ysize)
+    best = numpy.full((ysize, xsize), numpy.cos(numpy.radians(radius)) - 1e-12)
+    sources = unitVectors(l[indices], b[indices])
+
+    # Bounding boxes in pixels of the circles around the sources
+    cl, cb = circlePoints(l[indices], b[indices], radius)
+    cx, cy = aitoff_forward(cl, cb)
+    cx *= xsize
+    cy *= ysize
+    x0 = numpy.floor(cx.min(axis=1)).astype(int) - 2
+    x1 = numpy.ceil(cx.max(axis=1)).astype(int) + 2
+    y0 = numpy.floor(cy.min(axis=1)).astype(int) - 2
+    y1 = numpy.ceil(cy.max(axis=1)).astype(int) + 2
+    # circles split by the l = 180 deg edge or around a pole span the whole rows
+    wrapped = (x1 - x0 > xsize/2) | (numpy.abs(b[indices]) + radius >= 90.)
+    x0[wrapped] = 0
+    x1[wrapped] = xsize
+    x0 = numpy.clip(x0, 0, xsize)
+    x1 = numpy.clip(x1, 0, xsize)
+    y0 = numpy.clip(y0, 0, ysize)
+    y1 = numpy.clip(y1, 0, ysize)
+
+    for k in range(len(indices)):
+        window = (slice(y0[k], y1[k]), slice(x0[k], x1[k]))
+        dot = vectors[window].dot(sources[k])
+        closer = dot > best[window]
+        best[window][closer] = dot[closer]
+        hitmap[window][closer] = indices[k]
+
+    return hitmap
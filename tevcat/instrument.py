@@ -0,0 +1,267 @@
+"""
+Timing of the loading stages and of the Viewer events
+
+Every timed stage produces a Span (name, start time, duration and attributes
+such as byte and object counts). The spans of one load are collected in
+LoadStats, which is kept as TeVCat.load_stats, and each span is also passed to
+the registered hooks. A hook is any callable taking a Span, e.g.
+
+    >>> tevcat.instrument.addHook(tevcat.instrument.LoggingHook())
+    >>> tevcat.instrument.addHook(tevcat.instrument.OpenTelemetryHook(tracer))
+"""
+import functools
+import logging
+import time
+
+# callables receiving every finished Span
+hooks = []
+
+def addHook(hook):
+    """
+    Registers a callable which receives every finished Span
+    """
+    if hook not in hooks:
+        hooks.append(hook)
+
+def removeHook(hook):
+    """
+    Unregisters a hook added by addHook()
+    """
+    if hook in hooks:
+        hooks.remove(hook)
+
+def emit(span):
+    """
+    Passes a finished Span to all the hooks. Errors in the hooks are logged
+    and never interrupt the loading or the GUI.
+    """
+    for hook in list(hooks):
+        try:
+            hook(span)
+        except Exception:
+            logging.getLogger(__name__).exception('Error in the instrumentation hook %r', hook)
+
+class Span(object):
+    """
+    One timed stage. `start` is the wall clock time (s since the epoch) and
+    `seconds` the elapsed time measured with a monotonic clock.
+    """
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.time()
+        self.seconds = None
+        self.t0 = time.perf_counter()
+
+    def set(self, **attributes):
+        """
+        Sets attributes such as 'bytes' or 'objects'
+        """
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.t0
+        emit(self)
+
+    def getEnd(self):
+        """
+        Returns the wall clock time at the end of the span
+        """
+        return self.start + (self.seconds or 0.)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type != None:
+            self.attributes['error'] = exc_type.__name__
+        self.finish()
+        return False
+
+    def __str__(self):
+        attributes = ''.join(' %s=%s' % item for item in sorted(self.attributes.items()))
+        return '%s %.6f s%s' % (self.name, self.seconds or 0., attributes)
+
+class LoadStats(object):
+    """
+    The spans of the stages of one load, in the order they were finished
+    """
+    def __init__(self, name='load'):
+        self.name = name
+        self.spans = []
+
+    def stage(self, name, **attributes):
+        """
+        Returns a Span to be used as a context manager, which is added to the
+        statistics when it is finished
+        """
+        span = Span(name, self.name, **attributes)
+        self.spans.append(span)
+
+        return span
+
+    def add(self, name, seconds, **attributes):
+        """
+        Adds a stage timed elsewhere, e.g. spread over an iterator
+        """
+        span = Span(name, self.name, **attributes)
+        span.start -= seconds
+        span.seconds = seconds
+        self.spans.append(span)
+        emit(span)
+
+        return span
+
+    def getStage(self, name):
+        """
+        Returns the last Span of the named stage, or None
+        """
+        for span in reversed(self.spans):
+            if span.name == name:
+                return span
+
+        return None
+
+    def getTotal(self):
+        """
+        Returns the sum of the stage times
+        """
+        return sum(span.seconds or 0. for span in self.spans)
+
+    def asDict(self):
+        """
+        Returns {stage name: {'seconds': ..., attributes...}}. Repeated stages
+        are summed.
+        """
+        stages = {}
+        for span in self.spans:
+            stage = stages.setdefault(span.name, {'seconds': 0.})
+            stage['seconds'] += span.seconds or 0.
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and key in stage:
+                    stage[key] += value
+                else:
+                    stage[key] = value
+
+        return stages
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __str__(self):
+        lines = [str(span) for span in self.spans]
+        lines.append('total %.6f s' % self.getTotal())
+
+        return '\n'.join(lines)
+
+class TimedIterator(object):
+    """
+    Wraps an iterator of bytes and measures the time spent waiting for it and
+    the number of bytes. Used to separate the network time from the scan of a
+    streamed page.
+    """
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.seconds = 0.
+        self.bytes = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            item = next(self.iterator)
+        finally:
+            self.seconds += time.perf_counter() - t0
+        self.bytes += len(item)
+
+        return item
+
+class EventStats(object):
+    """
+    Count, total, maximum and last time of each kind of GUI event
+    """
+    def __init__(self, slow=0.1):
+        """
+        Events longer than `slow` seconds are counted as slow frames.
+        """
+        self.slow = slow
+        self.events = {}
+
+    def add(self, name, seconds):
+        event = self.events.setdefault(name, {'count': 0, 'total': 0., 'max': 0., 'last': 0., 'slow': 0})
+        event['count'] += 1
+        event['total'] += seconds
+        event['max'] = max(event['max'], seconds)
+        event['last'] = seconds
+        if seconds > self.slow:
+            event['slow'] += 1
+
+    def asDict(self):
+        """
+        Returns {event name: {'count', 'total', 'mean', 'max', 'last', 'slow'}}
+        """
+        events = {}
+        for name, event in self.events.items():
+            events[name] = dict(event, mean=event['total']/event['count'])
+
+        return events
+
+    def __str__(self):
+        lines = []
+        for name, event in sorted(self.asDict().items()):
+            lines.append('%-16s %6d calls  mean %.4f s  max %.4f s  slow %d' % (name, event['count'], event['mean'], event['max'], event['slow']))
+
+        return '\n'.join(lines)
+
+def timed(name):
+    """
+    Decorator of the event handlers of a class with an `event_stats`
+    attribute (EventStats). Each call is added to it and emitted as a Span
+    named 'viewer.<name>'.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            span = Span('viewer.' + name, 'viewer')
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                span.seconds = time.perf_counter() - span.t0
+                self.event_stats.add(name, span.seconds)
+                emit(span)
+        return wrapper
+
+    return decorator
+
+class LoggingHook(object):
+    """
+    Hook writing every Span to a logger
+    """
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logging.getLogger('tevcat') if logger == None else logger
+        self.level = level
+
+    def __call__(self, span):
+        self.logger.log(self.level, '%s', span)
+
+class OpenTelemetryHook(object):
+    """
+    Hook exporting every Span to an OpenTelemetry tracer (or any object with
+    start_span(name, start_time=ns, attributes=dict) returning a span with
+    end(end_time=ns))
+    """
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    def __call__(self, span):
+        attributes = dict(span.attributes)
+        if span.parent != None:
+            attributes['tevcat.parent'] = span.parent
+        otel_span = self.tracer.start_span('tevcat.' + span.name, start_time=int(span.start*1e9), attributes=attributes)
+        otel_span.end(end_time=int(span.getEnd()*1e9))
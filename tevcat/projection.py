@@ -0,0 +1,71 @@
+"""
+Hammer-Aitoff projection of the all-sky images, vectorized with NumPy
+
+The bundled all-sky images (img/allsky_*.png) are 1440x720 pixel Aitoff maps
+in Galactic coordinates (CDELT1 = -0.25, CDELT2 = +0.25). Positions on the
+images are expressed in normalized pad coordinates (x, y) in [0, 1], with
+l = 0 at the center and l increasing to the left.
+"""
+import numpy
+
+# width of the projected ellipse in the normalized pad coordinates
+SCALE = 1.4142135623730951*2./numpy.pi
+
+def aitoff_forward(l, b):
+    """
+    Projects Galactic coordinates (l, b) in degrees into the normalized pad
+    coordinates (x, y). Scalars and arrays are accepted.
+    """
+    l = numpy.asarray(l, dtype=numpy.float64)
+    b = numpy.asarray(b, dtype=numpy.float64)
+    l = numpy.where(l > 180., l - 360.*numpy.ceil((l - 180.)/360.), l)
+
+    theta = numpy.radians(b)
+    phi = numpy.radians(l)
+    gamma = (1. + numpy.cos(theta)*numpy.cos(phi/2.))**-0.5
+    x_ = 2.*gamma*numpy.cos(theta)*numpy.sin(phi/2.)
+    y_ = gamma*numpy.sin(theta)
+
+    x = (-x_ + 2.)/4.*SCALE + (1. - SCALE)/2.
+    y = (y_ + 1.)/2.*SCALE + (1. - SCALE)/2.
+
+    return x, y
+
+def aitoff_inverse(x, y):
+    """
+    Converts the normalized pad coordinates (x, y) into Galactic coordinates
+    (l, b) in degrees. Positions outside of the projected ellipse are NaN.
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+
+    x_ = -((x - (1. - SCALE)/2.)/SCALE*4. - 2.)
+    y_ = (y - (1. - SCALE)/2.)*2./SCALE - 1.
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        gamma = (2. - (x_/2.)**2 - y_**2)**-0.5
+        theta = numpy.arcsin(y_/gamma)
+        phi = numpy.arcsin(x_/(2.*gamma*numpy.cos(theta)))*2.
+        outside = ~((numpy.abs(x_) <= 2.*numpy.cos(theta)) & (numpy.abs(y_) <= 1.))
+
+    l = numpy.where(outside, numpy.nan, numpy.degrees(phi))
+    b = numpy.where(outside, numpy.nan, numpy.degrees(theta))
+
+    return l, b
+
+def grid_lines(l_step=30, b_step=30, resolution=2):
+    """
+    Returns the list of (x, y) arrays of the coordinate grid lines: meridians
+    every `l_step` degrees and parallels every `b_step` degrees (except the
+    poles), sampled every `resolution` degrees.
+    """
+    lines = []
+    b = numpy.arange(-90, 91, resolution, dtype=numpy.float64)
+    for l in range(-180, 181, l_step):
+        lines.append(aitoff_forward(numpy.full_like(b, l), b))
+
+    l = numpy.arange(-180, 181, resolution, dtype=numpy.float64)
+    for b in range(-90 + b_step, 90, b_step):
+        lines.append(aitoff_forward(l, numpy.full_like(l, b)))
+
+    return lines
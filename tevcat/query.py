@@ -0,0 +1,222 @@
+"""
+Vectorized queries over the source table with bitmap indices of the
+categorical fields
+"""
+import numpy
+
+# fields whose bitmap index is built on first use
+categorical_fields = ('source_type', 'source_type_name', 'catalog_id', 'discoverer', 'observatory_name', 'variability', 'ext')
+
+def categoryKey(value):
+    """
+    Returns the hashable key of a categorical value (NaN and None are None)
+    """
+    if value is None:
+        return None
+    elif isinstance(value, (float, numpy.floating)):
+        return None if numpy.isnan(value) else int(value)
+    elif isinstance(value, (bool, numpy.bool_)):
+        return bool(value)
+    elif isinstance(value, (int, numpy.integer)):
+        return int(value)
+    else:
+        return value
+
+class BitmapIndex(object):
+    """
+    One boolean array per distinct value of a column
+    """
+    def __init__(self, column):
+        """
+        Builds the bitmaps of a column
+        """
+        self.size = len(column)
+        groups = {}
+        for i, value in enumerate(column):
+            groups.setdefault(categoryKey(value), []).append(i)
+
+        self.bitmaps = {}
+        for key, indices in groups.items():
+            bitmap = numpy.zeros(self.size, dtype=bool)
+            bitmap[indices] = True
+            self.bitmaps[key] = bitmap
+
+    @classmethod
+    def fromCodes(cls, codes, categories):
+        """
+        Builds the bitmaps from the integer codes of a categorical column
+        (see SourceTable.getCodes)
+        """
+        index = cls.__new__(cls)
+        index.size = len(codes)
+        index.bitmaps = {}
+        for code, value in enumerate(categories):
+            index.bitmaps[categoryKey(value)] = codes == code
+
+        return index
+
+    def keys(self):
+        """
+        Returns the list of the distinct values.
+        """
+        return list(self.bitmaps.keys())
+
+    def getMask(self, values):
+        """
+        Returns the boolean array of the rows equal to one of the values.
+        """
+        mask = numpy.zeros(self.size, dtype=bool)
+        for value in values:
+            bitmap = self.bitmaps.get(categoryKey(value))
+            if bitmap is not None:
+                mask |= bitmap
+
+        return mask
+
+def isRange(value):
+    """
+    Returns True if a predicate value is a (min, max) range
+    """
+    return isinstance(value, tuple) and len(value) == 2
+
+def isSet(value):
+    """
+    Returns True if a predicate value is a set of allowed values
+    """
+    return isinstance(value, (set, frozenset, list, numpy.ndarray))
+
+def union(arrays):
+    """
+    Returns the sorted union of index arrays
+    """
+    if len(arrays) == 0:
+        return numpy.zeros(0, dtype=numpy.intp)
+    elif len(arrays) == 1:
+        return arrays[0]
+
+    return numpy.unique(numpy.concatenate(arrays))
+
+def intersection(arrays):
+    """
+    Returns the sorted intersection of sorted unique index arrays, starting
+    from the shortest one
+    """
+    arrays = sorted(arrays, key=len)
+    indices = arrays[0]
+    for array in arrays[1:]:
+        if len(indices) == 0:
+            break
+        indices = numpy.intersect1d(indices, array, assume_unique=True)
+
+    return indices
+
+def evaluate(tevcat, mask=None, **predicates):
+    """
+    Returns the boolean array of the sources satisfying all the predicates
+    (see TeVCat.query). If `mask` is given, only the sources in it are
+    considered.
+    """
+    table = tevcat.getTable()
+    mask = numpy.ones(len(table), dtype=bool) if mask is None else mask.copy()
+
+    # Translate the derived predicates into column predicates
+    if 'catalog' in predicates:
+        names = predicates.pop('catalog')
+        names = set(names) if isSet(names) else set([names])
+        ids = [i for i, catalog in tevcat.catalogs.items() if catalog.getName() in names]
+        predicates['catalog_id'] = ids
+    if 'discovered' in predicates:
+        start, end = predicates.pop('discovered')
+        predicates['discovery_date'] = (None if start is None else start*100 + 1,
+                                        None if end is None else end*100 + 12)
+    search = predicates.pop('search', None)
+    if search is not None:
+        mask &= tevcat.search(search, mask=True)
+
+    for name in predicates:
+        if name not in table:
+            raise ValueError('Unknown query field: %s' % name)
+
+    # Categorical predicates are answered by the bitmap indices first
+    ranges = []
+    for name, value in predicates.items():
+        if name in categorical_fields and not isRange(value):
+            values = value if isSet(value) else [value]
+            mask &= tevcat.getBitmapIndex(name).getMask(values)
+        else:
+            ranges.append((name, value))
+
+    # The other predicates are evaluated only on the remaining rows
+    for name, value in ranges:
+        indices = numpy.nonzero(mask)[0]
+        if len(indices) == 0:
+            break
+
+        column = table[name][indices]
+        if isRange(value):
+            low, high = value
+            keep = numpy.ones(len(indices), dtype=bool)
+            if low is not None:
+                keep &= column >= low
+            if high is not None:
+                keep &= column <= high
+        elif isSet(value):
+            keep = numpy.isin(column, list(value))
+        elif callable(value):
+            keep = numpy.asarray(value(column), dtype=bool)
+        else:
+            keep = column == value
+        mask[indices[~keep]] = False
+
+    return mask
+
+class QueryResult(object):
+    """
+    Sources selected by TeVCat.query(). The indices and the Source objects are
+    created only when they are requested.
+    """
+    def __init__(self, tevcat, mask):
+        self.tevcat = tevcat
+        self.mask = mask
+        self.indices = None
+
+    def getMask(self):
+        """
+        Returns the boolean array of the selected sources.
+        """
+        return self.mask
+
+    def getIndices(self):
+        """
+        Returns the indices of the selected sources.
+        """
+        if self.indices is None:
+            self.indices = numpy.nonzero(self.mask)[0]
+
+        return self.indices
+
+    def getSources(self):
+        """
+        Returns the list of the selected sources.
+        """
+        return self.tevcat.getSourcesByIndex(self.getIndices())
+
+    def query(self, **predicates):
+        """
+        Returns the subset satisfying more predicates.
+        """
+        return QueryResult(self.tevcat, evaluate(self.tevcat, self.mask, **predicates))
+
+    def __getitem__(self, name):
+        """
+        Returns the values of a column for the selected sources.
+        """
+        return self.tevcat.getTable()[name][self.getIndices()]
+
+    def __len__(self):
+        return int(numpy.count_nonzero(self.mask))
+
+    def __iter__(self):
+        sources = self.tevcat.getSources()
+        for i in self.getIndices():
+            yield sources[i]
@@ -0,0 +1,126 @@
+"""
+Periodic refresh of the database in the background for long-running services
+"""
+import threading
+import time
+
+from .tevcat_all import TeVCat
+
+class AutoRefresher(object):
+    """
+    Keeps an up-to-date TeVCat snapshot. A refresh is done on a copy of the
+    current snapshot, which is then published by replacing a single
+    reference, so readers calling get() never take a lock and always see a
+    consistent version. Published snapshots must not be refreshed directly.
+    """
+    def __init__(self, tevcat=None, interval=3600., on_change=None, **kwargs):
+        """
+        Starts from `tevcat`, or a new TeVCat(**kwargs). The snapshot is
+        refreshed every `interval` seconds once start() is called, and
+        `on_change(tevcat, changes)` is called when a new version with changes
+        is published.
+        """
+        self.snapshot = TeVCat(**kwargs) if tevcat == None else tevcat
+        self.interval = interval
+        self.on_change = on_change
+
+        self.lock = threading.Lock() # serializes refreshes, not readers
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.refresh_count = 0
+        self.error_count = 0
+        self.last_error = None
+        self.last_duration = None
+        self.last_success = time.time()
+        self.last_changes = None
+
+    def get(self):
+        """
+        Returns the current snapshot.
+        """
+        return self.snapshot
+
+    def refreshOnce(self):
+        """
+        Refreshes a copy of the snapshot and publishes it. Returns the
+        ChangeSet, or None if the refresh failed.
+        """
+        with self.lock:
+            start = time.time()
+            try:
+                tevcat = self.snapshot.copy()
+                changes = tevcat.refresh()
+            except Exception as e:
+                self.error_count += 1
+                self.last_error = e
+                self.last_duration = time.time() - start
+                return None
+
+            if changes:
+                self.snapshot = tevcat
+            self.refresh_count += 1
+            self.last_duration = time.time() - start
+            self.last_success = time.time()
+            self.last_changes = changes
+
+        if changes and self.on_change != None:
+            self.on_change(tevcat, changes)
+
+        return changes
+
+    def run(self):
+        """
+        Refreshes the snapshot every `interval` seconds until stop() is called
+        """
+        while not self.stop_event.wait(self.interval):
+            self.refreshOnce()
+
+    def start(self):
+        """
+        Starts refreshing in a daemon thread.
+        """
+        if self.thread != None and self.thread.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='tevcat-refresher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the background thread.
+        """
+        self.stop_event.set()
+        if self.thread != None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    async def run_async(self):
+        """
+        Coroutine which refreshes the snapshot every `interval` seconds, to be
+        run as an asyncio task. The blocking refresh runs in a worker thread.
+        """
+        import asyncio
+
+        while not self.stop_event.is_set():
+            await asyncio.sleep(self.interval)
+            await asyncio.get_running_loop().run_in_executor(None, self.refreshOnce)
+
+    def getStaleness(self):
+        """
+        Returns the seconds since the last successful refresh (or creation).
+        """
+        return time.time() - self.last_success
+
+    def getMetrics(self):
+        """
+        Returns a dictionary of the refresh metrics.
+        """
+        return {'version': self.snapshot.version,
+                'refresh_count': self.refresh_count,
+                'error_count': self.error_count,
+                'last_error': None if self.last_error == None else repr(self.last_error),
+                'last_refresh_duration': self.last_duration,
+                'staleness': self.getStaleness()}
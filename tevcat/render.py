@@ -0,0 +1,235 @@
+"""
+Headless all-sky maps of TeVCat sources without ROOT
+
+The maps look like the Viewer: one of the bundled all-sky images, the dashed
+Galactic coordinate grid, the source markers per source type, the name labels
+and a legend. Images are composited with NumPy and Pillow, which is needed
+only by this module and is installed by the 'render' extra
+(pip install pytevcat[render]).
+"""
+import numpy
+
+from .projection import aitoff_forward, grid_lines
+
+# background images and grid colors, keyed by the colormap ID of the Viewer
+backgrounds = {0: ('img/allsky_b.png',        (255, 255, 255)),
+               1: ('img/allsky_gray.png',     (255, 255, 255)),
+               2: ('img/allsky_gray_inv.png', (0, 0, 0))}
+
+# RGB of the ROOT colors used for the markers
+root_colors = {0:  (255, 255, 255),
+               1:  (0, 0, 0),
+               2:  (255, 0, 0),
+               3:  (0, 255, 0),
+               4:  (0, 0, 255),
+               5:  (255, 255, 0),
+               6:  (255, 0, 255),
+               7:  (0, 255, 255),
+               8:  (89, 212, 84),
+               9:  (89, 84, 217),
+               10: (254, 254, 254),
+               11: (192, 182, 172),
+               12: (76, 76, 76)}
+
+xsize = 1440
+ysize = 720
+
+# decoded background images of this process, shared by all the jobs
+_background_cache = {}
+
+def markerStyles(source_type_names):
+    """
+    Returns {source type name: (ROOT color, ROOT marker style)} assigned in
+    the order of first appearance, as in the Viewer
+    """
+    styles = {}
+    for source_type_name in source_type_names:
+        if source_type_name not in styles:
+            i = len(styles)
+            styles[source_type_name] = (int(i/4) + 2, 20 + i%10)
+
+    return styles
+
+def importPillow():
+    """
+    Returns the PIL package with PIL.Image and PIL.ImageDraw imported.
+    ImportError is raised with the name of the extra to install if Pillow is
+    missing.
+    """
+    try:
+        import PIL.Image
+        import PIL.ImageDraw
+    except ImportError as e:
+        raise ImportError('Pillow is needed to draw the maps and the tiles. '
+                          'Install it with pip install pytevcat[render] (%s)' % e)
+
+    return PIL
+
+def getBackground(colormap):
+    """
+    Returns the decoded background image (RGB uint8 array) of the colormap,
+    or a white image if `colormap` is None
+    """
+    try:
+        return _background_cache[colormap]
+    except KeyError:
+        pass
+
+    if colormap == None:
+        image = numpy.full((ysize, xsize, 3), 255, dtype=numpy.uint8)
+    else:
+        from .tevcat_all import getResourcePath
+
+        Image = importPillow().Image
+
+        image = Image.open(getResourcePath(backgrounds[colormap][0])).convert('RGB')
+        image = numpy.asarray(image.resize((xsize, ysize)) if image.size != (xsize, ysize) else image)
+    image.setflags(write=False)
+    _background_cache[colormap] = image
+
+    return image
+
+def drawMarker(draw, x, y, style, color, size=5):
+    """
+    Draws a marker resembling a ROOT marker style at (x, y) in pixels
+    """
+    filled = style in (20, 21, 22, 23, 29)
+    shape = {20: 'circle', 21: 'square', 22: 'up', 23: 'down', 24: 'circle', 25: 'square',
+             26: 'up', 27: 'diamond', 28: 'cross', 29: 'star'}.get(style, 'circle')
+    fill = color if filled else None
+    r = size
+
+    if shape == 'circle':
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=fill, outline=color)
+    elif shape == 'square':
+        draw.rectangle((x - r, y - r, x + r, y + r), fill=fill, outline=color)
+    elif shape == 'up':
+        draw.polygon(((x, y - r), (x - r, y + r), (x + r, y + r)), fill=fill, outline=color)
+    elif shape == 'down':
+        draw.polygon(((x, y + r), (x - r, y - r), (x + r, y - r)), fill=fill, outline=color)
+    elif shape == 'diamond':
+        draw.polygon(((x, y - r), (x + r, y), (x, y + r), (x - r, y)), fill=fill, outline=color)
+    elif shape == 'cross':
+        draw.line((x - r, y, x + r, y), fill=color, width=2)
+        draw.line((x, y - r, x, y + r), fill=color, width=2)
+    else:
+        angles = numpy.radians(numpy.arange(10)*36. - 90.)
+        radii = numpy.where(numpy.arange(10)%2 == 0, r*1.3, r*0.55)
+        draw.polygon(list(zip(x + radii*numpy.cos(angles), y + radii*numpy.sin(angles))), fill=fill, outline=color)
+
+class RenderData(object):
+    """
+    Everything needed to render the maps of a catalog: projected positions,
+    names and marker styles. It is small and cheap to send to worker
+    processes, unlike TeVCat itself.
+    """
+    def __init__(self, tevcat):
+        table = tevcat.getTable()
+        x, y = aitoff_forward(table['glon'], table['glat'])
+        self.x = x*xsize
+        self.y = (1. - y)*ysize
+        self.names = [str(name) for name in table['canonical_name']]
+        self.type_names = [str(name) for name in table['source_type_name']]
+        self.styles = markerStyles(self.type_names)
+        self.version = tevcat.version
+
+    def __len__(self):
+        return len(self.names)
+
+    def render(self, mask=None, colormap=0, labels=False, title=None):
+        """
+        Returns a PIL image of the sources selected by `mask`
+        """
+        PIL = importPillow()
+        Image, ImageDraw = PIL.Image, PIL.ImageDraw
+
+        mask = numpy.ones(len(self), dtype=bool) if mask is None else numpy.asarray(mask, dtype=bool)
+        grid_color = (0, 0, 0) if colormap == None else backgrounds[colormap][1]
+        text_color = (0, 0, 0) # the legend and the title are outside of the sky
+
+        image = Image.fromarray(getBackground(colormap))
+        draw = ImageDraw.Draw(image)
+
+        # Draw coordinate grids (dashed)
+        for x, y in grid_lines():
+            points = numpy.stack((x*xsize, (1. - y)*ysize), axis=-1)
+            for i in range(0, len(points) - 1, 2):
+                draw.line((tuple(points[i]), tuple(points[i + 1])), fill=grid_color)
+
+        # Draw sources
+        indices = numpy.nonzero(mask)[0]
+        drawn = []
+        for i in indices:
+            color, style = self.styles[self.type_names[i]]
+            drawMarker(draw, self.x[i], self.y[i], style, root_colors.get(color, (0, 0, 0)))
+            if self.type_names[i] not in drawn:
+                drawn.append(self.type_names[i])
+
+        # Draw source Names
+        if labels:
+            for i in indices:
+                draw.text((self.x[i] + 6, self.y[i] - 12), self.names[i], fill=grid_color)
+
+        # Draw legend
+        rows = (len(drawn) + 1)//2
+        for k, type_name in enumerate([name for name in self.styles if name in drawn]):
+            lx = 12 + (k%2)*160
+            ly = ysize - 14*rows - 8 + (k//2)*14
+            color, style = self.styles[type_name]
+            drawMarker(draw, lx, ly + 6, style, root_colors.get(color, (0, 0, 0)), 4)
+            draw.text((lx + 10, ly), type_name, fill=text_color)
+
+        draw.text((xsize - 140, ysize - 20), 'TeVCat Ver. %s' % self.version, fill=text_color)
+        if title != None:
+            draw.text((12, 10), title, fill=text_color)
+
+        return image
+
+def render(tevcat, mask=None, colormap=0, labels=False, title=None):
+    """
+    Returns a PIL image of the all-sky map of the sources selected by `mask`
+    (a boolean array or a QueryResult). `colormap` is 0 (color), 1 (gray
+    scale), 2 (inverted gray scale) or None (no background image).
+    """
+    if hasattr(mask, 'getMask'):
+        mask = mask.getMask()
+
+    return RenderData(tevcat).render(mask, colormap, labels, title)
+
+_worker_data = None
+
+def _initWorker(data):
+    global _worker_data
+    _worker_data = data
+
+def _renderJob(job):
+    _worker_data.render(job['mask'], job.get('colormap', 0), job.get('labels', False), job.get('title')).save(job['path'])
+    return job['path']
+
+def renderBatch(tevcat, jobs, processes=None):
+    """
+    Renders and saves many maps. Each job is a dictionary with 'path' and
+    optionally 'query' (predicates of TeVCat.query), 'search' (a search
+    string), 'colormap', 'labels' and 'title'. The jobs are distributed over
+    `processes` worker processes, each of which receives the catalog data and
+    decodes each background image only once. Returns the list of the paths.
+    """
+    data = RenderData(tevcat)
+
+    tasks = []
+    for job in jobs:
+        task = dict(job)
+        predicates = dict(task.pop('query', {}))
+        if 'search' in task:
+            predicates['search'] = task.pop('search')
+        task['mask'] = tevcat.query(**predicates).getMask()
+        tasks.append(task)
+
+    if processes == None or processes <= 1:
+        _initWorker(data)
+        return [_renderJob(task) for task in tasks]
+
+    import concurrent.futures
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=_initWorker, initargs=(data,)) as executor:
+        return list(executor.map(_renderJob, tasks))
@@ -0,0 +1,98 @@
+"""
+Full-text search index over the source names
+"""
+import bisect
+import re
+
+import numpy
+
+class SearchIndex(object):
+    """
+    Lowercase search text of every source and an inverted trigram index over
+    it. Substring queries are answered by intersecting the posting lists of
+    the trigrams of the query and verifying the candidates. Prefix queries
+    use a sorted list of the fields and the words in the search text.
+    """
+    fields = ('canonical_name', 'other_names', 'catalog_name', 'source_type_name', 'observatory_name')
+    ngram = 3
+    cache_size = 64
+
+    def __init__(self, table):
+        """
+        Builds the index from the columns of a SourceTable
+        """
+        n = len(table)
+        texts = []
+        for i in range(n):
+            values = [table[field][i] for field in self.fields]
+            texts.append(u'\n'.join(u'' if value == None else str(value) for value in values).lower())
+        self.texts = texts
+
+        postings = {}
+        words = set()
+        for i, text in enumerate(texts):
+            for gram in set(text[j:j + self.ngram] for j in range(len(text) - self.ngram + 1)):
+                postings.setdefault(gram, []).append(i)
+            # prefix queries match the start of a field or of a word
+            for field in text.split(u'\n'):
+                for word in [field] + re.split(u'[\\s,;]+', field):
+                    if word:
+                        words.add((word, i))
+
+        self.postings = dict((gram, numpy.array(indices, dtype=numpy.intp)) for gram, indices in postings.items())
+        words = sorted(words)
+        self.words = [word for word, i in words]
+        self.word_sources = numpy.array([i for word, i in words], dtype=numpy.intp)
+
+        self.size = n
+        self.cache = {}
+
+    def __len__(self):
+        return self.size
+
+    def search(self, query, prefix=False):
+        """
+        Returns the sorted indices of the sources whose search text contains
+        `query` (case insensitive). If `prefix` is True, only the words which
+        start with `query` are matched. An empty query matches all sources.
+        """
+        query = query.lower()
+        key = (query, prefix)
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+
+        if query == u'':
+            indices = numpy.arange(self.size)
+        elif prefix:
+            lo = bisect.bisect_left(self.words, query)
+            hi = bisect.bisect_left(self.words, query + u'\U0010ffff')
+            indices = numpy.unique(self.word_sources[lo:hi])
+        elif len(query) < self.ngram:
+            indices = numpy.array([i for i, text in enumerate(self.texts) if query in text], dtype=numpy.intp)
+        else:
+            candidates = None
+            for gram in set(query[j:j + self.ngram] for j in range(len(query) - self.ngram + 1)):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    candidates = numpy.zeros(0, dtype=numpy.intp)
+                    break
+                candidates = posting if candidates is None else numpy.intersect1d(candidates, posting, assume_unique=True)
+            indices = numpy.array([i for i in candidates if query in self.texts[i]], dtype=numpy.intp)
+
+        indices.setflags(write=False)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[key] = indices
+
+        return indices
+
+    def mask(self, query, prefix=False):
+        """
+        Returns a boolean array which is True for the matched sources.
+        """
+        mask = numpy.zeros(self.size, dtype=bool)
+        mask[self.search(query, prefix)] = True
+
+        return mask
@@ -0,0 +1,472 @@
+"""
+HTTP query service of the catalog
+
+The catalog is loaded once, from the cache or from a local snapshot, and its
+spatial and full-text indices are built before the server starts listening.
+All the endpoints take GET requests and return JSON:
+
+  /                       version and number of sources
+  /sources/<id>           one source (Source.asDict())
+  /sources?id=1&id=2      several sources
+  /cone?ra=83.6&dec=22.0&radius=1[&frame=fk5|icrs|galactic]
+                          sources within `radius` deg, sorted by separation
+                          (lon/lat or l/b may be used instead of ra/dec)
+  /nearest?ra=..&dec=..[&k=1][&frame=..]
+                          the k nearest sources
+  /search?q=crab[&prefix=1]
+                          full-text search (TeVCat.search)
+  /query?source_type_name=PWN&source_type_name=SNR&flux=0.1:&catalog=Default+Catalog
+                          TeVCat.query(); a repeated field is a set of
+                          values and 'min:max' is a range (either may be
+                          omitted)
+
+The lists of sources accept `limit` and `offset`. Responses are cached by URL
+for the current version of the catalog. The server runs on asyncio with the
+standard library only. Cached responses are sent from the event loop, while
+the other requests, and the indexing of a catalog replaced by a refresh, are
+handled in a worker thread so that the other connections are not blocked,
+e.g.
+
+    $ python -m tevcat serve --snapshot tevcat_snapshot.fits --port 8080
+"""
+import asyncio
+import collections
+import concurrent.futures
+import json
+import threading
+import time
+import urllib.parse
+
+from .tevcat_all import TeVCat
+
+reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+numeric_kinds = ('int', 'optint', 'float')
+
+class HTTPError(Exception):
+    """
+    Raised by the handlers to return an error response
+    """
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+def loadTeVCat(snapshot=None, cache_dir=None, offline=False, validation='warn'):
+    """
+    Loads the catalog from a snapshot file (.json, .fits, .arrow, .feather or
+    .parquet), or from the cache and TeVCat. No network access is made if a
+    snapshot is given or `offline` is True.
+    """
+    if snapshot == None:
+        return TeVCat(cache_dir=cache_dir, offline=offline, validation=validation)
+
+    extension = snapshot.lower().rsplit('.', 1)[-1]
+    if extension in ('fits', 'fit'):
+        return TeVCat.from_fits(snapshot, validation)
+    elif extension in ('arrow', 'feather'):
+        return TeVCat.from_arrow(snapshot, validation)
+    elif extension == 'parquet':
+        return TeVCat.from_parquet(snapshot, validation)
+    else:
+        return TeVCat.from_file(snapshot, validation)
+
+class QueryService(object):
+    """
+    Answers the requests from the indices of one catalog. The catalog may be
+    replaced, e.g. by an AutoRefresher, and the cached responses of older
+    versions are then discarded. getCached() may be called from any thread,
+    but respond() must be called from one thread at a time.
+    """
+    def __init__(self, tevcat=None, refresher=None, cache_size=1024, frames=('fk5', 'icrs', 'galactic')):
+        """
+        Serves `tevcat`, or the current snapshot of `refresher`. Up to
+        `cache_size` responses are cached, and the spatial indices of `frames`
+        are built in advance.
+        """
+        self.tevcat = tevcat
+        self.refresher = refresher
+        self.cache_size = cache_size
+        self.frames = frames
+        self.cache = collections.OrderedDict() # (path, query) -> (status, body)
+        self.cache_lock = threading.Lock()
+        self.cached_tevcat = None
+        self.records = {} # index -> Source.asDict()
+        self.ids = None # source ID -> index
+        self.hits = 0
+        self.misses = 0
+
+        self.prepare(self.getTeVCat())
+
+    def getTeVCat(self):
+        """
+        Returns the catalog to be served now
+        """
+        return self.tevcat if self.refresher == None else self.refresher.get()
+
+    def prepare(self, tevcat):
+        """
+        Builds the indices of a catalog, and forgets those of the previous one
+        """
+        for frame in self.frames:
+            tevcat.getSpatialIndex(frame)
+        tevcat.getSearchIndex()
+        tevcat.getTable().getHMSDMS()
+        ids = dict((int(source_id), i) for i, source_id in enumerate(tevcat.getTable()['id']))
+
+        with self.cache_lock:
+            self.cache.clear()
+            self.records = {}
+            self.ids = ids
+            self.cached_tevcat = tevcat
+
+    def getKey(self, target):
+        """
+        Returns (path, params, key) of a request target, where `key` is the
+        key of the response in the cache
+        """
+        url = urllib.parse.urlsplit(target)
+        path = url.path.rstrip('/') or '/'
+        params = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+
+        return path, params, (path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+
+    def getCached(self, target):
+        """
+        Returns the cached (status, body) of a request target, or None if it
+        has to be computed by respond()
+        """
+        key = self.getKey(target)[2]
+        with self.cache_lock:
+            if self.getTeVCat() is not self.cached_tevcat:
+                return None
+            try:
+                response = self.cache[key]
+            except KeyError:
+                return None
+            self.cache.move_to_end(key)
+            self.hits += 1
+
+        return response
+
+    def respond(self, target):
+        """
+        Returns (status, body) of the response to a request target such as
+        '/cone?ra=83.6&dec=22&radius=1'. The body is encoded JSON.
+        """
+        tevcat = self.getTeVCat()
+        if tevcat is not self.cached_tevcat:
+            self.prepare(tevcat)
+
+        path, params, key = self.getKey(target)
+        response = self.getCached(target)
+        if response != None:
+            return response
+        self.misses += 1
+
+        try:
+            response = (200, self.encode(self.dispatch(tevcat, path, params)))
+        except HTTPError as e:
+            return e.status, self.encode({'error': str(e)})
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, self.encode({'error': str(e)})
+
+        with self.cache_lock:
+            # not cached if the catalog was replaced in the meantime
+            if tevcat is self.cached_tevcat:
+                self.cache[key] = response
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        return response
+
+    def encode(self, value):
+        return json.dumps(value).encode('utf-8')
+
+    def dispatch(self, tevcat, path, params):
+        """
+        Returns the JSON value of the response
+        """
+        if path == '/':
+            return {'version': tevcat.version, 'sources': len(tevcat.getTable()),
+                    'catalogs': [catalog.getName() for catalog in tevcat.catalogs.values()]}
+        elif path == '/sources':
+            indices = [self.getIndexByID(source_id) for source_id in getList(params, 'id')]
+            return self.listing(tevcat, indices, params)
+        elif path.startswith('/sources/'):
+            return self.getRecord(tevcat, self.getIndexByID(path[len('/sources/'):]))
+        elif path == '/cone':
+            frame, lon, lat = getPosition(params)
+            radius = getFloat(params, 'radius')
+            indices, separation = tevcat.getSpatialIndex(frame).coneSearch(lon, lat, radius)
+            return self.listing(tevcat, indices, params, separation)
+        elif path == '/nearest':
+            frame, lon, lat = getPosition(params)
+            k = getInt(params, 'k', 1)
+            indices, separation = tevcat.getSpatialIndex(frame).nearest(lon, lat, k)
+            return self.listing(tevcat, indices, params, separation)
+        elif path == '/search':
+            prefix = getString(params, 'prefix', '0').lower() in ('1', 'true', 'yes')
+            return self.listing(tevcat, tevcat.search(getString(params, 'q'), prefix), params)
+        elif path == '/query':
+            predicates = getPredicates(tevcat, params)
+            return self.listing(tevcat, tevcat.query(**predicates).getIndices(), params)
+        else:
+            raise HTTPError(404, 'Unknown path: %s' % path)
+
+    def getIndexByID(self, source_id):
+        try:
+            return self.ids[int(source_id)]
+        except (KeyError, ValueError):
+            raise HTTPError(404, 'No source with ID %s' % source_id)
+
+    def getRecord(self, tevcat, i):
+        """
+        Returns Source.asDict() of the i-th source, which is computed only
+        once per catalog
+        """
+        try:
+            return self.records[i]
+        except KeyError:
+            record = self.records[i] = tevcat.getSources()[i].asDict()
+            return record
+
+    def listing(self, tevcat, indices, params, separation=None):
+        """
+        Returns {'count': ..., 'sources': [...]} of the sources at `indices`,
+        limited by the `offset` and `limit` parameters
+        """
+        offset = getInt(params, 'offset', 0)
+        limit = getInt(params, 'limit', len(indices))
+        if offset < 0 or limit < 0:
+            raise ValueError('offset and limit must not be negative')
+
+        sources = []
+        for j in range(offset, min(offset + limit, len(indices))):
+            record = self.getRecord(tevcat, int(indices[j]))
+            if separation is not None:
+                record = dict(record, separation=float(separation[j]))
+            sources.append(record)
+
+        return {'count': len(indices), 'offset': offset, 'sources': sources}
+
+def getList(params, name):
+    return params.get(name, [])
+
+def getString(params, name, default=None):
+    values = params.get(name)
+    if not values:
+        if default == None:
+            raise ValueError('Missing parameter: %s' % name)
+        return default
+
+    return values[-1]
+
+def getFloat(params, name, default=None):
+    value = getString(params, name, None if default == None else str(default))
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError('Parameter %s must be a number: %s' % (name, value))
+
+def getInt(params, name, default=None):
+    value = getString(params, name, None if default == None else str(default))
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Parameter %s must be an integer: %s' % (name, value))
+
+def getPosition(params):
+    """
+    Returns (frame, lon, lat) of the ra/dec, l/b or lon/lat parameters
+    """
+    frame = getString(params, 'frame', 'galactic' if 'l' in params else 'fk5').lower()
+    if frame not in ('fk5', 'icrs', 'galactic'):
+        raise ValueError('Unknown frame: %s' % frame)
+
+    for lon, lat in (('ra', 'dec'), ('l', 'b'), ('lon', 'lat')):
+        if lon in params:
+            return frame, getFloat(params, lon), getFloat(params, lat)
+
+    raise ValueError('Missing parameter: ra/dec, l/b or lon/lat')
+
+def parseValue(kind, text):
+    """
+    Converts a query string value to the type of a column
+    """
+    if kind in numeric_kinds:
+        return float(text)
+    elif kind == 'bool':
+        return text.lower() in ('1', 'true', 'yes')
+    else:
+        return text
+
+def getPredicates(tevcat, params):
+    """
+    Returns the keyword arguments of TeVCat.query() from the query string
+    """
+    table = tevcat.getTable()
+    predicates = {}
+    for name, values in params.items():
+        if name in ('limit', 'offset'):
+            continue
+        elif name == 'search':
+            predicates[name] = values[-1]
+            continue
+        elif name == 'catalog':
+            predicates[name] = set(values)
+            continue
+
+        if name == 'discovered':
+            kind = 'int'
+        elif name in table.lazy_columns:
+            kind = 'float'
+        elif name in table.kinds:
+            kind = table.kinds[name]
+        else:
+            raise ValueError('Unknown query field: %s' % name)
+
+        if kind in numeric_kinds and len(values) == 1 and ':' in values[0]:
+            low, high = values[0].split(':', 1)
+            value = (parseValue(kind, low) if low else None, parseValue(kind, high) if high else None)
+            if name == 'discovered':
+                value = tuple(None if year == None else int(year) for year in value)
+            predicates[name] = value
+        elif name == 'discovered':
+            year = int(values[-1])
+            predicates[name] = (year, year)
+        elif len(values) == 1:
+            predicates[name] = parseValue(kind, values[0])
+        else:
+            predicates[name] = set(parseValue(kind, value) for value in values)
+
+    return predicates
+
+class Server(object):
+    """
+    asyncio HTTP/1.1 server of a QueryService. Connections are kept alive and
+    served concurrently. Responses which are not cached are computed in one
+    worker thread, since QueryService.respond() is not reentrant.
+    """
+    max_header_size = 65536
+    max_body_size = 4096 # requests are GET queries, which need no body
+
+    def __init__(self, service, host='127.0.0.1', port=8080, log=None):
+        """
+        `log` is a callable receiving one line per request, or None
+        """
+        self.service = service
+        self.host = host
+        self.port = port
+        self.log = log
+        self.server = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='tevcat-query')
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=self.max_header_size)
+        # the actual port if 0 is given
+        self.port = self.server.sockets[0].getsockname()[1]
+
+        return self.server
+
+    async def serveForever(self):
+        if self.server == None:
+            await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def handle(self, reader, writer):
+        """
+        Serves the requests of one connection
+        """
+        try:
+            while True:
+                try:
+                    header = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, 413, self.service.encode({'error': 'Header too large'}), False)
+                    break
+
+                lines = header.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ')
+                except ValueError:
+                    await self.send(writer, 400, self.service.encode({'error': 'Malformed request line'}), False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get('content-length', '0') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.send(writer, 400, self.service.encode({'error': 'Invalid Content-Length'}), False)
+                    break
+                elif length > self.max_body_size:
+                    await self.send(writer, 413, self.service.encode({'error': 'Request body too large'}), False)
+                    break
+                elif length > 0:
+                    await reader.readexactly(length)
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+
+                start = time.perf_counter()
+                if method not in ('GET', 'HEAD'):
+                    status, body = 405, self.service.encode({'error': 'Only GET and HEAD are allowed'})
+                else:
+                    try:
+                        response = self.service.getCached(target)
+                        if response == None:
+                            response = await asyncio.get_running_loop().run_in_executor(self.executor, self.service.respond, target)
+                        status, body = response
+                    except Exception as e:
+                        status, body = 500, self.service.encode({'error': '%s: %s' % (type(e).__name__, e)})
+
+                await self.send(writer, status, body, keep_alive, method == 'HEAD')
+                if self.log != None:
+                    self.log('%s %s %d %d %.1f ms' % (method, target, status, len(body), (time.perf_counter() - start)*1e3))
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, body, keep_alive, head_only=False):
+        lines = ['HTTP/1.1 %d %s' % (status, reasons.get(status, '')),
+                 'Content-Type: application/json; charset=utf-8',
+                 'Content-Length: %d' % len(body),
+                 'Connection: %s' % ('keep-alive' if keep_alive else 'close'),
+                 '', '']
+        writer.write('\r\n'.join(lines).encode('latin-1'))
+        if not head_only:
+            writer.write(body)
+        await writer.drain()
+
+def serve(service, host='127.0.0.1', port=8080, log=print):
+    """
+    Runs the server until it is interrupted
+    """
+    server = Server(service, host, port, log)
+
+    async def run():
+        await server.start()
+        if log != None:
+            log('Serving TeVCat %s (%d sources) on http://%s:%d/' % (service.getTeVCat().version, len(service.getTeVCat().getTable()), host, server.port))
+        await server.serveForever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,328 @@
+"""
+Sharing the catalog between processes
+
+A TeVCat can be published into one block of multiprocessing.shared_memory,
+from which worker processes attach without copying the numerical columns and
+the precomputed coordinates. Object columns (strings and raw JSON values) are
+stored as string tables, i.e. the distinct values as JSON text plus one code
+per source, and are decoded once per worker. For example
+
+    >>> with cat.share() as shared:
+    ...     with multiprocessing.Pool(4) as pool:
+    ...         results = pool.map(work, [(shared.handle, query) for query in queries])
+
+where `work` calls tevcat.shared.attach(handle) to get the catalog. Workers
+must be started by multiprocessing (so that they share the resource tracker of
+the publishing process), and the block lives until SharedCatalog.unlink().
+
+When a TeVCat has to be pickled, exportState() and importState() are used by
+TeVCat.__reduce__() to send the columns instead of Source and SkyCoord
+objects.
+"""
+import atexit
+import gc
+import json
+
+import numpy
+
+from .instrument import LoadStats
+from .snapshot import buildTeVCat, catalog_fields
+
+# bytes between the starts of the arrays in a shared block
+alignment = 64
+
+# blocks attached in this process, name -> (SharedMemory, TeVCat)
+_attached = {}
+
+# detached blocks which could not be closed because their arrays were in use,
+# closed by closeReleased()
+_unclosed = []
+
+def factorize(column):
+    """
+    Returns (codes, values) of an object column, where values[codes[i]] is
+    column[i] and the values are in the order of first appearance
+    """
+    index = {}
+    values = []
+    codes = numpy.empty(len(column), dtype=numpy.int32)
+    for i, value in enumerate(column):
+        try:
+            key = (type(value), value)
+            code = index.get(key)
+        except TypeError: # lists and dictionaries in raw JSON values
+            key = (type(value), json.dumps(value, sort_keys=True))
+            code = index.get(key)
+        if code == None:
+            code = index[key] = len(values)
+            values.append(value)
+        codes[i] = code
+
+    return codes, values
+
+def exportState(tevcat, frames=(), hmsdms=False, include_json=False):
+    """
+    Returns the state of a TeVCat as a dictionary of NumPy arrays and small
+    Python objects. Numerical columns are kept as they are, and object
+    columns as (codes, distinct values). The coordinates in `frames` and, if
+    `hmsdms` is True, the formatted (RA, Dec) strings are computed first, so
+    that the receiver does not have to. The JSON data, which repeat the
+    columns, are included only if `include_json` is True; otherwise the
+    receiver rebuilds them from the columns when TeVCat.json is used.
+    """
+    table = tevcat.getTable()
+    if len(table) > 0:
+        table.precomputeFrames(frames)
+        if hmsdms:
+            table.getHMSDMS()
+
+    columns = {}
+    objects = {}
+    for name in [name for name, kind in table.fields] + list(table.coordinates):
+        column = table[name]
+        if column.dtype == object:
+            objects[name] = factorize(column)
+        else:
+            columns[name] = column
+    if table.hmsdms != None:
+        hmsdms = numpy.empty(len(table.hmsdms), dtype=object)
+        hmsdms[:] = table.hmsdms
+        objects['hmsdms'] = factorize(hmsdms)
+
+    # the decoded JSON data if any, which pickles smaller than the text
+    if not include_json:
+        json_data = None
+    elif tevcat.json_data != None:
+        json_data = tevcat.json_data
+    else:
+        json_data = None if tevcat.json_text == None else bytes(tevcat.json_text)
+
+    return {'version': tevcat.version,
+            'catalogs': [dict((field, getattr(tevcat.getCatalog(i), field)) for field in catalog_fields) for i in sorted(tevcat.catalogs)],
+            'json': json_data,
+            'validation': tevcat.validation,
+            'diagnostics': tevcat.diagnostics,
+            'observatory_names': tevcat.observatory_names,
+            'source_type_names': tevcat.source_type_names,
+            'columns': columns,
+            'objects': objects,
+            'frames': dict((frame, lonlat) for frame, lonlat in table.frames.items() if frame != 'fk5')}
+
+def importState(cls, state, stats=None):
+    """
+    Returns a TeVCat (or its subclass `cls`) made of a state returned by
+    exportState(). The arrays are used without copying.
+    """
+    from .tevcat_all import SourceTable
+
+    stats = LoadStats() if stats == None else stats
+
+    columns = dict(state['columns'])
+    codes = {}
+    with stats.stage('decode', objects=len(state['objects'])):
+        for name, (column_codes, values) in state['objects'].items():
+            distinct = numpy.empty(len(values), dtype=object)
+            distinct[:] = values
+            columns[name] = distinct[column_codes]
+            codes[name] = (column_codes, list(values))
+    hmsdms = columns.pop('hmsdms', None)
+
+    table = SourceTable.fromColumns(columns, dict(state['frames']), stats)
+    if hmsdms is not None:
+        table.hmsdms = list(hmsdms)
+    for name, kind in table.fields:
+        if kind == 'category':
+            table.codes[name] = codes[name]
+
+    tevcat = buildTeVCat(cls, table, state, stats)
+    if isinstance(state['json'], dict):
+        tevcat.json = state['json']
+
+    return tevcat
+
+class SharedCatalog(object):
+    """
+    A TeVCat published into a shared memory block. `handle` is a small
+    picklable object to be passed to attach() in the workers.
+    """
+    def __init__(self, tevcat, name=None, frames=('icrs', 'galactic'), include_json=False):
+        """
+        Copies the columns of `tevcat` into a new shared memory block. `name`
+        is the name of the block (a random one by default). The JSON data are
+        copied too if `include_json` is True (see exportState).
+        """
+        from multiprocessing import shared_memory
+
+        state = exportState(tevcat, frames, True, include_json)
+
+        arrays = []
+        for field, column in state.pop('columns').items():
+            arrays.append(('column/' + field, column))
+        for frame, (lon, lat) in state.pop('frames').items():
+            arrays.append(('frame/%s/lon' % frame, lon))
+            arrays.append(('frame/%s/lat' % frame, lat))
+        for field, (codes, values) in state.pop('objects').items():
+            texts = [json.dumps(value).encode('utf-8') for value in values]
+            offsets = numpy.zeros(len(texts) + 1, dtype=numpy.int64)
+            numpy.cumsum([len(text) for text in texts], out=offsets[1:])
+            arrays.append(('codes/' + field, codes))
+            arrays.append(('offsets/' + field, offsets))
+            arrays.append(('text/' + field, numpy.frombuffer(b''.join(texts), dtype=numpy.uint8)))
+        json_text = state.pop('json')
+        if isinstance(json_text, dict):
+            json_text = json.dumps(json_text).encode('utf-8')
+        if json_text is not None:
+            arrays.append(('json', numpy.frombuffer(json_text, dtype=numpy.uint8)))
+
+        # name -> (dtype, shape, offset)
+        layout = {}
+        size = 0
+        for key, array in arrays:
+            array = numpy.ascontiguousarray(array)
+            layout[key] = (array.dtype.str, array.shape, size)
+            size += -(-array.nbytes//alignment)*alignment
+
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+        for key, array in arrays:
+            dtype, shape, offset = layout[key]
+            numpy.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)[...] = array
+
+        self.name = self.shm.name
+        self.handle = {'name': self.shm.name, 'layout': layout, 'state': state, 'class': tevcat.__class__}
+
+    def close(self):
+        """
+        Closes the block in this process
+        """
+        if self.shm != None:
+            self.shm.close()
+            self.shm = None
+
+    def unlink(self):
+        """
+        Closes and frees the block. Workers must have detached before.
+        """
+        from multiprocessing import shared_memory
+
+        try:
+            if self.shm != None:
+                self.shm.unlink()
+            else:
+                shared_memory.SharedMemory(name=self.name).unlink()
+        except FileNotFoundError:
+            pass
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unlink()
+        return False
+
+def attach(handle):
+    """
+    Returns the TeVCat published by SharedCatalog from its `handle`. The
+    numerical columns are read-only views of the shared block. The block is
+    attached only once per process, and later calls return the same TeVCat.
+    """
+    from multiprocessing import shared_memory
+
+    closeReleased()
+    block = handle['name']
+    try:
+        return _attached[block][1]
+    except KeyError:
+        pass
+
+    shm = shared_memory.SharedMemory(name=block)
+    stats = LoadStats('attach')
+
+    arrays = {}
+    with stats.stage('attach', bytes=shm.size):
+        for key, (dtype, shape, offset) in handle['layout'].items():
+            # numpy.frombuffer() keeps the buffer of the block exported as
+            # long as the array or any view of it is alive, so that the
+            # block cannot be closed under them (see detach)
+            array = numpy.frombuffer(shm.buf, dtype=dtype, count=int(numpy.prod(shape)), offset=offset).reshape(shape)
+            array.setflags(write=False)
+            arrays[key] = array
+
+    state = dict(handle['state'])
+    state['columns'] = {}
+    state['frames'] = {}
+    state['objects'] = {}
+    json_text = arrays.pop('json', None)
+    state['json'] = None if json_text is None else memoryview(json_text)
+    for key, array in arrays.items():
+        kind, field = key.split('/', 1)
+        if kind == 'column':
+            state['columns'][field] = array
+        elif kind == 'frame':
+            frame, axis = field.split('/')
+            lonlat = state['frames'].setdefault(frame, [None, None])
+            lonlat[0 if axis == 'lon' else 1] = array
+        elif kind == 'codes':
+            offsets = arrays['offsets/' + field]
+            text = arrays['text/' + field]
+            values = [json.loads(text[offsets[i]:offsets[i + 1]].tobytes()) for i in range(len(offsets) - 1)]
+            state['objects'][field] = (array, values)
+    state['frames'] = dict((frame, tuple(lonlat)) for frame, lonlat in state['frames'].items())
+
+    tevcat = importState(handle['class'], state, stats)
+    _attached[block] = (shm, tevcat)
+
+    return tevcat
+
+def closeBlock(shm):
+    """
+    Closes a block, and returns False if arrays of it are still in use
+    """
+    try:
+        shm.close()
+    except BufferError:
+        # the last references may be in garbage cycles
+        gc.collect()
+        try:
+            shm.close()
+        except BufferError:
+            return False
+
+    return True
+
+def closeReleased():
+    """
+    Closes the detached blocks whose arrays have been released since. Called
+    by attach() and detach(), and at exit.
+    """
+    for shm in list(_unclosed):
+        if closeBlock(shm):
+            _unclosed.remove(shm)
+
+atexit.register(closeReleased)
+
+def detach(handle):
+    """
+    Invalidates the TeVCat attached from `handle` and closes the block in
+    this process. The TeVCat and its sources raise ValueError afterwards, and
+    attach() attaches the block again. BufferError is raised if arrays of
+    the block are still referenced elsewhere (e.g. columns kept by the
+    caller), in which case the block is closed by a later attach() or
+    detach(), or at exit, once they are released.
+    """
+    closeReleased()
+    shm, tevcat = _attached.pop(handle['name'], (None, None))
+    if shm == None:
+        return
+
+    # The table is shared with the Source objects, so its arrays are
+    # released in place
+    table = tevcat.getTable()
+    table.release('The shared TeVCat %s has been detached' % handle['name'])
+    tevcat.setTable(table)
+    tevcat.json_text = None
+    del tevcat, table
+
+    if not closeBlock(shm):
+        _unclosed.append(shm)
+        raise BufferError('Arrays of the shared TeVCat %s are still referenced' % handle['name'])
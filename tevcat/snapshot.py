@@ -0,0 +1,421 @@
+"""
+Binary snapshots of the parsed database in FITS, Arrow (IPC file) and Parquet
+
+A snapshot holds every column of SourceTable, the positions precomputed in the
+FK5, ICRS and Galactic frames, the formatted (RA, Dec) strings, the catalogs,
+the validation mode and diagnostics, and the observatory and source type
+names. The JSON text, which repeats the columns, is saved only on request
+and is otherwise rebuilt from the columns when TeVCat.json is used. Numerical
+columns are read from memory-mapped files (FITS and Arrow) without copying, so
+loading a snapshot needs neither JSON parsing of the sources nor astropy
+transformations. String columns are
+stored as FITS character columns, or Arrow strings (dictionary encoded for
+the categorical ones). Only the raw JSON values (SourceTable kind 'raw') are
+stored as JSON text, which is decoded when the column is first used.
+
+pyarrow is needed only for the Arrow and Parquet formats, and is installed by
+the 'arrow' extra (pip install pytevcat[arrow]).
+"""
+import json
+
+import numpy
+
+from .instrument import LoadStats
+from .validation import Diagnostic, checkMode
+
+# precomputed frames: (frame, longitude column, latitude column)
+frames = (('icrs',     'icrs_ra', 'icrs_dec'),
+          ('galactic', 'glon',    'glat'))
+
+catalog_fields = ('id', 'name', 'description', 'role_id', 'public')
+
+# metadata of the validation, saved as JSON
+state_fields = ('validation', 'diagnostics', 'observatory_names', 'source_type_names')
+
+def importArrow(parquet=False):
+    """
+    Returns the pyarrow module (with pyarrow.parquet imported if `parquet` is
+    True). ImportError is raised with the name of the extra to install if
+    pyarrow is missing.
+    """
+    try:
+        import pyarrow
+        if parquet:
+            import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('pyarrow is needed for the Arrow and Parquet snapshots. '
+                          'Install it with pip install pytevcat[arrow] (%s)' % e)
+
+    return pyarrow
+
+def columnKinds():
+    """
+    Returns the SourceTable kinds of the saved columns (name -> kind)
+    """
+    from .tevcat_all import SourceTable
+
+    kinds = dict(SourceTable.fields)
+    kinds['hmsdms'] = 'str'
+
+    return kinds
+
+def exportColumns(tevcat, keeps_spaces=True, include_json=False):
+    """
+    Returns the list of (name, array) to be saved and the metadata. String
+    columns are object arrays of str (or None). Raw columns, and string
+    columns with trailing spaces if the format does not keep them
+    (`keeps_spaces` is False), are encoded as JSON text, and are listed in
+    metadata['encoded']. metadata['json'] is the JSON text if `include_json`
+    is True, and None otherwise.
+    """
+    table = tevcat.getTable()
+    kinds = columnKinds()
+    table.precomputeFrames([frame for frame, lon, lat in frames])
+
+    columns = []
+    for name, kind in table.fields:
+        columns.append((name, table[name]))
+    for name in table.coordinates:
+        columns.append((name, table[name]))
+    for frame, lon, lat in frames:
+        columns.append((lon, table.getFrame(frame)[0]))
+        columns.append((lat, table.getFrame(frame)[1]))
+    columns.append(('hmsdms', numpy.array(table.getHMSDMS(), dtype=object)))
+
+    exported = []
+    encoded = []
+    for name, column in columns:
+        if column.dtype == object:
+            if kinds[name] == 'raw' or not (keeps_spaces or isStripped(column)):
+                column = numpy.array([json.dumps(value) for value in column], dtype=object)
+                encoded.append(name)
+        exported.append((name, column))
+
+    catalogs = []
+    for i in sorted(tevcat.catalogs):
+        catalog = tevcat.getCatalog(i)
+        catalogs.append(dict((field, getattr(catalog, field)) for field in catalog_fields))
+
+    metadata = {'version': tevcat.version,
+                'catalogs': catalogs,
+                'encoded': encoded,
+                'json': json.dumps(tevcat.json).encode('utf-8') if include_json else None,
+                'validation': tevcat.validation,
+                'diagnostics': [diagnostic.asDict() for diagnostic in tevcat.diagnostics],
+                'observatory_names': tevcat.observatory_names,
+                'source_type_names': tevcat.source_type_names}
+
+    return exported, metadata
+
+def encodeJSON(value):
+    """
+    Returns the JSON text of metadata, which may contain NumPy scalars (e.g.
+    the values of diagnostics)
+    """
+    def default(value):
+        if isinstance(value, numpy.generic):
+            return value.item()
+        raise TypeError('%r is not JSON serializable' % (value,))
+
+    return json.dumps(value, default=default)
+
+def isStripped(column):
+    """
+    Returns True if no string of an object column ends with a space
+    """
+    for value in column:
+        if value != None and value.endswith(' '):
+            return False
+
+    return True
+
+def importTeVCat(cls, columns, metadata, stats=None, validation=None):
+    """
+    Returns a TeVCat (or its subclass `cls`) made of the columns and the
+    metadata read from a snapshot. String columns may be given as NumPy
+    string arrays, and the raw columns as JSON text are decoded only when
+    they are used. The validation mode and the diagnostics saved in the
+    snapshot are kept, unless `validation` is given, in which case the
+    sources are checked again in that mode.
+    """
+    from .tevcat_all import SourceTable
+
+    stats = LoadStats() if stats == None else stats
+    kinds = columnKinds()
+
+    decoded = {}
+    raw = {}
+    with stats.stage('decode', objects=len(columns)):
+        for name in columns:
+            column = columns[name]
+            if kinds.get(name) not in ('str', 'category', 'optstr', 'raw'):
+                decoded[name] = column
+            elif name not in metadata['encoded']:
+                decoded[name] = numpy.asarray(column).astype(object)
+            elif kinds[name] == 'raw':
+                raw[name] = column
+            else:
+                decoded[name] = numpy.empty(len(column), dtype=object)
+                decoded[name][:] = [json.loads(value) for value in column]
+
+    table_frames = {}
+    for frame, lon, lat in frames:
+        table_frames[frame] = (decoded.pop(lon), decoded.pop(lat))
+    hmsdms = decoded.pop('hmsdms')
+
+    table = SourceTable.fromColumns(decoded, table_frames, stats, raw)
+    table.hmsdms = list(hmsdms)
+
+    tevcat = buildTeVCat(cls, table, metadata, stats)
+    if validation != None:
+        checkMode(validation)
+        # the values which could not be parsed are only in the diagnostics
+        table.parse_errors = [diagnostic for diagnostic in tevcat.diagnostics if diagnostic.code == 'invalid_discoverer']
+        tevcat.validation = validation
+        tevcat.diagnostics = tevcat.validate()
+
+    return tevcat
+
+def buildTeVCat(cls, table, metadata, stats=None):
+    """
+    Returns a TeVCat (or its subclass `cls`) made of a SourceTable and the
+    metadata ('version', 'catalogs' as a list of dictionaries and 'json' as
+    the encoded JSON text, or None to rebuild it from the table). The
+    optional 'validation', 'diagnostics' (Diagnostic objects or
+    dictionaries), 'observatory_names' and 'source_type_names' default to
+    those of a new TeVCat without diagnostics.
+    """
+    from .tevcat_all import Catalog, observatory_names, source_type_names
+
+    stats = LoadStats() if stats == None else stats
+
+    tevcat = cls.__new__(cls)
+    tevcat.cache_dir = None
+    tevcat.ttl = None
+    tevcat.load_stats = stats
+    tevcat.validation = metadata.get('validation', 'warn')
+    tevcat.diagnostics = [Diagnostic.fromDict(diagnostic) if isinstance(diagnostic, dict) else diagnostic
+                          for diagnostic in metadata.get('diagnostics', [])]
+    # the keys are strings in JSON
+    tevcat.observatory_names = dict((int(key), name) for key, name in metadata.get('observatory_names', observatory_names).items())
+    tevcat.source_type_names = dict((int(key), name) for key, name in metadata.get('source_type_names', source_type_names).items())
+    tevcat.version = metadata['version']
+    tevcat.json_data = None
+    tevcat.json_text = metadata['json']
+    tevcat.json_normalized = False
+    tevcat.catalogs = {}
+    for catalog in metadata['catalogs']:
+        tevcat.catalogs[int(catalog['id'])] = Catalog(catalog)
+    with stats.stage('sources', objects=len(table)):
+        tevcat.setTable(table)
+
+    return tevcat
+
+def writeFITS(tevcat, path, overwrite=False, include_json=False):
+    """
+    Saves the database as a FITS file with SOURCES, CATALOGS and METADATA
+    HDUs, and a JSON HDU if `include_json` is True. Strings are saved as UTF-8 character columns, with a logical
+    column 'null_<name>' for those which have null values.
+    """
+    from astropy.io import fits
+
+    # FITS removes the trailing spaces of the strings
+    columns, metadata = exportColumns(tevcat, False, include_json)
+
+    formats = {'i': 'K', 'f': 'D', 'b': 'L'}
+    cols = []
+    nulls = []
+    for name, column in columns:
+        if column.dtype == object:
+            null = numpy.array([value is None for value in column], dtype=bool)
+            column = numpy.array([b'' if value is None else value.encode('utf-8') for value in column], dtype=bytes)
+            cols.append(fits.Column(name=name, format='%dA' % max(column.dtype.itemsize, 1), array=column))
+            if null.any():
+                cols.append(fits.Column(name='null_' + name, format='L', array=null))
+                nulls.append(name)
+        else:
+            cols.append(fits.Column(name=name, format=formats[column.dtype.kind], array=column))
+    sources = fits.BinTableHDU.from_columns(cols, name='SOURCES')
+    sources.header['VERSION'] = metadata['version']
+
+    catalogs = [json.dumps(catalog) for catalog in metadata['catalogs']]
+    catalogs = fits.BinTableHDU.from_columns([fits.Column(name='catalog', format='%dA' % max([len(c) for c in catalogs] + [1]),
+                                                          array=numpy.array(catalogs, dtype=bytes))], name='CATALOGS')
+
+    info = dict((field, metadata[field]) for field in state_fields)
+    info['encoded'] = metadata['encoded']
+    info['nulls'] = nulls
+    info = encodeJSON(info)
+    info = fits.BinTableHDU.from_columns([fits.Column(name='metadata', format='%dA' % len(info),
+                                                      array=numpy.array([info], dtype=bytes))], name='METADATA')
+
+    hdus = [fits.PrimaryHDU(), sources, catalogs, info]
+    if metadata['json'] != None:
+        hdus.append(fits.ImageHDU(numpy.frombuffer(metadata['json'], dtype=numpy.uint8), name='JSON'))
+
+    fits.HDUList(hdus).writeto(path, overwrite=overwrite)
+
+def readFITS(cls, path, stats=None, validation=None):
+    """
+    Loads a FITS snapshot. The numerical columns are memory-mapped. See
+    importTeVCat() for `validation`.
+    """
+    from astropy.io import fits
+
+    stats = LoadStats() if stats == None else stats
+    kinds = columnKinds()
+    with stats.stage('read', path=path):
+        hdus = fits.open(path, memmap=True)
+        data = hdus['SOURCES'].data
+
+        if 'METADATA' in hdus:
+            info = json.loads(hdus['METADATA'].data['metadata'][0])
+        else:
+            # older snapshots had all the object columns as JSON text
+            info = {'encoded': [name for name in data.columns.names if kinds.get(name) in ('str', 'category', 'optstr', 'raw')],
+                    'nulls': []}
+
+        # astropy returns the character columns as str only if they are
+        # ASCII, so they are read as bytes from the records
+        records = numpy.asarray(data)
+        columns = {}
+        for name in data.columns.names:
+            if name.startswith('null_'):
+                continue
+            column = data[name]
+            if records.dtype[name].kind == 'S':
+                try:
+                    column = records[name].astype(str) # ASCII, much faster
+                except UnicodeDecodeError:
+                    column = numpy.char.decode(records[name], 'utf-8')
+                if name in info['nulls']:
+                    column = column.astype(object)
+                    column[data['null_' + name]] = None
+            columns[name] = column
+
+        metadata = {'version': hdus['SOURCES'].header['VERSION'],
+                    'catalogs': [json.loads(c) for c in hdus['CATALOGS'].data['catalog']],
+                    'encoded': info['encoded'],
+                    'json': memoryview(hdus['JSON'].data) if 'JSON' in hdus else None}
+        for field in state_fields:
+            if field in info:
+                metadata[field] = info[field]
+
+    return importTeVCat(cls, columns, metadata, stats, validation)
+
+def arrowTable(tevcat, include_json=False):
+    """
+    Returns a pyarrow.Table of the database. The JSON text is added to the
+    schema metadata if `include_json` is True.
+    """
+    pyarrow = importArrow()
+
+    kinds = columnKinds()
+    columns, metadata = exportColumns(tevcat, include_json=include_json)
+    schema_metadata = {b'tevcat.version': str(metadata['version']).encode('utf-8'),
+                       b'tevcat.catalogs': json.dumps(metadata['catalogs']).encode('utf-8'),
+                       b'tevcat.encoded': json.dumps(metadata['encoded']).encode('utf-8')}
+    for field in state_fields:
+        schema_metadata[('tevcat.' + field).encode('utf-8')] = encodeJSON(metadata[field]).encode('utf-8')
+    if metadata['json'] != None:
+        schema_metadata[b'tevcat.json'] = metadata['json']
+
+    arrays = {}
+    for name, column in columns:
+        if column.dtype != object:
+            arrays[name] = pyarrow.array(column)
+        elif kinds[name] == 'category':
+            arrays[name] = pyarrow.array(column, type=pyarrow.string()).dictionary_encode()
+        else:
+            arrays[name] = pyarrow.array(column, type=pyarrow.string())
+
+    return pyarrow.table(arrays, metadata=schema_metadata)
+
+def fromArrowTable(cls, table, stats=None, validation=None):
+    """
+    Returns a TeVCat made of a pyarrow.Table. Numerical columns without nulls
+    are converted without copying. See importTeVCat() for `validation`.
+    """
+    pyarrow = importArrow()
+
+    stats = LoadStats() if stats == None else stats
+    columns = {}
+    with stats.stage('convert', objects=table.num_columns):
+        for name in table.column_names:
+            column = table.column(name)
+            if column.num_chunks == 1:
+                column = column.chunk(0)
+            else:
+                column = column.combine_chunks()
+            if pyarrow.types.is_dictionary(column.type):
+                # each distinct string is converted only once
+                values = column.dictionary.to_numpy(zero_copy_only=False)
+                columns[name] = values[column.indices.to_numpy(zero_copy_only=False)]
+            else:
+                columns[name] = column.to_numpy(zero_copy_only=False)
+
+    metadata = table.schema.metadata
+    kinds = columnKinds()
+    if b'tevcat.encoded' in metadata:
+        encoded = json.loads(metadata[b'tevcat.encoded'])
+    else:
+        # older snapshots had all the object columns as JSON text
+        encoded = [name for name in table.column_names if kinds.get(name) in ('str', 'category', 'optstr', 'raw')]
+    state = metadata
+    metadata = {'version': state[b'tevcat.version'].decode('utf-8'),
+                'catalogs': json.loads(state[b'tevcat.catalogs']),
+                'encoded': encoded,
+                'json': state.get(b'tevcat.json')}
+    for field in state_fields:
+        key = ('tevcat.' + field).encode('utf-8')
+        if key in state:
+            metadata[field] = json.loads(state[key])
+
+    return importTeVCat(cls, columns, metadata, stats, validation)
+
+def writeArrow(tevcat, path, include_json=False):
+    """
+    Saves the database as an uncompressed Arrow IPC file, which can be
+    memory-mapped
+    """
+    pyarrow = importArrow()
+
+    table = arrowTable(tevcat, include_json)
+    with pyarrow.OSFile(path, 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def readArrow(cls, path, stats=None, validation=None):
+    """
+    Loads an Arrow IPC snapshot from a memory-mapped file. See importTeVCat()
+    for `validation`.
+    """
+    pyarrow = importArrow()
+
+    stats = LoadStats() if stats == None else stats
+    with stats.stage('read', path=path):
+        source = pyarrow.memory_map(path, 'r')
+        table = pyarrow.ipc.open_file(source).read_all()
+
+    return fromArrowTable(cls, table, stats, validation)
+
+def writeParquet(tevcat, path, include_json=False):
+    """
+    Saves the database as a Parquet file
+    """
+    pyarrow = importArrow(parquet=True)
+
+    pyarrow.parquet.write_table(arrowTable(tevcat, include_json), path)
+
+def readParquet(cls, path, stats=None, validation=None):
+    """
+    Loads a Parquet snapshot. The file is memory-mapped, but the columns are
+    decoded from the Parquet pages. See importTeVCat() for `validation`.
+    """
+    pyarrow = importArrow(parquet=True)
+
+    stats = LoadStats() if stats == None else stats
+    with stats.stage('read', path=path):
+        table = pyarrow.parquet.read_table(path, memory_map=True)
+
+    return fromArrowTable(cls, table, stats, validation)
@@ -0,0 +1,151 @@
+"""
+Spatial index of source positions for cone search and nearest-neighbour queries
+"""
+import numpy
+
+# (SpatialIndex, radius) of the sources in a crossmatch worker process
+_worker_sources = None
+
+def unitVectors(lon, lat):
+    """
+    Returns unit vectors (N, 3) of the given longitudes and latitudes (deg).
+    """
+    lon = numpy.radians(numpy.asarray(lon, dtype=numpy.float64))
+    lat = numpy.radians(numpy.asarray(lat, dtype=numpy.float64))
+    cos_lat = numpy.cos(lat)
+
+    return numpy.stack((cos_lat*numpy.cos(lon), cos_lat*numpy.sin(lon), numpy.sin(lat)), axis=-1)
+
+def chordToAngle(chord2):
+    """
+    Converts squared chord lengths between unit vectors into angles (deg).
+    """
+    return numpy.degrees(2.*numpy.arcsin(numpy.minimum(numpy.sqrt(chord2)/2., 1.)))
+
+def angleToChord(angle):
+    """
+    Converts angles (deg) into squared chord lengths between unit vectors.
+    """
+    return (2.*numpy.sin(numpy.radians(numpy.minimum(angle, 180.))/2.))**2
+
+class SpatialIndex(object):
+    """
+    Unit vectors of source positions sorted by latitude. A cone search only
+    scans the latitude zone which the cone overlaps, which is found by a
+    binary search.
+    """
+    def __init__(self, lon, lat):
+        """
+        Builds the index from longitude and latitude arrays (deg)
+        """
+        lat = numpy.asarray(lat, dtype=numpy.float64)
+        lon = numpy.asarray(lon, dtype=numpy.float64)
+
+        self.order = numpy.argsort(lat, kind='stable')
+        self.lat = lat[self.order]
+        self.xyz = unitVectors(lon[self.order], self.lat).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.order)
+
+    def coneSearch(self, lon, lat, radius):
+        """
+        Returns the indices of the sources within `radius` (deg) from (lon, lat)
+        and their separations (deg), sorted by separation.
+        """
+        lo = numpy.searchsorted(self.lat, lat - radius, side='left')
+        hi = numpy.searchsorted(self.lat, lat + radius, side='right')
+
+        diff = self.xyz[lo:hi] - unitVectors(lon, lat)
+        chord2 = numpy.einsum('ij,ij->i', diff, diff)
+        selected = numpy.nonzero(chord2 <= angleToChord(radius))[0]
+
+        separation = chordToAngle(chord2[selected])
+        order = numpy.argsort(separation, kind='stable')
+
+        return self.order[lo + selected[order]], separation[order]
+
+    def nearest(self, lon, lat, k=1):
+        """
+        Returns the indices of the k nearest sources from (lon, lat) and their
+        separations (deg), sorted by separation.
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0, dtype=numpy.float64)
+
+        # Start from the radius which contains k sources on average
+        radius = max(numpy.degrees(numpy.sqrt(4.*k/len(self))), 0.1)
+        while True:
+            indices, separation = self.coneSearch(lon, lat, radius)
+            if len(indices) >= k or radius >= 180.:
+                return indices[:k], separation[:k]
+            radius = min(radius*2., 180.)
+
+def crossmatchChunk(lon, lat, offset, index, radius, max_pairs=2**19):
+    """
+    Matches positions (lon, lat in deg) against the sources of a SpatialIndex,
+    where `radius` (deg) is the matching radius of each source (in the order
+    of the sources, not of the index). Only the sources in the latitude zone
+    of each position are compared, and the positions are processed in blocks
+    of at most about `max_pairs` candidate pairs (about 80 bytes each).
+    Returns (input_index, source_index, separation) with `offset` added to
+    the input indices, sorted by input index and separation.
+    """
+    lon = numpy.asarray(lon, dtype=numpy.float64)
+    lat = numpy.asarray(lat, dtype=numpy.float64)
+
+    # the zone is widened a little so that rounding never drops a match
+    reach = (numpy.max(radius) if len(radius) > 0 else 0.) + 1e-9
+    lo = numpy.searchsorted(index.lat, lat - reach, side='left')
+    counts = numpy.searchsorted(index.lat, lat + reach, side='right') - lo
+    total = numpy.cumsum(counts)
+
+    results = []
+    start = 0
+    while start < len(lat):
+        done = total[start - 1] if start > 0 else 0
+        stop = max(int(numpy.searchsorted(total, done + max_pairs, side='right')), start + 1)
+        input_index, source_index, separation = matchZones(lon[start:stop], lat[start:stop], lo[start:stop],
+                                                           counts[start:stop], index, radius)
+        results.append((input_index + offset + start, source_index, separation))
+        start = stop
+
+    if len(results) == 0:
+        return numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0, dtype=numpy.float64)
+
+    return tuple(numpy.concatenate(arrays) for arrays in zip(*results))
+
+def matchZones(lon, lat, lo, counts, index, radius):
+    """
+    Compares each position with the `counts` sources of the index from `lo`
+    and returns the pairs within the radii, as crossmatchChunk()
+    """
+    chunk = unitVectors(lon, lat).reshape(-1, 3)
+    input_index = numpy.repeat(numpy.arange(len(counts)), counts)
+    candidate = numpy.arange(len(input_index)) + numpy.repeat(lo - (numpy.cumsum(counts) - counts), counts)
+
+    diff = chunk[input_index] - index.xyz[candidate]
+    separation = chordToAngle(numpy.einsum('ij,ij->i', diff, diff))
+    source_index = index.order[candidate]
+    selected = separation <= radius[source_index]
+    input_index, source_index, separation = input_index[selected], source_index[selected], separation[selected]
+
+    order = numpy.lexsort((separation, input_index))
+
+    return input_index[order], source_index[order], separation[order]
+
+def initCrossmatchWorker(index, radius):
+    """
+    Keeps the SpatialIndex and the matching radii of the sources in a worker
+    process, so that they are sent only once instead of with every chunk
+    """
+    global _worker_sources
+    _worker_sources = (index, radius)
+
+def crossmatchWorkerChunk(args):
+    """
+    crossmatchChunk() in a worker process initialized by
+    initCrossmatchWorker(), where `args` is (lon, lat, offset)
+    """
+    return crossmatchChunk(*(tuple(args) + _worker_sources))
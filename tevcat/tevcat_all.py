@@ -1,20 +1,26 @@
 """
 Python interface for TeVCat (http://tevcat.uchicago.edu/)
+
+astropy and requests are imported on first use to keep `import tevcat` fast.
 """
 from __future__ import print_function
 
-from builtins import str
-from builtins import range
-from builtins import object
-import requests
 import base64
+import copy
+import io
 import json
-from astropy.coordinates import SkyCoord, Angle
-from astropy import units as u
-import pkg_resources
-import math
+import os
+import tempfile
+import time
 import numpy
 
+from . import shared, snapshot, validation
+from .instrument import LoadStats, TimedIterator
+from .query import BitmapIndex, QueryResult, categoryKey, evaluate, intersection, isSet, union
+from .search import SearchIndex
+from .spatial import SpatialIndex, crossmatchChunk, crossmatchWorkerChunk, initCrossmatchWorker
+from .validation import Diagnostic, checkMode
+
 observatory_names = {1:  'Whipple',
                      2:  'Telescope Array',
                      3:  'HEGRA',
@@ -70,32 +76,519 @@ def p(a, b):
     return a[0:b]
 
 
+def getResourcePath(name):
+    """
+    Returns the path to a file bundled with the package (e.g. 'img/allsky_b.png')
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *name.split('/'))
+
+_session = None
+
+def getSession():
+    """
+    Returns the requests.Session shared by all the downloads, which keeps the
+    connections to the server alive
+    """
+    global _session
+
+    if _session == None:
+        import requests
+
+        _session = requests.Session()
+
+    return _session
+
+def parsePage(source, stats=None):
+    """
+    Returns (version, data) parsed from a TeVCat HTML page, where `data` is
+    the decoded JSON. `source` is an iterable of lines (bytes or str, e.g.
+    Response.iter_lines()), a file object, a path to a file, or the page
+    content as bytes. Reading stops as soon as the version, the data and its
+    length are all found.
+
+    The 'fetch' (reading the lines), 'scan', 'base64' and 'json' stages are
+    recorded in `stats` (LoadStats) if it is given.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            return parsePage(f, stats)
+
+    if stats == None:
+        stats = LoadStats()
+
+    version = data = lim = None
+
+    lines = TimedIterator(source)
+    t0 = time.perf_counter()
+    for line in lines:
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+
+        if line.find(b'Version') >= 0:
+            version = line.split()[-1].decode('utf-8')
+        elif line.find(b'var dat  =') >= 0:
+            data = line.split(b'"')[1]
+        elif line.find(b'pytevcat = ') >= 0:
+            lim = int(line.split(b'pytevcat = ')[1].split(b';')[0])
+
+        if version != None and data != None and lim != None:
+            break
+    scan = time.perf_counter() - t0 - lines.seconds
+    stats.add('fetch', lines.seconds, bytes=lines.bytes)
+    stats.add('scan', scan)
+
+    if data == None or lim == None:
+        raise ValueError('Cannot find the TeVCat data in the page')
+
+    # The payload is sliced without copying, and json accepts the bytes as is
+    with stats.stage('base64', bytes=lim):
+        payload = base64.b64decode(memoryview(data)[0:lim])
+    with stats.stage('json', bytes=len(payload)) as span:
+        data = json.loads(payload)
+        span.set(objects=len(data[u'sources']))
+
+    return version, data
+
+def defaultCacheDir():
+    """
+    Returns the default cache directory. It can be changed by setting the
+    TEVCAT_CACHE_DIR environment variable.
+    """
+    if os.environ.get('TEVCAT_CACHE_DIR'):
+        return os.environ['TEVCAT_CACHE_DIR']
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'tevcat')
+
 class TeVCat(object):
-    def __init__(self):
+    url = u'https://www.tevcat.org'
+    cache_file = 'tevcat.json'
+
+    def __init__(self, cache_dir=None, ttl=86400., offline=False, use_cache=True, validation='warn'):
         """
         Initialize database by downloading HTML data from the TeVCat home page
+
+        The decoded data are stored in `cache_dir` (see defaultCacheDir) and
+        reused for `ttl` seconds. Older cache is revalidated with a
+        conditional GET. If `offline` is True, only the cache is read and no
+        network access is made. Set `use_cache` to False to always download.
+
+        The sources are checked according to `validation` ('strict', 'warn'
+        or 'off', see tevcat.validation), and the problems found are kept in
+        `self.diagnostics`. The time of each loading stage is recorded in
+        `self.load_stats` (see tevcat.instrument).
+        """
+        checkMode(validation)
+        self.cache_dir = defaultCacheDir() if cache_dir == None else cache_dir
+        self.ttl = ttl
+        self.validation = validation
+        self.load_stats = stats = LoadStats()
+
+        cache = None
+        if use_cache:
+            with stats.stage('read_cache') as span:
+                cache = self.readCache()
+                span.set(hit=cache != None)
+
+        if offline:
+            if cache == None:
+                raise IOError('No cached TeVCat data found in %s' % self.getCachePath())
+        elif cache == None or time.time() - cache[u'fetched'] > ttl:
+            cache = self.download(cache, use_cache, stats)
+
+        self.build(cache[u'version'], cache[u'json'], stats)
+
+    @classmethod
+    def from_file(cls, path, validation='warn'):
+        """
+        Loads a snapshot saved by TeVCat.save() or a cache file without
+        network access.
+        """
+        with open(path) as f:
+            snapshot = json.load(f)
+
+        return cls.from_data(snapshot[u'version'], snapshot[u'json'], validation)
+
+    @classmethod
+    def from_fits(cls, path, validation=None):
+        """
+        Loads a FITS snapshot saved by TeVCat.to_fits(). The columns are
+        memory-mapped and no coordinate transformation is done. The
+        diagnostics saved in the snapshot are kept, unless `validation` is
+        given, in which case the sources are checked again in that mode.
+        """
+        return snapshot.readFITS(cls, path, LoadStats(), validation)
+
+    @classmethod
+    def from_arrow(cls, path, validation=None):
+        """
+        Loads an Arrow IPC snapshot saved by TeVCat.to_arrow(). The columns
+        are memory-mapped and no coordinate transformation is done. See
+        from_fits() for `validation`.
+        """
+        return snapshot.readArrow(cls, path, LoadStats(), validation)
+
+    @classmethod
+    def from_parquet(cls, path, validation=None):
         """
-        url = u'https://www.tevcat.org'
-        response = requests.get(url)
+        Loads a Parquet snapshot saved by TeVCat.to_parquet(). See
+        from_fits() for `validation`.
+        """
+        return snapshot.readParquet(cls, path, LoadStats(), validation)
 
-        self.version = None
+    def to_fits(self, path, overwrite=False, include_json=False):
+        """
+        Saves the database with the precomputed FK5, ICRS and Galactic
+        coordinates as a FITS file. The JSON data are saved too only if
+        `include_json` is True, and are otherwise rebuilt from the columns.
+        """
+        snapshot.writeFITS(self, path, overwrite, include_json)
 
-        for line in response.text.split(u"\n"):
-            if line.find(u'Version') >= 0:
-                self.version = line.split()[-1]
-            elif line.find(u'var dat  =') >= 0:
-                data = line.split(u'"')[1]
-            elif line.find(u'pytevcat') >= 0:
-                lim = int(line.split(u'pytevcat = ')[1].split(u';')[0])
+    def to_arrow(self, path, include_json=False):
+        """
+        Saves the database with the precomputed FK5, ICRS and Galactic
+        coordinates as an Arrow IPC file (needs pyarrow). See to_fits() for
+        `include_json`.
+        """
+        snapshot.writeArrow(self, path, include_json)
 
-        self.json = json.loads(base64.b64decode(data[0:lim]))
+    def to_parquet(self, path, include_json=False):
+        """
+        Saves the database with the precomputed FK5, ICRS and Galactic
+        coordinates as a Parquet file (needs pyarrow). See to_fits() for
+        `include_json`.
+        """
+        snapshot.writeParquet(self, path, include_json)
 
-        self.sources = []
-        for i in range(len(self.json[u'sources'])):
-            self.sources.append(Source(self.json[u'sources'][i], self))
+    @classmethod
+    def from_page(cls, source, validation='warn'):
+        """
+        Loads a TeVCat HTML page saved locally. See parsePage() for the
+        accepted types of `source`.
+        """
+        stats = LoadStats()
+        version, data = parsePage(source, stats)
+
+        return cls.from_data(version, data, validation, stats)
+
+    @classmethod
+    def from_data(cls, version, data, validation='warn', stats=None):
+        """
+        Builds the database from decoded JSON data (a dictionary with
+        'sources' and 'catalogs') without network access. The stages are
+        recorded in `stats`, or in a new LoadStats.
+        """
+        checkMode(validation)
+        tevcat = cls.__new__(cls)
+        tevcat.cache_dir = None
+        tevcat.ttl = None
+        tevcat.validation = validation
+        tevcat.build(version, data, stats)
+
+        return tevcat
+
+    def build(self, version, data, stats=None):
+        """
+        Builds the sources and the catalogs from the decoded JSON data. The
+        stages are recorded in `stats`, or in a new LoadStats.
+        """
+        self.load_stats = stats = LoadStats() if stats == None else stats
+        self.observatory_names = dict(observatory_names)
+        self.source_type_names = dict(source_type_names)
+        self.version = version
+        self.json = data
+        self.setCatalogs(data[u'catalogs'])
+        table = SourceTable(data[u'sources'], stats)
+        self.diagnostics = self.validate(table)
+        with stats.stage('sources', objects=len(table)):
+            self.setTable(table)
+
+    @property
+    def json(self):
+        """
+        The decoded JSON data. Binary snapshots keep only the JSON text, which
+        is decoded on first access. Pickled and shared catalogs keep neither,
+        and the data are rebuilt from the source table (see
+        SourceTable.toJSON), in which case `self.json_normalized` is True.
+        """
+        if self.json_data == None:
+            if self.json_text != None:
+                self.json_data = json.loads(bytes(self.json_text))
+                self.json_text = None
+            else:
+                catalogs = {}
+                for i in sorted(self.catalogs):
+                    catalogs[str(i)] = dict((field, getattr(self.catalogs[i], field)) for field in snapshot.catalog_fields)
+                self.json_data = {u'sources': self.table.toJSON(), u'catalogs': catalogs}
+                self.json_normalized = True
+
+        return self.json_data
+
+    @json.setter
+    def json(self, data):
+        self.json_data = data
+        self.json_text = None
+        self.json_normalized = False
+
+    def validate(self, table=None, observatory_names=None, source_type_names=None):
+        """
+        Checks the source table (the current one by default) and returns the
+        list of Diagnostic records. Depending on `self.validation`, nothing
+        is checked ('off'), a TeVCatWarning is issued ('warn') or
+        ValidationError is raised ('strict') if problems are found.
+        Unknown observatories and source types are added to
+        `observatory_names` and `source_type_names` (by default
+        `self.observatory_names` and `self.source_type_names`).
+        """
+        table = self.table if table == None else table
+        observatory_names = self.observatory_names if observatory_names == None else observatory_names
+        source_type_names = self.source_type_names if source_type_names == None else source_type_names
+        if self.validation == 'off':
+            return []
+
+        with self.load_stats.stage('validate', objects=len(table)) as span:
+            diagnostics = validation.validate(table, observatory_names, source_type_names)
+            span.set(problems=len(diagnostics))
+        validation.handle(diagnostics, self.validation)
+
+        return diagnostics
+
+    def setCatalogs(self, catalogs):
+        """
+        Sets the catalogs from the 'catalogs' dictionary of the JSON data
+        """
         self.catalogs = {}
-        for key in list(self.json[u'catalogs'].keys()):
-            self.catalogs[int(key)] = Catalog(self.json[u'catalogs'][key])
+        for key in list(catalogs.keys()):
+            self.catalogs[int(key)] = Catalog(catalogs[key])
+
+    def setTable(self, table):
+        """
+        Replaces the source table, and resets the sources and the indices
+        derived from it
+        """
+        self.table = table
+        self.sources = None # created on first use by getSources()
+        self.spatial_indices = {}
+        self.search_index = None
+        self.bitmap_indices = {}
+        self.groups = {}
+        self.selections = {}
+
+    def copy(self):
+        """
+        Returns a new TeVCat sharing the data with this one. Tables are never
+        modified in place, so refreshing the copy does not affect this one.
+        """
+        tevcat = self.__class__.__new__(self.__class__)
+        tevcat.cache_dir = self.cache_dir
+        tevcat.ttl = self.ttl
+        tevcat.load_stats = self.load_stats
+        tevcat.validation = self.validation
+        tevcat.diagnostics = self.diagnostics
+        tevcat.observatory_names = dict(self.observatory_names)
+        tevcat.source_type_names = dict(self.source_type_names)
+        tevcat.version = self.version
+        tevcat.json_data = self.json_data
+        tevcat.json_text = self.json_text
+        tevcat.json_normalized = self.json_normalized
+        tevcat.catalogs = dict(self.catalogs)
+        tevcat.setTable(self.table.copy())
+
+        return tevcat
+
+    def share(self, name=None):
+        """
+        Publishes the database into shared memory and returns the
+        SharedCatalog, whose `handle` is passed to tevcat.shared.attach() in
+        worker processes.
+        """
+        return shared.SharedCatalog(self, name)
+
+    def __reduce__(self):
+        """
+        Pickles the columns instead of the Source and SkyCoord objects
+        """
+        return (shared.importState, (self.__class__, shared.exportState(self)))
+
+    def refresh(self, version=None, data=None):
+        """
+        Updates the database to the latest TeVCat data and returns a ChangeSet.
+        The data are downloaded (revalidating the cache, if any) unless
+        `version` and decoded JSON `data` are given. Only the added and the
+        modified sources are parsed again, and the rows of the other sources
+        are reused. The positional and text indices are rebuilt on next use.
+        The stages are recorded in a new `self.load_stats`.
+        """
+        stats = LoadStats('refresh')
+        if data == None:
+            use_cache = self.cache_dir != None
+            cache = self.download(self.readCache() if use_cache else None, use_cache, stats)
+            version, data = cache[u'version'], cache[u'json']
+
+        diff = stats.stage('diff', objects=len(data[u'sources']))
+        old_ids = dict((int(source[u'id']), i) for i, source in enumerate(self.json[u'sources']))
+        new_ids = set()
+
+        added = []
+        modified = {}
+        parsed = [] # JSON entries to be parsed again
+        from_new = numpy.zeros(len(data[u'sources']), dtype=bool)
+        indices = numpy.zeros(len(data[u'sources']), dtype=numpy.intp)
+
+        for i, source in enumerate(data[u'sources']):
+            source_id = int(source[u'id'])
+            new_ids.add(source_id)
+            try:
+                old = self.json[u'sources'][old_ids[source_id]]
+            except KeyError:
+                added.append(source_id)
+            else:
+                # the old entries rebuilt from the table are compared in the
+                # same normalized form
+                entry = sourceEntry(parseSource(source)) if self.json_normalized else source
+                if old == entry:
+                    indices[i] = old_ids[source_id]
+                    continue
+
+                changes = {}
+                for key in set(old.keys()) | set(entry.keys()):
+                    if old.get(key) != entry.get(key):
+                        changes[key] = (old.get(key), entry.get(key))
+                modified[source_id] = changes
+
+            from_new[i] = True
+            indices[i] = len(parsed)
+            parsed.append(source)
+
+        removed = [source_id for source_id in old_ids if source_id not in new_ids]
+
+        changes = ChangeSet(self.version, version, added, removed, modified)
+        diff.set(changed=len(changes))
+        diff.finish()
+
+        table = SourceTable(parsed, stats)
+        # The names are registered in copies, so that nothing is changed if
+        # the validation fails in the 'strict' mode
+        observatory_names = dict(self.observatory_names)
+        source_type_names = dict(self.source_type_names)
+        load_stats, self.load_stats = self.load_stats, stats
+        try:
+            diagnostics = self.validate(table, observatory_names, source_type_names)
+        except Exception:
+            self.load_stats = load_stats
+            raise
+        self.diagnostics = mergeDiagnostics(self.diagnostics, diagnostics, from_new, indices)
+        self.observatory_names = observatory_names
+        self.source_type_names = source_type_names
+        self.version = version
+        self.json = data
+        self.setCatalogs(data[u'catalogs'])
+        with stats.stage('merge', objects=len(from_new)):
+            table = self.table.merge(table, from_new, indices)
+            table.stats = stats
+        with stats.stage('sources', objects=len(table)):
+            self.setTable(table)
+
+        return changes
+
+    def download(self, cache=None, use_cache=True, stats=None):
+        """
+        Downloads the HTML data from the TeVCat home page. If the cache is
+        given, its ETag/Last-Modified are used to revalidate it, and it is
+        returned when the page has not been modified or cannot be reached.
+        The stages are recorded in `stats` (LoadStats) if it is given.
+        """
+        if stats == None:
+            stats = LoadStats()
+
+        headers = {}
+        if cache != None:
+            if cache.get(u'etag'):
+                headers['If-None-Match'] = cache[u'etag']
+            if cache.get(u'last_modified'):
+                headers['If-Modified-Since'] = cache[u'last_modified']
+
+        import requests
+
+        try:
+            with stats.stage('request', url=self.url) as span:
+                response = getSession().get(self.url, headers=headers, stream=True)
+                span.set(status=response.status_code)
+            try:
+                if response.status_code == 304 and cache != None:
+                    cache[u'fetched'] = time.time()
+                else:
+                    response.raise_for_status()
+                    version, data = parsePage(response.iter_lines(chunk_size=65536), stats)
+                    # The rest of the page after the data is short, and it is
+                    # read so that the connection returns to the pool instead
+                    # of being closed by response.close()
+                    with stats.stage('drain'):
+                        response.raw.drain_conn()
+                    cache = {u'version': version,
+                             u'json': data,
+                             u'etag': response.headers.get('ETag'),
+                             u'last_modified': response.headers.get('Last-Modified'),
+                             u'fetched': time.time()}
+            finally:
+                response.close()
+        except requests.exceptions.RequestException as e:
+            if cache == None:
+                raise
+            print('Cannot connect to %s. The cached data (version %s) will be used.' % (self.url, cache[u'version']))
+            print(e)
+            return cache
+
+        if use_cache:
+            with stats.stage('write_cache'):
+                self.writeCache(cache)
+
+        return cache
+
+    def getCachePath(self):
+        """
+        Returns the path to the cache file.
+        """
+        return os.path.join(self.cache_dir, self.cache_file)
+
+    def readCache(self):
+        """
+        Returns the cached data, or None if no valid cache is found.
+        """
+        try:
+            with open(self.getCachePath()) as f:
+                cache = json.load(f)
+            cache[u'version'], cache[u'json'], cache[u'fetched']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+        return cache
+
+    def writeCache(self, cache):
+        """
+        Writes the data to the cache file. The file is replaced atomically so
+        that other processes never read a partially written cache.
+        """
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.tevcat-', suffix='.json')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp, self.getCachePath())
+        except (IOError, OSError) as e:
+            print('Cannot write the TeVCat cache in %s' % self.cache_dir)
+            print(e)
+
+    def save(self, path):
+        """
+        Saves the current data as a JSON snapshot, which can be loaded by
+        TeVCat.from_file().
+        """
+        with open(path, 'w') as f:
+            json.dump({u'version': self.version, u'json': self.json}, f)
 
     def getCatalog(self, i):
         """
@@ -107,8 +600,333 @@ class TeVCat(object):
         """
         Returns the list of sources.
         """
+        if self.sources == None:
+            self.sources = [Source(self, i) for i in range(len(self.table))]
+
         return self.sources
 
+    def getTable(self):
+        """
+        Returns the columnar source table.
+        """
+        return self.table
+
+    def precompute_frames(self, frames=('icrs', 'fk4', 'galactic')):
+        """
+        Transforms the positions of all the sources into the given frames with
+        one vectorized transformation per frame. Source.getICRS(), getFK4()
+        and getGalactic() then only read the results.
+        """
+        self.table.precomputeFrames(frames)
+
+    def getSourcesByIndex(self, indices):
+        """
+        Returns the list of sources at the given indices.
+        """
+        sources = self.getSources()
+        return [sources[i] for i in indices]
+
+    def getBitmapIndex(self, name):
+        """
+        Returns the bitmap index of a categorical column. It is built on first
+        call and rebuilt when the catalog is reloaded.
+        """
+        try:
+            return self.bitmap_indices[name]
+        except KeyError:
+            if self.table.kinds.get(name) == 'category':
+                index = BitmapIndex.fromCodes(*self.table.getCodes(name))
+            else:
+                index = BitmapIndex(self.table[name])
+            self.bitmap_indices[name] = index
+            return index
+
+    def getGroups(self, name):
+        """
+        Returns {value: sorted indices of the sources} of a categorical
+        column, e.g. 'catalog_id', 'source_type' or 'discoverer' (null values
+        are under None). It is built on first call and rebuilt when the
+        catalog is reloaded.
+        """
+        try:
+            return self.groups[name]
+        except KeyError:
+            groups = {}
+            for key, bitmap in self.getBitmapIndex(name).bitmaps.items():
+                indices = numpy.nonzero(bitmap)[0]
+                indices.setflags(write=False)
+                groups[key] = indices
+            self.groups[name] = groups
+            return groups
+
+    def select(self, mask=False, **groups):
+        """
+        Returns the sorted indices of the sources in the given groups, e.g.
+          select(catalog={'Default Catalog', 'Newly Announced'}, source_type_name='PWN')
+        Each keyword is a categorical column (or 'catalog' for catalog names)
+        and a value or a set of values. The groups of one column are united,
+        and those of different columns are intersected. The results are
+        cached until the catalog is reloaded. If `mask` is True, a boolean
+        array is returned instead.
+        """
+        key = tuple(sorted((name, frozenset(values) if isSet(values) else frozenset([values])) for name, values in groups.items()))
+        try:
+            indices = self.selections[key]
+        except KeyError:
+            selected = []
+            for name, values in key:
+                if name == 'catalog':
+                    name, values = 'catalog_id', [i for i, catalog in self.catalogs.items() if catalog.getName() in values]
+                column_groups = self.getGroups(name)
+                selected.append(union([column_groups[categoryKey(value)] for value in values if categoryKey(value) in column_groups]))
+
+            indices = numpy.arange(len(self.table)) if len(selected) == 0 else intersection(selected)
+            indices.setflags(write=False)
+            if len(self.selections) >= 64:
+                self.selections.clear()
+            self.selections[key] = indices
+
+        if mask:
+            selection = numpy.zeros(len(self.table), dtype=bool)
+            selection[indices] = True
+            return selection
+        else:
+            return indices
+
+    def query(self, **predicates):
+        """
+        Returns a QueryResult of the sources satisfying all the predicates,
+        given as column=value pairs. A value is
+          - a (min, max) tuple for a range (inclusive, None for no limit),
+          - a set or a list for membership,
+          - a callable which takes the column values and returns a mask, or
+          - any other value for equality.
+        catalog='Default Catalog' (or a set of names) selects catalogs by name,
+        discovered=(first year, last year) selects the discovery dates, and
+        search='...' matches the names as TeVCat.search(). For example,
+          query(source_type_name={'PWN', 'SNR'}, flux=(0.1, None), glat=(-5, 5))
+        Categorical columns use bitmap indices, and the other predicates are
+        evaluated only on the sources remaining after them.
+        """
+        return QueryResult(self, evaluate(self, **predicates))
+
+    def getSearchIndex(self):
+        """
+        Returns the full-text search index of the sources. It is built on
+        first call and rebuilt when the catalog is reloaded.
+        """
+        if self.search_index == None:
+            self.search_index = SearchIndex(self.table)
+
+        return self.search_index
+
+    def search(self, query, prefix=False, mask=False):
+        """
+        Returns the indices of the sources whose canonical name, other names,
+        TeVCat name, source type name or observatory name contain `query`
+        (case insensitive). If `prefix` is True, only words starting with
+        `query` are matched. If `mask` is True, a boolean array is returned
+        instead.
+        """
+        if mask:
+            return self.getSearchIndex().mask(query, prefix)
+        else:
+            return self.getSearchIndex().search(query, prefix)
+
+    def getSpatialIndex(self, frame='fk5'):
+        """
+        Returns the spatial index of the source positions in the given frame.
+        It is built on first call and rebuilt when the catalog is reloaded.
+        """
+        try:
+            return self.spatial_indices[frame]
+        except KeyError:
+            index = SpatialIndex(*self.table.getFrame(frame))
+            self.spatial_indices[frame] = index
+            return index
+
+    def cone_search(self, coord, radius):
+        """
+        Returns the indices of the sources within `radius` from `coord`,
+        sorted by separation. `coord` is a SkyCoord or an (RA, Dec) pair in
+        degrees (J2000), and `radius` is an angle or a number in degrees.
+        """
+        frame, lon, lat = skyPosition(coord)
+        return self.getSpatialIndex(frame).coneSearch(lon, lat, toDegrees(radius))[0]
+
+    def nearest(self, coord, k=1):
+        """
+        Returns the indices of the k sources nearest to `coord`, sorted by
+        separation.
+        """
+        frame, lon, lat = skyPosition(coord)
+        return self.getSpatialIndex(frame).nearest(lon, lat, k)[0]
+
+    def within_extent(self, coord):
+        """
+        Returns the indices of the extended sources whose extent contains
+        `coord`, sorted by separation. The extent is approximated by a circle
+        of radius max(size_x, size_y).
+        """
+        extent = numpy.maximum(self.table['size_x'], self.table['size_y'])
+        if len(extent) == 0 or not numpy.nanmax(extent) > 0:
+            return numpy.zeros(0, dtype=numpy.intp)
+
+        frame, lon, lat = skyPosition(coord)
+        indices, separation = self.getSpatialIndex(frame).coneSearch(lon, lat, numpy.nanmax(extent))
+        extent = extent[indices]
+
+        return indices[(extent > 0) & (separation <= extent)]
+
+    def crossmatch(self, ra, dec=None, radius=0.1, frame='fk5', extended=False, chunk_size=None, processes=None):
+        """
+        Cross-matches a list of positions against the sources. The positions
+        are given as longitude/latitude arrays (deg) in `frame` (`ra`, `dec`)
+        or as a SkyCoord array (`ra`). Pairs within `radius` (an angle or a
+        number in degrees) are returned as arrays of
+        (input_index, source_index, separation [deg]), sorted by input index
+        and separation.
+
+        If `extended` is True, max(size_x, size_y) of each source is added to
+        the radius. Each position is compared only with the sources in its
+        latitude zone of the spatial index. The positions are transformed and
+        matched in chunks of `chunk_size`, whose candidate pairs are further
+        split to bound the memory usage, and the chunks are distributed over
+        `processes` worker processes if it is given.
+        """
+        if dec is None:
+            coord = ra
+            name = coord.frame.name
+            if not (name in ('icrs', 'galactic') or (name == 'fk5' and coord.frame.equinox.jyear == 2000.)):
+                name = 'fk5'
+            frame = name
+            length = len(coord)
+        else:
+            coord = None
+            ra = numpy.atleast_1d(numpy.asarray(toDegrees(ra), dtype=numpy.float64))
+            dec = numpy.atleast_1d(numpy.asarray(toDegrees(dec), dtype=numpy.float64))
+            length = len(ra)
+
+        radius = numpy.full(len(self.table), toDegrees(radius), dtype=numpy.float64)
+        if extended:
+            radius += numpy.maximum(self.table['size_x'], self.table['size_y'])
+        index = self.getSpatialIndex(frame)
+
+        if chunk_size == None:
+            # the memory of the candidate pairs is bounded by crossmatchChunk
+            chunk_size = 2**16
+
+        def chunks():
+            for start in range(0, length, chunk_size):
+                if coord is None:
+                    lon, lat = ra[start:start + chunk_size], dec[start:start + chunk_size]
+                else:
+                    spherical = coord[start:start + chunk_size].transform_to(frame).spherical
+                    lon, lat = spherical.lon.degree, spherical.lat.degree
+                yield lon, lat, start
+
+        if processes == None or processes <= 1:
+            results = [crossmatchChunk(lon, lat, start, index, radius) for lon, lat, start in chunks()]
+        else:
+            import collections
+            import concurrent.futures
+
+            # The sources are sent once per worker, and the chunks only carry
+            # the input positions. At most two chunks per worker are in
+            # flight, so that the inputs are transformed as they are consumed.
+            results = []
+            pending = collections.deque()
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=initCrossmatchWorker,
+                                                        initargs=(index, radius)) as executor:
+                for args in chunks():
+                    pending.append(executor.submit(crossmatchWorkerChunk, args))
+                    if len(pending) >= 2*processes:
+                        results.append(pending.popleft().result())
+                while pending:
+                    results.append(pending.popleft().result())
+
+        if len(results) == 0:
+            return numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0, dtype=numpy.intp), numpy.zeros(0, dtype=numpy.float64)
+
+        return tuple(numpy.concatenate(arrays) for arrays in zip(*results))
+
+def mergeDiagnostics(old, new, from_new, indices):
+    """
+    Returns the diagnostics of a table merged by SourceTable.merge(). Those of
+    the rows taken from the old table (`old`) are kept, and the row indices of
+    both `old` and `new` (those of the table of the parsed sources) are
+    changed to the rows of the merged table.
+    """
+    from_new = numpy.asarray(from_new, dtype=bool)
+    indices = numpy.asarray(indices, dtype=numpy.intp)
+    kept = numpy.nonzero(~from_new)[0]
+    old_rows = {}
+    for row, old_row in zip(kept, indices[kept]):
+        old_rows[int(old_row)] = int(row)
+    new_rows = numpy.nonzero(from_new)[0]
+
+    merged = []
+    for diagnostic in old:
+        if diagnostic.index in old_rows:
+            # copied since the old list may still be used by another snapshot
+            diagnostic = copy.copy(diagnostic)
+            diagnostic.index = old_rows[diagnostic.index]
+            merged.append(diagnostic)
+    for diagnostic in new:
+        if diagnostic.index != None:
+            diagnostic.index = int(new_rows[diagnostic.index])
+        merged.append(diagnostic)
+    merged.sort(key=lambda diagnostic: -1 if diagnostic.index == None else diagnostic.index)
+
+    return merged
+
+class ChangeSet(object):
+    """
+    Differences between two versions of the database, returned by
+    TeVCat.refresh()
+    """
+    def __init__(self, old_version, new_version, added, removed, modified):
+        self.old_version = old_version
+        self.new_version = new_version
+        self.added       = added # IDs of the added sources
+        self.removed     = removed # IDs of the removed sources
+        self.modified    = modified # {ID: {field: (old value, new value)}}
+
+    def getAdded(self):
+        """
+        Returns the list of the IDs of the added sources.
+        """
+        return self.added
+
+    def getRemoved(self):
+        """
+        Returns the list of the IDs of the removed sources.
+        """
+        return self.removed
+
+    def getModified(self):
+        """
+        Returns {ID: {field: (old value, new value)}} of the modified sources.
+        """
+        return self.modified
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.modified)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __str__(self):
+        s = ''
+        s += 'Version:\t%s -> %s\n' % (self.old_version, self.new_version)
+        s += 'Added:\t%d\n' % len(self.added)
+        s += 'Removed:\t%d\n' % len(self.removed)
+        s += 'Modified:\t%d' % len(self.modified)
+        for source_id in sorted(self.modified):
+            s += '\n\t%d: %s' % (source_id, ', '.join(sorted(self.modified[source_id].keys())))
+
+        return s
+
 class Catalog(object):
     def __init__(self, catalog):
         self.id          = int(catalog[u'id'])
@@ -117,6 +935,12 @@ class Catalog(object):
         self.public      = str(catalog[u'public']) # for what? always 1
         self.name        = str(catalog[u'name'])
 
+    def __reduce__(self):
+        """
+        Pickles the fields as the dictionary taken by __init__()
+        """
+        return (Catalog, (dict((field, getattr(self, field)) for field in snapshot.catalog_fields),))
+
     def getID(self):
         """
         Returns the ID number of the catalog.
@@ -142,112 +966,561 @@ class Catalog(object):
 
         return s
 
-class Source(object):
-    def __init__(self, source, tevcat):
+class ReleasedColumns(dict):
+    """
+    The columns of a table after SourceTable.release(), which raises
+    ValueError for any column
+    """
+    def __init__(self, message):
+        dict.__init__(self)
+        self.message = message
+
+    def __missing__(self, name):
+        raise ValueError(self.message)
+
+class SourceTable(object):
+    """
+    Columnar storage of all the TeVCat sources. Every field is held in a NumPy
+    array with one element per source. Missing (null) values of numerical
+    fields are stored as NaN.
+    """
+    # (field name, kind) in the order of the TeVCat JSON data
+    # 'int'      : int64, must not be null
+    # 'optint'   : float64, NaN if null, returned as int
+    # 'float'    : float64, NaN if null
+    # 'str'      : str() of the JSON value (null becomes 'None')
+    # 'category' : same as 'str', but one object per distinct value
+    # 'optstr'   : str or None
+    # 'raw'      : JSON value as is
+    # 'bool'     : bool
+    fields = (('canonical_name',   'str'),
+              ('observatory_name', 'category'),
+              ('discoverer',       'optint'),
+              ('variability',      'optint'),
+              ('image',            'category'), # No use. URL of marker
+              ('size_x',           'float'),
+              ('size_y',           'float'),
+              ('owner',            'optint'), # for what?
+              ('id',               'int'),
+              ('discovery_date',   'optint'), # yyyymm
+              ('other_names',      'raw'),
+              ('marker_id',        'raw'), # No use? always None
+              ('public',           'int'), # No use? always 1
+              ('spec_idx',         'float'),
+              ('private_notes',    'raw'),
+              ('catalog_name',     'str'), # in format of TeV JXXXX+/-XXX
+              ('greens_cat',       'category'), # Green's cagalog
+              ('source_type',      'int'),
+              ('src_rank',         'optint'), # for what?
+              ('coord_type',       'raw'), # No use? always null or 0
+              ('source_type_name', 'category'),
+              ('distance',         'float'),
+              ('coord_ra',         'str'), # hh mm ss (J2000)
+              ('coord_dec',        'str'), # dd mm ss (J2000)
+              ('notes',            'raw'),
+              ('distance_mod',     'optstr'),
+              ('flux',             'float'),
+              ('ext',              'bool'),
+              ('catalog_id',       'int'),
+              ('eth',              'float'))
+
+    # coordinate columns in degrees, derived from coord_ra and coord_dec
+    coordinates = ('ra', 'dec')
+
+    # columns computed on first access, (frame, 0 for longitude/1 for latitude)
+    lazy_columns = {'glon': ('galactic', 0),
+                    'glat': ('galactic', 1)}
+
+    dtypes = {'int':      numpy.int64,
+              'optint':   numpy.float64,
+              'float':    numpy.float64,
+              'str':      object,
+              'category': object,
+              'optstr':   object,
+              'raw':      object,
+              'bool':     numpy.bool_}
+
+    def __init__(self, sources, stats=None):
+        """
+        Build all the columns from the list of JSON source entries in one pass.
+        The stages are recorded in `stats` (LoadStats) if it is given.
+        """
+        self.stats = LoadStats() if stats == None else stats
+        self.parse_errors = [] # Diagnostic records of the values which cannot be parsed
+        values = dict((name, []) for name, kind in self.fields)
+
+        with self.stats.stage('parse_sources', objects=len(sources)):
+            for i, source in enumerate(sources):
+                row = parseSource(source, self.parse_errors, i)
+                for name, kind in self.fields:
+                    values[name].append(row[name])
+
+        span = self.stats.stage('columns', objects=len(self.fields))
+        columns = {}
+        for name, kind in self.fields:
+            if self.dtypes[kind] is object:
+                column = numpy.empty(len(values[name]), dtype=object)
+                column[:] = values[name]
+            else:
+                column = numpy.array(values[name], dtype=self.dtypes[kind])
+            columns[name] = column
+        span.finish()
+
+        # Parse all the coordinates at once
+        with self.stats.stage('coordinates', objects=len(sources)):
+            hms = [ra.strip().replace(' ', ':') for ra in columns['coord_ra']]
+            dms = [dec.strip().replace(' ', ':') for dec in columns['coord_dec']]
+            if len(hms) > 0:
+                from astropy.coordinates import SkyCoord
+
+                fk5 = SkyCoord(hms, dms, frame='fk5', unit=('hourangle', 'deg'))
+                columns['ra'] = numpy.asarray(fk5.ra.degree, dtype=numpy.float64)
+                columns['dec'] = numpy.asarray(fk5.dec.degree, dtype=numpy.float64)
+            else:
+                for name in self.coordinates:
+                    columns[name] = numpy.zeros(0, dtype=numpy.float64)
+
+        self.setColumns(columns)
+
+    @classmethod
+    def fromColumns(cls, columns, frames=None, stats=None, encoded=None):
         """
-        Initialize source parameters with JSON data
+        Returns a table made of existing columns, which must include all the
+        fields and the 'ra' and 'dec' columns. `frames` may give (lon, lat)
+        arrays already computed in other frames. Raw columns may be given
+        instead in `encoded` as arrays of JSON text, which are decoded on
+        first access.
         """
-        self.tevcat = tevcat
+        table = cls.__new__(cls)
+        table.stats = LoadStats() if stats == None else stats
+        table.parse_errors = []
+        table.setColumns(columns, frames, encoded)
 
-        self.canonical_name = str(source[u'canonical_name'])
+        return table
 
-        self.observatory_name = str(source[u'observatory_name'])
-        if self.observatory_name == 'None':
-            pass
-        elif self.observatory_name not in list(observatory_names.values()):
-            print('Unknown observatory name found in %s: ' % self.canonical_name, self.observatory_name)
-        
-        try:
-            self.discoverer = int(source[u'discoverer'])
-            try:
-                if observatory_names[self.discoverer] != self.observatory_name:
-                    print('"discoverer" (%d) does not match with "observatory_name" (%s)' % (self.discoverer, self.observatory_name))
-            except:
-                print('Cannot find the discoverer "%s" (%d) of %s in tevcat_all.py, but will add it in the dictionary.' % (self.observatory_name, self.discoverer, self.canonical_name))
-                print('Please make an issue report on GitHub.')
-                observatory_names[self.discoverer] = self.observatory_name
-        except:
-            if source[u'discoverer'] == None:
-                pass
-            else:
-                print('Unknown "discoverer" ID found in %s:' % self.canonical_name, source[u'discoverer'])
-            self.discoverer = None
+    def copy(self):
+        """
+        Returns a table sharing the column arrays with this one, but with its
+        own caches of computed coordinates and codes and its own statistics
+        """
+        table = self.__class__.__new__(self.__class__)
+        table.__dict__.update(self.__dict__)
+        table.stats = LoadStats(self.stats.name)
+        table.stats.spans = list(self.stats.spans)
+        table.parse_errors = list(self.parse_errors)
+        table.columns = dict(self.columns)
+        table.encoded = dict(self.encoded)
+        table.codes = dict(self.codes)
+        table.kinds = dict(self.kinds)
+        table.frames = dict(self.frames)
+        table.hmsdms = None if self.hmsdms == None else list(self.hmsdms)
+
+        return table
+
+    def setColumns(self, columns, frames=None, encoded=None):
+        """
+        Sets the columns and forgets the coordinates computed so far.
+        Categorical columns are made to share one string object per value.
+        `encoded` is as in fromColumns().
+        """
+        for name, kind in self.fields:
+            if kind == 'category':
+                columns[name] = internColumn(columns[name])
+        self.columns = columns
+        self.encoded = {} if encoded == None else encoded # name -> JSON text of a raw column
+        self.codes = {}
+
+        self.kinds = dict(self.fields)
+        for name in self.coordinates + tuple(self.lazy_columns.keys()):
+            self.kinds[name] = 'float'
+
+        self.frames = {'fk5': (self.columns['ra'], self.columns['dec'])}
+        if frames != None:
+            self.frames.update(frames)
+        self.hmsdms = None
+
+    def merge(self, other, from_other, indices):
+        """
+        Returns a new table whose i-th row is the indices[i]-th row of `other`
+        if from_other[i] is True, and that of this table otherwise. The
+        frames already computed for this table are kept, and computed for
+        the rows taken from `other`.
+        """
+        from_other = numpy.asarray(from_other, dtype=bool)
+        indices = numpy.asarray(indices, dtype=numpy.intp)
+        mine = ~from_other
+
+        def pick(a, b):
+            column = numpy.empty(len(indices), dtype=a.dtype)
+            column[mine] = a[indices[mine]]
+            column[from_other] = b[indices[from_other]]
+            return column
+
+        other.precomputeFrames(list(self.frames.keys()))
+
+        columns = {}
+        for name in [name for name, kind in self.fields] + list(self.coordinates):
+            columns[name] = pick(self[name], other[name])
+
+        frames = {}
+        for frame in self.frames:
+            if frame != 'fk5':
+                frames[frame] = (pick(self.frames[frame][0], other.frames[frame][0]),
+                                 pick(self.frames[frame][1], other.frames[frame][1]))
+
+        table = SourceTable.fromColumns(columns, frames)
+
+        if self.hmsdms != None:
+            hmsdms = pick(numpy.array(self.getHMSDMS(), dtype=object),
+                          numpy.array(other.getHMSDMS(), dtype=object))
+            table.hmsdms = list(hmsdms)
+
+        return table
 
-        self.variability = None if source[u'variability'] == None else int(source[u'variability'])
-        if self.variability not in (None, 0, 1, 2):
-            print('Unknown variability type found in %s' % self.canonical_name)
+    def __len__(self):
+        return len(self.columns['id'])
 
-        self.image = str(source[u'image']) # No use. URL of marker
+    def __getitem__(self, name):
+        """
+        Returns a column as a NumPy array.
+        """
+        if name not in self.columns:
+            if name in self.encoded:
+                column = numpy.empty(len(self.encoded[name]), dtype=object)
+                column[:] = [json.loads(text) for text in self.encoded[name]]
+                self.columns[name] = column
+            elif name in self.lazy_columns:
+                frame, axis = self.lazy_columns[name]
+                self.columns[name] = self.getFrame(frame)[axis]
 
-        self.size_x = 0. if source[u'size_x'] == None else float(source[u'size_x'])
-        self.size_y = 0. if source[u'size_y'] == None else float(source[u'size_y'])
+        return self.columns[name]
 
-        self.owner = None if source[u'owner'] == None else int(source[u'owner']) # for what?
-        if self.owner not in (None, 1, 2):
-            print('Unknown owner type found')
+    def __contains__(self, name):
+        return name in self.columns or name in self.encoded or name in self.lazy_columns
 
-        self.id = int(source[u'id'])
+    def keys(self):
+        """
+        Returns the list of the column names.
+        """
+        return (list(self.columns.keys()) + [name for name in self.encoded if name not in self.columns] +
+                [name for name in self.lazy_columns if name not in self.columns])
 
-        self.discovery_date = None if source[u'discovery_date'] == None else int(source[u'discovery_date'].replace('/', ''))
-        if self.discovery_date != None and ((not (1 <= self.discovery_date%100 <= 12)) or not (1987 <= self.discovery_date/100)):
-            print('Invalid date format found: %d' % self.discovery_date)
+    def toJSON(self):
+        """
+        Returns the list of the JSON source entries of all the rows. The
+        values are in the form normalized by parseSource(), e.g. numbers given
+        as strings are returned as numbers (see sourceEntry).
+        """
+        names = [name for name, kind in self.fields]
+        values = [self[name].tolist() for name in names]
 
-        self.other_names = source[u'other_names']
+        return [sourceEntry(dict(zip(names, row))) for row in zip(*values)]
 
-        self.marker_id = source[u'marker_id'] # No use? always None
+    def getCodes(self, name):
+        """
+        Returns (codes, categories) of a categorical column, where
+        categories[codes[i]] is the value of the i-th source. The categories
+        are in the order of first appearance.
+        """
+        try:
+            return self.codes[name]
+        except KeyError:
+            categories = {}
+            codes = numpy.array([categories.setdefault(value, len(categories)) for value in self.columns[name]], dtype=numpy.int32)
+            self.codes[name] = (codes, list(categories))
+            return self.codes[name]
 
-        self.public = int(source[u'public']) # No use? always 1
+    def getSkyCoord(self):
+        """
+        Returns the positions of all the sources as an FK5 SkyCoord array.
+        """
+        from astropy.coordinates import SkyCoord
 
-        self.spec_idx = None if source[u'spec_idx'] == None else float(source[u'spec_idx'])
+        return SkyCoord(self.columns['ra'], self.columns['dec'], frame='fk5', unit='deg')
 
-        self.private_notes = source[u'private_notes']
+    def getFrame(self, frame):
+        """
+        Returns (longitude, latitude) arrays in degrees in the given frame.
+        The transformation is done for all the sources at once on first call.
+        """
+        if frame not in self.frames:
+            self.precomputeFrames([frame])
 
-        self.catalog_name = str(source[u'catalog_name']) # in format of TeV JXXXX+/-XXX
+        return self.frames[frame]
 
-        self.greens_cat = str(source[u'greens_cat']) # Green's cagalog
+    def precomputeFrames(self, frames):
+        """
+        Transforms the positions of all the sources into the given frames
+        (e.g. 'icrs', 'fk4', 'galactic') and keeps the results.
+        """
+        frames = [frame for frame in frames if frame not in self.frames]
+        if len(frames) == 0:
+            return
 
-        self.source_type = int(source[u'source_type'])
+        fk5 = self.getSkyCoord()
+        for frame in frames:
+            with self.stats.stage('transform_' + frame, objects=len(self)):
+                if len(self) > 0:
+                    spherical = fk5.transform_to(frame).spherical
+                    lon = numpy.asarray(spherical.lon.degree, dtype=numpy.float64)
+                    lat = numpy.asarray(spherical.lat.degree, dtype=numpy.float64)
+                else:
+                    lon = lat = numpy.zeros(0, dtype=numpy.float64)
+            self.frames[frame] = (lon, lat)
 
-        self.src_rank = None if source[u'src_rank'] == None else int(source[u'src_rank']) # for what?
+    def getHMSDMS(self):
+        """
+        Returns the list of (RA, Dec) strings in 'hmsdms' format (J2000).
+        """
+        if self.hmsdms == None:
+            if len(self) > 0:
+                self.hmsdms = list(self.getSkyCoord().to_string('hmsdms'))
+            else:
+                self.hmsdms = []
 
-        self.coord_type = source[u'coord_type'] # No use? always null or 0
+        return self.hmsdms
 
-        self.source_type_name = str(source[u'source_type_name'])
-        if self.source_type_name not in list(source_type_names.values()):
-            print('Unknown source type name found: ', self.source_type_name)
-            print(f'Adding the new source type {self.source_type} as "{self.source_type_name}"')
-            print(f'Please ask the developer to update the dictionary')
-            source_type_names[self.source_type] = self.source_type_name
-        if source_type_names[self.source_type] != self.source_type_name:
-            print('"source_type" (%d) is not consistent with "source_type_name" (%s)' % (self.source_type, self.source_type_name))
+    def release(self, message):
+        """
+        Drops all the arrays of the table, e.g. before the memory holding
+        them is unmapped. Any later use of a column raises
+        ValueError(message).
+        """
+        self.columns = ReleasedColumns(message)
+        self.encoded = {}
+        self.codes = {}
+        self.frames = {}
+        self.hmsdms = None
 
-        self.distance = None if source[u'distance'] == None else float(source[u'distance'])
+    def getValue(self, name, i):
+        """
+        Returns the value of the i-th source as a Python object. Null values
+        are returned as None.
+        """
+        if name not in self.columns and name in self.encoded:
+            # a single value of a raw column which is not decoded yet
+            return json.loads(self.encoded[name][i])
+
+        value = self.columns[name][i]
+        kind = self.kinds[name]
+        if kind == 'int':
+            return int(value)
+        elif kind == 'optint':
+            return None if numpy.isnan(value) else int(value)
+        elif kind == 'float':
+            return None if numpy.isnan(value) else float(value)
+        elif kind == 'bool':
+            return bool(value)
+        else:
+            return value
+
+def internColumn(column):
+    """
+    Returns an object array in which equal values are the same object
+    """
+    pool = {}
+    interned = numpy.empty(len(column), dtype=object)
+    interned[:] = [pool.setdefault(value, value) for value in column]
+
+    return interned
+
+def toDegrees(angle):
+    """
+    Returns an angle (astropy Angle/Quantity or a number in degrees) in degrees
+    """
+    try:
+        return angle.to_value('deg')
+    except AttributeError:
+        return angle
+
+def skyPosition(coord):
+    """
+    Returns (frame, lon, lat) of a SkyCoord or an (RA, Dec) pair in degrees
+    (FK5 J2000). Positions in the frames in which SourceTable can keep the
+    source positions are not transformed.
+    """
+    try:
+        frame = coord.frame
+    except AttributeError:
+        ra, dec = coord
+        return 'fk5', toDegrees(ra), toDegrees(dec)
+
+    if frame.name == 'fk5' and frame.equinox.jyear == 2000.:
+        name = 'fk5'
+    elif frame.name in ('icrs', 'galactic'):
+        name = frame.name
+    else:
+        coord = coord.transform_to('fk5')
+        name = 'fk5'
+
+    spherical = coord.spherical
+
+    return name, spherical.lon.degree, spherical.lat.degree
+
+def parseSource(source, errors=None, index=None):
+    """
+    Converts a JSON source entry into a dictionary of typed values following
+    SourceTable.fields. The values are checked later by
+    tevcat.validation.validate(). A discoverer which is not an integer is
+    stored as null and reported in the list `errors`, if it is given, with
+    `index` as the row of the source.
+    """
+    row = {}
+
+    row['canonical_name'] = str(source[u'canonical_name'])
+    row['observatory_name'] = str(source[u'observatory_name'])
+
+    try:
+        discoverer = int(source[u'discoverer'])
+    except:
+        if source[u'discoverer'] != None and errors != None:
+            errors.append(Diagnostic('invalid_discoverer', 'Unknown "discoverer" ID: %s' % source[u'discoverer'], 'discoverer',
+                                     source[u'discoverer'], index, source.get(u'id'), row['canonical_name']))
+        discoverer = None
+    row['discoverer'] = numpy.nan if discoverer == None else discoverer
+
+    row['variability'] = numpy.nan if source[u'variability'] == None else int(source[u'variability'])
+
+    row['image'] = str(source[u'image'])
+
+    row['size_x'] = 0. if source[u'size_x'] == None else float(source[u'size_x'])
+    row['size_y'] = 0. if source[u'size_y'] == None else float(source[u'size_y'])
+
+    row['owner'] = numpy.nan if source[u'owner'] == None else int(source[u'owner'])
+
+    row['id'] = int(source[u'id'])
+
+    row['discovery_date'] = numpy.nan if source[u'discovery_date'] == None else int(source[u'discovery_date'].replace('/', ''))
+
+    row['other_names'] = source[u'other_names']
+    row['marker_id'] = source[u'marker_id']
+    row['public'] = int(source[u'public'])
+    row['spec_idx'] = numpy.nan if source[u'spec_idx'] == None else float(source[u'spec_idx'])
+    row['private_notes'] = source[u'private_notes']
+    row['catalog_name'] = str(source[u'catalog_name'])
+    row['greens_cat'] = str(source[u'greens_cat'])
+    row['source_type'] = int(source[u'source_type'])
+    row['src_rank'] = numpy.nan if source[u'src_rank'] == None else int(source[u'src_rank'])
+    row['coord_type'] = source[u'coord_type']
+    row['source_type_name'] = str(source[u'source_type_name'])
+    row['distance'] = numpy.nan if source[u'distance'] == None else float(source[u'distance'])
+
+    row['coord_ra'] = str(source[u'coord_ra'])
+    row['coord_dec'] = str(source[u'coord_dec'])
+
+    row['notes'] = source[u'notes']
+    row['distance_mod'] = None if source[u'distance_mod'] == None else str(source[u'distance_mod'])
+
+    row['flux'] = numpy.nan if source[u'flux'] == None else float(source[u'flux'])
+    row['ext'] = bool(int(source[u'ext']))
+    row['catalog_id'] = int(source[u'catalog_id'])
+    row['eth'] = numpy.nan if source[u'eth'] == None else float(source[u'eth'])
+
+    return row
+
+def sourceEntry(row):
+    """
+    Returns the JSON source entry of a row of typed values (see
+    parseSource). Null numbers (None or NaN) become null.
+    """
+    entry = {}
+    for name, kind in SourceTable.fields:
+        value = row[name]
+        if kind in ('optint', 'float') and value != None and numpy.isnan(value):
+            value = None
+        elif kind == 'optint' and value != None:
+            value = int(value)
+        elif kind == 'bool':
+            value = int(value)
+
+        if name == 'discovery_date' and value != None:
+            value = '%04d/%02d' % (value//100, value%100)
+        entry[name] = value
+
+    return entry
+
+def _column(name):
+    """
+    Returns a read-only property which reads the column `name` of the source
+    table at the row of the source
+    """
+    def getter(self):
+        return self.table.getValue(name, self.index)
+
+    return property(getter)
 
-        coord_ra  = source[u'coord_ra']
-        coord_dec = source[u'coord_dec']
-        if coord_ra[-1] == ' ':
-            coord_ra = coord_ra[:-1]
-        if coord_dec[-1] == ' ':
-            coord_dec = coord_dec[:-1]
-        hms, dms = str(coord_ra.replace(' ', ':')), str(coord_dec.replace(' ', ':'))
-        self.fk5 = SkyCoord(hms + ' ' + dms, frame='fk5', unit=(u.hourangle, u.deg))
-        self.galactic = self.getPosition().transform_to('galactic')
-        self.glon = self.galactic.l
-        self.glat = self.galactic.b
+class Source(object):
+    """
+    A row view of SourceTable. All the source parameters are read from the
+    columns of the table.
+    """
+    __slots__ = ('tevcat', 'table', 'index', 'frames')
+
+    canonical_name   = _column('canonical_name')
+    observatory_name = _column('observatory_name')
+    discoverer       = _column('discoverer')
+    variability      = _column('variability')
+    image            = _column('image')
+    size_x           = _column('size_x')
+    size_y           = _column('size_y')
+    owner            = _column('owner')
+    id               = _column('id')
+    discovery_date   = _column('discovery_date')
+    other_names      = _column('other_names')
+    marker_id        = _column('marker_id')
+    public           = _column('public')
+    spec_idx         = _column('spec_idx')
+    private_notes    = _column('private_notes')
+    catalog_name     = _column('catalog_name')
+    greens_cat       = _column('greens_cat')
+    source_type      = _column('source_type')
+    src_rank         = _column('src_rank')
+    coord_type       = _column('coord_type')
+    source_type_name = _column('source_type_name')
+    distance         = _column('distance')
+    notes            = _column('notes')
+    distance_mod     = _column('distance_mod')
+    flux             = _column('flux')
+    ext              = _column('ext')
+    catalog_id       = _column('catalog_id')
+    eth              = _column('eth')
+
+    def __init__(self, tevcat, index):
+        """
+        Initialize the view of the index-th row of the source table
+        """
+        self.tevcat = tevcat
+        self.table = tevcat.getTable()
+        self.index = index
+        self.frames = None # SkyCoord objects created on demand
 
-        self.notes = source[u'notes']
+    def __reduce__(self):
+        """
+        Pickles the TeVCat (once per pickle) and the row index only
+        """
+        return (Source, (self.tevcat, self.index))
 
-        self.distance_mod = None if source[u'distance_mod'] == None else str(source[u'distance_mod'])
-        if self.distance_mod not in (None, 'z', 'kpc'):
-            print('Unknown distance mode found: ', self.distance_mod)
+    @property
+    def fk5(self):
+        return self.getPosition()
 
-        self.flux = None if source[u'flux'] == None else float(source[u'flux'])
+    @property
+    def galactic(self):
+        return self.getGalactic()
 
-        self.ext = bool(int(source[u'ext']))
+    @property
+    def glon(self):
+        return self.getGalactic().l
 
-        self.catalog_id = int(source[u'catalog_id'])
+    @property
+    def glat(self):
+        return self.getGalactic().b
 
-        self.eth = None if source[u'eth'] == None else float(source[u'eth'])
+    def getIndex(self):
+        """
+        Returns the row index of the source in the source table.
+        """
+        return self.index
 
     def getObservatoryName(self):
         """
@@ -355,14 +1628,31 @@ class Source(object):
         """
         Returns the celestial position of the source.
         """
-        return self.fk5
+        return self.getFrame('fk5')
+
+    def getFrame(self, frame):
+        """
+        Returns the position in the given frame. It is computed on first call
+        (for all the sources in the table at once) and cached.
+        """
+        if self.frames == None:
+            self.frames = {}
+
+        try:
+            return self.frames[frame]
+        except KeyError:
+            from astropy.coordinates import SkyCoord
+
+            lon, lat = self.table.getFrame(frame)
+            coord = SkyCoord(lon[self.index], lat[self.index], frame=frame, unit='deg')
+            self.frames[frame] = coord
+            return coord
 
     def getICRS(self):
         """
         Returns ICRS coordinates
         """
-        icrs = self.getPosition().transform_to('icrs')
-        return icrs
+        return self.getFrame('icrs')
 
     def getFK5(self):
         """
@@ -374,20 +1664,19 @@ class Source(object):
         """
         Returns FK4 coordinates (B1950)
         """
-        fk4 = self.getPosition().transform_to('fk4')
-        return fk4
+        return self.getFrame('fk4')
 
     def getGalactic(self):
         """
         Returns Galactic coordinates
         """
-        return self.galactic
+        return self.getFrame('galactic')
 
     def getHMSDMS(self):
         """
         Returns (RA, Dec) of the source in (HH:MM:SS, DD:MM:SS) format (J2000)
         """
-        return self.getPosition().to_string('hmsdms')
+        return self.table.getHMSDMS()[self.index]
 
     def getNotes(self):
         """
@@ -425,6 +1714,35 @@ class Source(object):
         """
         return self.tevcat
 
+    def asDict(self):
+        """
+        Returns the fields of __str__() as a dictionary. Missing values are
+        None, and the Galactic coordinates are in degrees.
+        """
+        l, b = self.table.getFrame('galactic')
+        ra, dec = self.getHMSDMS().split()
+        date = self.getDiscoveryDate()
+        catalog = self.getTeVCat().catalogs.get(self.catalog_id)
+
+        return {'id': self.id,
+                'canonical_name': self.canonical_name,
+                'tevcat_name': self.catalog_name,
+                'other_names': self.other_names,
+                'source_type_name': self.source_type_name,
+                'ra': ra,
+                'dec': dec,
+                'glon': float(l[self.index]),
+                'glat': float(b[self.index]),
+                'distance': self.distance,
+                'distance_mod': self.distance_mod,
+                'flux': self.flux,
+                'energy_threshold': self.eth,
+                'size_x': self.size_x,
+                'size_y': self.size_y,
+                'discovery_date': None if date == None else '%04d-%02d' % date,
+                'discovered_by': self.observatory_name,
+                'catalog': None if catalog == None else catalog.getName()}
+
     def __str__(self):
         """
         Returns summary of the source in the TeVCat format
@@ -471,356 +1789,3 @@ class Source(object):
         s += 'Discovered by:\t%s' % self.getObservatoryName()
 
         return s
-
-try:
-    import ROOT
-    rad2deg = ROOT.TMath.RadToDeg()
-    deg2rad = ROOT.TMath.DegToRad()
-except:
-    pass
-else:
-    import __main__
-    class Viewer(ROOT.TGMainFrame):
-        def __init__(self):
-            ROOT.TGMainFrame.__init__(self, 0, 10, 10, ROOT.kHorizontalFrame)
-            self.tevcat = TeVCat()
-
-            self.xsize = 1440
-            self.ysize = 720
-            self.subsize = 300
-
-            self.controls = ROOT.TGVerticalFrame(self)
-            self.AddFrame(self.controls, ROOT.TGLayoutHints(ROOT.kLHintsRight | ROOT.kLHintsExpandY, 5, 5, 5, 5))
-
-            self.main_dispatch = ROOT.TPyDispatcher(self.main_update)
-
-            # sub canvas
-            self.subCanvas = ROOT.TRootEmbeddedCanvas('subCanvas', self.controls, self.subsize, self.subsize)
-            self.subCanvas.GetCanvas().SetMargin(0, 0, 0, 0)
-            self.controls.AddFrame(self.subCanvas, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
-
-            # Source Info
-            self.info = ROOT.TGTextView(self.controls)
-            self.controls.AddFrame(self.info, ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
-
-            self.search_dispatch = ROOT.TPyDispatcher(self.sources_update)
-
-            # Search Box
-            self.search_frame = ROOT.TGHorizontalFrame(self.controls)
-            self.controls.AddFrame(self.search_frame, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
-            self.search_label = ROOT.TGLabel(self.search_frame, 'Search  ')
-            self.search_frame.AddFrame(self.search_label, ROOT.TGLayoutHints(ROOT.kLHintsCenterY))
-            self.search_box = ROOT.TGTextEntry(self.search_frame)
-            self.search_frame.AddFrame(self.search_box, ROOT.TGLayoutHints(ROOT.kLHintsCenterY | ROOT.kLHintsExpandX))
-            self.search_box.Connect("TextChanged(char*)", "TPyDispatcher", self.search_dispatch, "Dispatch()")
-
-            # Enable/disable the LAT all-sky image
-            self.name_group = ROOT.TGGroupFrame(self.controls, "Source Name Labels")
-            self.name_group.SetTitlePos(ROOT.TGGroupFrame.kCenter)
-            self.name = ROOT.TGCheckButton(self.name_group, "Show/Hide")
-            self.name.SetOn(0)
-            self.name_group.AddFrame(self.name, ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
-            self.controls.AddFrame(self.name_group, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
-            self.name.Connect("Toggled(Bool_t)", "TPyDispatcher", self.main_dispatch, "Dispatch()")
-
-            # Enable/disable the LAT all-sky image
-            self.lat_group = ROOT.TGGroupFrame(self.controls, "LAT All-sky Image")
-            self.lat_group.SetTitlePos(ROOT.TGGroupFrame.kCenter)
-            self.lat = ROOT.TGCheckButton(self.lat_group, "Show/Hide")
-            self.lat.SetOn()
-            self.lat_group.AddFrame(self.lat, ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
-            self.controls.AddFrame(self.lat_group, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
-            self.lat.Connect("Toggled(Bool_t)", "TPyDispatcher", self.main_dispatch, "Dispatch()")
-
-            # Color
-            self.color = ROOT.TGButtonGroup(self.controls, "LAT Image Color")
-            self.lat.Connect("Toggled(Bool_t)", "TGButtonGroup", self.color, "SetState(Bool_t)")
-            self.color.SetTitlePos(ROOT.TGGroupFrame.kCenter)
-            self.colorButton = (ROOT.TGRadioButton(self.color, "Color", 0),
-                                ROOT.TGRadioButton(self.color, "Gray Scale (B to W)", 1),
-                                ROOT.TGRadioButton(self.color, "Gray Scale (W to B)", 2))
-            self.color.SetButton(0)
-            self.controls.AddFrame(self.color, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
-            self.color.Connect("Pressed(Int_t)", "TPyDispatcher", self.main_dispatch, "Dispatch(Long_t)")
-
-            self.contents = ROOT.TGHorizontalFrame(self)
-            self.AddFrame(self.contents, ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
-
-            # Enable/disable the LAT all-sky image
-            self.cat_group = ROOT.TGGroupFrame(self.controls, "Catalog")
-            self.cat_group.SetTitlePos(ROOT.TGGroupFrame.kCenter)
-            self.cat_check = [ROOT.TGCheckButton(self.cat_group, "Default Catalog"),
-                              ROOT.TGCheckButton(self.cat_group, "Newly Announced"),
-                              ROOT.TGCheckButton(self.cat_group, "Other Sources"),
-                              ROOT.TGCheckButton(self.cat_group, "Source Candidates")]
-            for i in range(len(self.cat_check)):
-                if i < 2:
-                    self.cat_check[i].SetOn()
-                self.cat_check[i].Connect("Toggled(Bool_t)", "TPyDispatcher", self.main_dispatch, "Dispatch()")
-                self.cat_group.AddFrame(self.cat_check[i], ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
-            self.controls.AddFrame(self.cat_group, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
-
-            # main canvas
-            self.mainCanvas = ROOT.TRootEmbeddedCanvas('mainCanvas', self.contents, self.xsize + 4, self.ysize + 4)
-            self.mainCanvas.GetCanvas().SetMargin(0, 0, 0, 0)
-            self.contents.AddFrame(self.mainCanvas, ROOT.TGLayoutHints(ROOT.kLHintsCenterX | ROOT.kLHintsCenterY))
-
-            __main__.tevcatDummyGlobalFunction = self.sub_update
-
-            self.mainCanvas.GetCanvas().AddExec('dynamic', 'TPython::Exec("tevcatDummyGlobalFunction()");')
-            self.mainCanvas.GetCanvas().Update()
-
-            self.SetWindowName('TeVCat Viewer')
-            self.MapSubwindows()
-            self.Resize()
-            self.MapWindow()
-            self.MapRaised()
-
-            self.main_update(0)
-
-        def sub_update(self):
-            self.subCanvas.GetCanvas().Clear()
-            self.subCanvas.GetCanvas().cd()
-
-            if self.sub_image != None:
-                px = int(self.mainCanvas.GetCanvas().GetEventX())
-                py = int(self.ysize - self.mainCanvas.GetCanvas().GetEventY())
-                self.info_update(px, py)
-
-                if px - self.subsize/8 >= 0 and py - self.subsize/8 >= 0:
-                    self.sub_image.Zoom(px - int(self.subsize/8), py - int(self.subsize/8), int(self.subsize/4), int(self.subsize/4))
-                self.sub_image.SetEditable(1)
-                self.sub_image.Draw()
-
-                self.subCanvas.GetCanvas().Range((px - self.subsize/8 + 0.)/self.xsize,
-                                                 (py - self.subsize/8 + 0.)/self.ysize,
-                                                 (px + self.subsize/8 + 0.)/self.xsize,
-                                                 (py + self.subsize/8 + 0.)/self.ysize)
-
-                try:
-                    for gra in list(self.graphs.values()):
-                        gra.Draw('p same')
-                except:
-                    pass
-
-                try:
-                    for name in self.source_names_large:
-                        name.Draw()
-                except:
-                    pass
-
-                self.subCanvas.GetCanvas().Update()
-
-        def main_update(self, button = 100):
-            self.mainCanvas.GetCanvas().Clear()
-            self.mainCanvas.GetCanvas().cd()
-
-            if self.lat.IsOn():
-                if button == 0 or (button == 100 and self.color.GetButton(0).IsOn()):
-                    fname = pkg_resources.resource_filename("tevcat", "img/allsky_b.png")
-                    self.image = ROOT.TImage.Open(fname)
-                    self.sub_image = ROOT.TImage.Open(fname)
-                    self.grid_color = 0
-                elif button == 1 or (button == 100 and self.color.GetButton(1).IsOn()):
-                    fname = pkg_resources.resource_filename("tevcat", "img/allsky_gray.png")
-                    self.image = ROOT.TImage.Open(fname)
-                    self.sub_image = ROOT.TImage.Open(fname)
-                    self.grid_color = 0
-                elif button == 2 or (button == 100 and self.color.GetButton(2).IsOn()):
-                    fname = pkg_resources.resource_filename("tevcat", "img/allsky_gray_inv.png")
-                    self.image = ROOT.TImage.Open(fname)
-                    self.sub_image = ROOT.TImage.Open(fname)
-                    self.grid_color = 1
-
-                self.image.SetEditable(1)
-                self.image.Draw()
-            else:
-                self.color.SetState(False)
-                self.image = None
-                self.sub_image = None
-
-            # Draw coordinate grids
-            self.grid = []
-            for l in range(-180, 181, 30):
-                self.grid.append(ROOT.TPolyLine())
-                for b in range(-90, 91, 2):
-                    x, y = self.sky2pad(l, b)
-                    self.grid[-1].SetNextPoint(x, y)
-                self.grid[-1].Draw()
-
-            for b in range(-60, 61, 30):
-                self.grid.append(ROOT.TPolyLine())
-                for l in range(-180, 181, 2):
-                    x, y = self.sky2pad(l, b)
-                    self.grid[-1].SetNextPoint(x, y)
-
-            for grid in self.grid:
-                grid.SetLineStyle(2)
-                grid.SetLineColor(self.grid_color)
-                grid.Draw()
-
-            # Draw grid labels
-            self.label = [ROOT.TLatex(0.975, 0.5, '-180#circ'),
-                          ROOT.TLatex(0.025, 0.5, '+180#circ'),
-                          ROOT.TLatex(0.5, 0.98, '+90#circ'),
-                          ROOT.TLatex(0.5, 0.02, '-90#circ')]
-            for label in self.label:
-                label.SetTextAlign(22)
-                label.SetTextSize(0.03)
-                label.Draw()
-
-            self.copyright = ROOT.TLatex(0.99, 0.01, 'TeVCat Ver. %s' % self.tevcat.version)
-            self.copyright.SetTextAlign(31)
-            self.copyright.SetTextSize(0.03)
-            self.copyright.Draw()
-
-            self.sources_update()
-
-        def sources_update(self):
-            # Draw sources
-            self.graphs = {}
-            self.source_names = []
-            self.source_names_large = []
-
-            search = self.search_box.GetText().lower()
-
-            for source in self.tevcat.getSources():
-                useThisSource = None
-                for i in range(len(self.cat_check)):
-                    if self.cat_check[i].IsOn() and source.getCatalog().getName() == self.cat_check[i].GetTitle():
-                        useThisSource = True
-                        break
-
-                if source.__str__().lower().find(search) < 0:
-                    continue
-
-                if not useThisSource:
-                    continue
-
-                gal = source.getGalactic()
-                x, y = self.sky2pad(gal.l.degree, gal.b.degree)
-                source_type_name = source.getSourceTypeName()
-                try:
-                    self.graphs[source_type_name]
-                except:
-                    self.graphs[source_type_name] = ROOT.TGraph()
-                    self.graphs[source_type_name].SetEditable(0)
-                graph = self.graphs[source_type_name]
-                graph.SetPoint(graph.GetN(), x, y)
-                graph.Draw('p same')
-
-                # Draw source Names
-                if self.name.IsOn():
-                    self.source_names.append(ROOT.TText(x, y, '  %s' % source.getCanonicalName()))
-                    self.source_names[-1].SetTextAngle(45)
-                    self.source_names[-1].SetTextColor(self.grid_color)
-                    self.source_names[-1].SetTextSize(0.015)
-                    self.source_names[-1].SetTextAlign(12)
-                    self.source_names[-1].Draw()
-                    self.source_names_large.append(self.source_names[-1].Clone())
-                    self.source_names_large[-1].SetTextSize(0.06)
-
-            for i, gra in enumerate(self.graphs.values()):
-                gra.SetMarkerColor(int(i/4) + 2)
-                gra.SetMarkerStyle(20 + i%10)
-                gra.SetMarkerSize(1)
-
-            # Draw legend
-            self.legend = ROOT.TLegend(0., 0., 0.22, 0.18)
-            self.legend.SetNColumns(2)
-            self.legend.SetBorderSize(0)
-            self.legend.SetFillStyle(0)
-            self.legend.SetLineStyle(0)
-            for source_type in list(self.graphs.keys()):
-                self.legend.AddEntry(self.graphs[source_type], source_type, 'p')
-            self.legend.Draw()
-
-            ROOT.gPad.Modified()
-            ROOT.gPad.Update()
-
-        def info_update(self, px, py):
-            """
-            """
-            try:
-                lb = self.pad2sky((px + .5)/self.xsize, (py + .5)/self.ysize)
-            except:
-                return
-            if lb == None:
-                return
-
-            nearby_source = None
-            minimum_angsep = Angle(180*u.deg)
-
-            search = self.search_box.GetText().lower()
-
-            sources = []
-            cursor_pos = SkyCoord(lb[0], lb[1], frame='galactic', unit='deg')
-
-            for source in self.tevcat.getSources():
-                useThisSource = None
-                for i in range(len(self.cat_check)):
-                    if self.cat_check[i].IsOn() and source.getCatalog().getName() == self.cat_check[i].GetTitle():
-                        useThisSource = True
-                        break
-
-                if source.__str__().lower().find(search) < 0:
-                    continue
-
-                sources.append(source)
-
-            pos = SkyCoord(l=[s.glon for s in sources], b=[s.glat for s in sources], frame='galactic')
-            angsep = pos.separation(cursor_pos)
-            degs = angsep.degree
-            i = numpy.argmin(degs)
-            minimum_angsep = degs[i]
-            nearby_source = sources[i]
-
-            if minimum_angsep > 3.:
-                self.info.SetText(ROOT.TGText(""))
-                return
-
-            text = ROOT.TGText('')
-            info = nearby_source.__str__().replace(u'\xb0', u'') # another candidate?
-            info = str(info.replace(u'\u2212', u'-').replace(u'\u2013', u'-'))
-
-            for i, line in enumerate(info.split('\n')):
-                text.InsLine(i, line)
-            self.info.SetText(text)
-            self.info.Update()
-
-        def pad2sky(self, x, y):
-            c = 1.4142135623730951*2./math.pi
-            x_ = -((x - (1. - c)/2.)/c*4. - 2.)
-            y_ = (y - (1. - c)/2.)*2./c - 1.
-
-            gamma = (2. - (x_/2.)**2 - y_**2)**-0.5
-            theta = math.asin(y_/gamma)
-            phi = math.asin(x_/(2.*gamma*math.cos(theta)))*2.
-
-            if abs(x_) > 2.*math.cos(theta) or abs(y_) > 1.:
-                return None
-
-            l = phi*rad2deg
-
-            b = theta*rad2deg
-            return (l, b)
-
-        def sky2pad(self, l, b):
-            while l > 180.:
-                l -= 360
-
-            theta = b*deg2rad
-            phi   = l*deg2rad
-            gamma = (1 + math.cos(theta)*math.cos(phi/2.))**-0.5
-            x_ = 2*gamma*math.cos(theta)*math.sin(phi/2.)
-            y_ = gamma*math.sin(theta)
-
-            # CDELT1 = -0.25
-            # CDELT2 = +0.25
-            # AITOFF
-            # NAXIS1 = 1440
-            # NAXIS2 = 720
-            c = 1.4142135623730951*2/math.pi
-            y = (y_ + 1)/2.*c + (1 - c)/2.
-            x = (-x_ + 2)/4.*c + (1 - c)/2.
-            return x, y
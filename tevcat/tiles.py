@@ -0,0 +1,137 @@
+"""
+Multi-resolution tile pyramid of the all-sky background images
+
+Each background image is magnified by the factors in TilePyramid.zooms and
+sliced into square PNG tiles, which are cached on disk (see defaultCacheDir)
+and regenerated only when the bundled image changes. A zoom pane then needs
+only the few tiles under its window instead of rescaling the whole image.
+Tiles are generated on first use, or all at once by TilePyramid.generate().
+Pillow is needed to generate the tiles (pip install pytevcat[render]).
+"""
+import os
+import tempfile
+
+from .render import backgrounds, importPillow
+from .tevcat_all import defaultCacheDir, getResourcePath
+
+class TilePyramid(object):
+    """
+    Tiles of one background image. Tile (tx, ty) of zoom z covers the
+    magnified pixels [tx*tile_size, (tx + 1)*tile_size) x
+    [ty*tile_size, (ty + 1)*tile_size), counted from the top-left corner.
+    """
+    zooms = (1, 2, 4, 8)
+
+    def __init__(self, colormap, cache_dir=None, tile_size=256):
+        """
+        Uses the background image of `colormap` (0, 1 or 2, as in the Viewer)
+        and keeps the tiles in `cache_dir`/tiles
+        """
+        self.path = getResourcePath(backgrounds[colormap][0])
+        self.tile_size = tile_size
+        name = '%s-%d' % (os.path.splitext(os.path.basename(self.path))[0], tile_size)
+        self.cache_dir = os.path.join(defaultCacheDir() if cache_dir == None else cache_dir, 'tiles', name)
+        self.mtime = os.path.getmtime(self.path)
+        self.image = None # decoded only when a tile has to be generated
+
+        Image = importPillow().Image
+
+        with Image.open(self.path) as image:
+            self.width, self.height = image.size
+
+    def getTileCount(self, zoom):
+        """
+        Returns the number of tiles (columns, rows) at a zoom factor
+        """
+        return (-(-self.width*zoom//self.tile_size), -(-self.height*zoom//self.tile_size))
+
+    def getTilePath(self, zoom, tx, ty, generate=True):
+        """
+        Returns the path to a tile, which is generated if it is missing or
+        older than the background image. IOError is raised instead if
+        `generate` is False.
+        """
+        path = os.path.join(self.cache_dir, str(zoom), '%d_%d.png' % (ty, tx))
+        try:
+            if os.path.getmtime(path) >= self.mtime:
+                return path
+        except OSError:
+            pass
+
+        if not generate:
+            raise IOError('The tile %s has not been generated' % path)
+        self.writeTile(zoom, tx, ty, path)
+
+        return path
+
+    def writeTile(self, zoom, tx, ty, path):
+        """
+        Generates a tile by magnifying its region of the background image.
+        The file is replaced atomically so that readers never see a partial
+        tile.
+        """
+        Image = importPillow().Image
+
+        if self.image == None:
+            self.image = Image.open(self.path).convert('RGB')
+
+        # the tiles on the right and bottom edges are cut at the image size
+        width = min(self.tile_size, self.width*zoom - tx*self.tile_size)
+        height = min(self.tile_size, self.height*zoom - ty*self.tile_size)
+        x0, y0 = float(tx*self.tile_size)/zoom, float(ty*self.tile_size)/zoom
+        box = (x0, y0, x0 + float(width)/zoom, y0 + float(height)/zoom)
+        resample = Image.NEAREST if zoom == 1 else Image.BILINEAR
+        tile = self.image.resize((width, height), resample, box=box)
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tile-', suffix='.png')
+        with os.fdopen(fd, 'wb') as f:
+            tile.save(f, 'PNG')
+        os.replace(tmp, path)
+
+    def generate(self, zooms=None):
+        """
+        Generates all the missing tiles of the zoom factors (all by default)
+        """
+        for zoom in self.zooms if zooms == None else zooms:
+            nx, ny = self.getTileCount(zoom)
+            for ty in range(ny):
+                for tx in range(nx):
+                    self.getTilePath(zoom, tx, ty)
+
+    def getVisibleTiles(self, zoom, x0, y0, x1, y1, generate=True):
+        """
+        Returns the tiles overlapping a window of the background image, given
+        in the image pixels [x0, x1) x [y0, y1) from the bottom-left corner,
+        as a list of
+          (path, (left, top, width, height), (fx0, fy0, fx1, fy1))
+        where the second item is the visible part in the tile pixels (from
+        the top-left corner) and the third is its position as fractions of the
+        window (from the bottom-left corner). Parts of the window outside of
+        the image are not covered. Missing tiles are generated unless
+        `generate` is False (see getTilePath).
+        """
+        # window in the magnified pixels from the top-left corner
+        left, right = x0*zoom, x1*zoom
+        top, bottom = (self.height - y1)*zoom, (self.height - y0)*zoom
+        window_width, window_height = float(right - left), float(bottom - top)
+
+        nx, ny = self.getTileCount(zoom)
+        size = self.tile_size
+        tiles = []
+        for ty in range(max(int(top//size), 0), min(int(-(-bottom//size)), ny)):
+            for tx in range(max(int(left//size), 0), min(int(-(-right//size)), nx)):
+                cx0 = max(left, tx*size)
+                cx1 = min(right, (tx + 1)*size, self.width*zoom)
+                cy0 = max(top, ty*size)
+                cy1 = min(bottom, (ty + 1)*size, self.height*zoom)
+                if cx1 <= cx0 or cy1 <= cy0:
+                    continue
+                crop = (int(cx0 - tx*size), int(cy0 - ty*size), int(cx1 - cx0), int(cy1 - cy0))
+                fractions = ((cx0 - left)/window_width, (bottom - cy1)/window_height,
+                             (cx1 - left)/window_width, (bottom - cy0)/window_height)
+                tiles.append((self.getTilePath(zoom, tx, ty, generate), crop, fractions))
+
+        return tiles
@@ -0,0 +1,173 @@
+"""
+Checks of the parsed source table
+
+The checks run after parsing, as one vectorized pass over the columns of
+SourceTable, and return Diagnostic records instead of printing. The mode is
+one of
+  'strict' : raise ValidationError if anything is found,
+  'warn'   : issue one TeVCatWarning summarizing the diagnostics (default),
+  'off'    : skip the checks.
+The diagnostics are kept in TeVCat.diagnostics in the 'strict' and 'warn'
+modes. Observatories and source types unknown to tevcat_all.py are registered
+in the dictionaries of the TeVCat instance, never in the module-level ones.
+"""
+import warnings
+
+import numpy
+
+modes = ('strict', 'warn', 'off')
+
+variabilities = (0, 1, 2)
+owners = (1, 2)
+distance_mods = (None, 'z', 'kpc')
+
+class TeVCatWarning(UserWarning):
+    """
+    Warning about the contents of the TeVCat data
+    """
+    pass
+
+class ValidationError(ValueError):
+    """
+    Raised in the 'strict' mode. The records are in `diagnostics`.
+    """
+    def __init__(self, diagnostics):
+        self.diagnostics = diagnostics
+        lines = [str(diagnostic) for diagnostic in diagnostics[:10]]
+        if len(diagnostics) > 10:
+            lines.append('... and %d more' % (len(diagnostics) - 10))
+        ValueError.__init__(self, '%d problems found in the TeVCat data\n%s' % (len(diagnostics), '\n'.join(lines)))
+
+class Diagnostic(object):
+    """
+    One problem found in a source entry
+    """
+    def __init__(self, code, message, field, value, index=None, source_id=None, name=None):
+        self.code = code # short identifier, e.g. 'unknown_observatory'
+        self.message = message
+        self.field = field
+        self.value = value
+        self.index = index # row in the validated table
+        self.source_id = source_id
+        self.name = name # canonical name of the source
+
+    def asDict(self):
+        """
+        Returns the record as a dictionary
+        """
+        return {'code': self.code, 'message': self.message, 'field': self.field, 'value': self.value,
+                'index': self.index, 'id': self.source_id, 'name': self.name}
+
+    @classmethod
+    def fromDict(cls, record):
+        """
+        Returns a Diagnostic made of a dictionary returned by asDict()
+        """
+        return cls(record['code'], record['message'], record['field'], record['value'],
+                   record['index'], record['id'], record['name'])
+
+    def __repr__(self):
+        return 'Diagnostic(%r, %r, id=%r)' % (self.code, self.value, self.source_id)
+
+    def __str__(self):
+        return '%s (id %s): %s' % (self.name, self.source_id, self.message)
+
+def checkMode(mode):
+    """
+    Raises ValueError if `mode` is not a validation mode
+    """
+    if mode not in modes:
+        raise ValueError('Unknown validation mode: %r (must be one of %s)' % (mode, ', '.join(modes)))
+
+def optintValues(column):
+    """
+    Returns (rows, values) of the non-null elements of an 'optint' column
+    """
+    rows = numpy.nonzero(~numpy.isnan(column))[0]
+
+    return rows, column[rows].astype(numpy.int64)
+
+def validate(table, observatory_names, source_type_names):
+    """
+    Checks all the rows of a SourceTable and returns the list of Diagnostic
+    records, sorted by row. Unknown observatories and source types are added
+    to the given dictionaries (ID -> name).
+    """
+    diagnostics = list(table.parse_errors)
+
+    ids = table['id']
+    names = table['canonical_name']
+    def report(code, message, field, rows, values):
+        for row, value in zip(rows, values):
+            diagnostics.append(Diagnostic(code, message % {'value': value}, field, value,
+                                          int(row), int(ids[row]), names[row]))
+
+    # Observatory names are checked once per distinct name
+    codes, categories = table.getCodes('observatory_name')
+    known = set(observatory_names.values())
+    unknown = numpy.array([name != 'None' and name not in known for name in categories], dtype=bool)
+    rows = numpy.nonzero(unknown[codes])[0]
+    report('unknown_observatory', 'Unknown observatory name: %(value)s', 'observatory_name', rows, table['observatory_name'][rows])
+
+    # Discoverer IDs are checked once per distinct ID
+    rows, discoverers = optintValues(table['discoverer'])
+    observatories = table['observatory_name'][rows]
+    for discoverer in numpy.unique(discoverers):
+        selected = rows[discoverers == discoverer]
+        discoverer = int(discoverer)
+        if discoverer not in observatory_names:
+            name = observatories[discoverers == discoverer][0]
+            observatory_names[discoverer] = name
+            report('new_discoverer', 'Unknown discoverer ID %(value)d registered as "' + name.replace('%', '%%') + '"', 'discoverer', selected[:1], [discoverer])
+        mismatch = selected[table['observatory_name'][selected] != observatory_names[discoverer]]
+        report('discoverer_mismatch', '"discoverer" (%(value)d) does not match with "observatory_name"', 'discoverer', mismatch, [discoverer]*len(mismatch))
+
+    rows, values = optintValues(table['variability'])
+    bad = ~numpy.isin(values, variabilities)
+    report('unknown_variability', 'Unknown variability type: %(value)d', 'variability', rows[bad], values[bad])
+
+    rows, values = optintValues(table['owner'])
+    bad = ~numpy.isin(values, owners)
+    report('unknown_owner', 'Unknown owner type: %(value)d', 'owner', rows[bad], values[bad])
+
+    rows, values = optintValues(table['discovery_date'])
+    bad = ~((values%100 >= 1) & (values%100 <= 12) & (values//100 >= 1987))
+    report('invalid_date', 'Invalid date format: %(value)d', 'discovery_date', rows[bad], values[bad])
+
+    # Source types are checked once per distinct (ID, name) pair
+    source_types = table['source_type']
+    type_codes, type_names = table.getCodes('source_type_name')
+    pairs = numpy.unique(numpy.stack((source_types, type_codes.astype(numpy.int64))), axis=1)
+    known = set(source_type_names.values())
+    for source_type, code in pairs.T:
+        source_type, name = int(source_type), type_names[code]
+        selected = numpy.nonzero((source_types == source_type) & (type_codes == code))[0]
+        if name not in known:
+            report('new_source_type', 'Unknown source type name %(value)r registered as ' + str(source_type), 'source_type_name', selected[:1], [name])
+            source_type_names[source_type] = name
+            known.add(name)
+        elif source_type not in source_type_names:
+            report('new_source_type', 'Unknown source type ID %(value)d registered as "' + name.replace('%', '%%') + '"', 'source_type', selected[:1], [source_type])
+            source_type_names[source_type] = name
+        if source_type_names[source_type] != name:
+            report('source_type_mismatch', '"source_type" (%(value)d) is not consistent with "source_type_name"', 'source_type', selected, [source_type]*len(selected))
+
+    column = table['distance_mod']
+    bad = numpy.nonzero([value not in distance_mods for value in column])[0]
+    report('unknown_distance_mod', 'Unknown distance mode: %(value)s', 'distance_mod', bad, column[bad])
+
+    diagnostics.sort(key=lambda diagnostic: -1 if diagnostic.index == None else diagnostic.index)
+
+    return diagnostics
+
+def handle(diagnostics, mode):
+    """
+    Raises or warns about the diagnostics according to the mode
+    """
+    if len(diagnostics) == 0:
+        return
+    elif mode == 'strict':
+        raise ValidationError(diagnostics)
+    elif mode == 'warn':
+        warnings.warn('%d problems found in the TeVCat data, e.g. %s. See TeVCat.diagnostics.' % (len(diagnostics), diagnostics[0]),
+                      TeVCatWarning, stacklevel=3)
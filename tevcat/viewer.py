@@ -0,0 +1,566 @@
+"""
+All-sky viewer of TeVCat sources on a ROOT canvas
+"""
+import threading
+
+import __main__
+import numpy
+import ROOT
+
+# ImageCache may decode the images in a thread, and ROOT must be made thread
+# safe before any GUI object or canvas is created
+ROOT.ROOT.EnableThreadSafety()
+
+from .hitmap import buildHitMap
+from .instrument import EventStats, timed
+from .projection import aitoff_forward, aitoff_inverse, grid_lines
+from .render import markerStyles
+from .tevcat_all import TeVCat, getResourcePath
+
+class ImageCache(object):
+    """
+    Decoded all-sky background images keyed by colormap (the button ID of
+    the LAT image color). Each PNG file is decoded only once.
+    """
+    files = {0: 'img/allsky_b.png',
+             1: 'img/allsky_gray.png',
+             2: 'img/allsky_gray_inv.png'}
+
+    def __init__(self):
+        self.images = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get(self, colormap):
+        """
+        Returns (image, sub_image) of the colormap. The sub image for the
+        zoom canvas is an in-memory copy of the decoded image because
+        TImage.Zoom() changes the view of the image.
+        """
+        with self.lock:
+            try:
+                return self.images[colormap]
+            except KeyError:
+                image = ROOT.TImage.Open(getResourcePath(self.files[colormap]))
+                self.images[colormap] = (image, image.Clone(''))
+                return self.images[colormap]
+
+    def preload(self, background=True):
+        """
+        Decodes all the images. If `background` is True, it is done in a
+        separate thread.
+        """
+        if not background:
+            for colormap in self.files:
+                self.get(colormap)
+            return
+
+        self.thread = threading.Thread(target=self.preload, args=(False,))
+        self.thread.daemon = True
+        self.thread.start()
+
+class Viewer(ROOT.TGMainFrame):
+    def __init__(self, tevcat=None, preload_images=False, zoom=4):
+        """
+        `zoom` is the (integer) magnification of the sub canvas
+        """
+        ROOT.TGMainFrame.__init__(self, 0, 10, 10, ROOT.kHorizontalFrame)
+        self.tevcat = TeVCat() if tevcat == None else tevcat
+
+        # time of every GUI event handler (see tevcat.instrument)
+        self.event_stats = EventStats()
+
+        self.image_cache = ImageCache()
+        if preload_images:
+            self.image_cache.preload()
+
+        self.xsize = 1440
+        self.ysize = 720
+        self.subsize = 300
+        self.zoom = zoom
+
+        # Tiles of the background images for the sub canvas (see
+        # tevcat.tiles), generated in a background thread. A colormap is
+        # missing until its tiles are ready, and None if they cannot be made.
+        self.colormap = 0
+        self.tile_pyramids = {}
+        self.tile_thread = threading.Thread(target=self.generateTiles)
+        self.tile_thread.daemon = True
+        self.tile_thread.start()
+        self.tile_images = {} # decoded tiles keyed by path
+        self.sub_tiles = []
+        self.sub_graphs = []
+
+        self.controls = ROOT.TGVerticalFrame(self)
+        self.AddFrame(self.controls, ROOT.TGLayoutHints(ROOT.kLHintsRight | ROOT.kLHintsExpandY, 5, 5, 5, 5))
+
+        self.main_dispatch = ROOT.TPyDispatcher(self.main_update)
+
+        # sub canvas
+        self.subCanvas = ROOT.TRootEmbeddedCanvas('subCanvas', self.controls, self.subsize, self.subsize)
+        self.subCanvas.GetCanvas().SetMargin(0, 0, 0, 0)
+        self.controls.AddFrame(self.subCanvas, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
+
+        # Source Info
+        self.info = ROOT.TGTextView(self.controls)
+        self.controls.AddFrame(self.info, ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
+
+        self.filter_dispatch = ROOT.TPyDispatcher(self.sources_update)
+        self.search_dispatch = ROOT.TPyDispatcher(self.search_changed)
+
+        # Sources are redrawn when typing pauses for search_delay (ms)
+        self.search_delay = 200
+        self.search_timer = ROOT.TTimer()
+        self.search_timer.Connect("Timeout()", "TPyDispatcher", self.filter_dispatch, "Dispatch()")
+
+        # Source markers and labels kept between redraws
+        table = self.tevcat.getTable()
+        self.xs, self.ys = aitoff_forward(table['glon'], table['glat'])
+        self.mask = None
+        self.show_names = False
+        self.hit_map = None # built on first hover after the filters change
+        self.info_index = None
+        self.graphs = {}
+        self.labels = {}
+        self.source_names = []
+        self.source_names_large = []
+        self.legend = None
+
+        # Fixed marker styles so that they do not change with filtering
+        self.marker_styles = markerStyles(table['source_type_name'])
+
+        # Search Box
+        self.search_frame = ROOT.TGHorizontalFrame(self.controls)
+        self.controls.AddFrame(self.search_frame, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
+        self.search_label = ROOT.TGLabel(self.search_frame, 'Search  ')
+        self.search_frame.AddFrame(self.search_label, ROOT.TGLayoutHints(ROOT.kLHintsCenterY))
+        self.search_box = ROOT.TGTextEntry(self.search_frame)
+        self.search_frame.AddFrame(self.search_box, ROOT.TGLayoutHints(ROOT.kLHintsCenterY | ROOT.kLHintsExpandX))
+        self.search_box.Connect("TextChanged(char*)", "TPyDispatcher", self.search_dispatch, "Dispatch()")
+
+        # Enable/disable the LAT all-sky image
+        self.name_group = ROOT.TGGroupFrame(self.controls, "Source Name Labels")
+        self.name_group.SetTitlePos(ROOT.TGGroupFrame.kCenter)
+        self.name = ROOT.TGCheckButton(self.name_group, "Show/Hide")
+        self.name.SetOn(0)
+        self.name_group.AddFrame(self.name, ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
+        self.controls.AddFrame(self.name_group, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
+        self.name.Connect("Toggled(Bool_t)", "TPyDispatcher", self.filter_dispatch, "Dispatch()")
+
+        # Enable/disable the LAT all-sky image
+        self.lat_group = ROOT.TGGroupFrame(self.controls, "LAT All-sky Image")
+        self.lat_group.SetTitlePos(ROOT.TGGroupFrame.kCenter)
+        self.lat = ROOT.TGCheckButton(self.lat_group, "Show/Hide")
+        self.lat.SetOn()
+        self.lat_group.AddFrame(self.lat, ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
+        self.controls.AddFrame(self.lat_group, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
+        self.lat.Connect("Toggled(Bool_t)", "TPyDispatcher", self.main_dispatch, "Dispatch()")
+
+        # Color
+        self.color = ROOT.TGButtonGroup(self.controls, "LAT Image Color")
+        self.lat.Connect("Toggled(Bool_t)", "TGButtonGroup", self.color, "SetState(Bool_t)")
+        self.color.SetTitlePos(ROOT.TGGroupFrame.kCenter)
+        self.colorButton = (ROOT.TGRadioButton(self.color, "Color", 0),
+                            ROOT.TGRadioButton(self.color, "Gray Scale (B to W)", 1),
+                            ROOT.TGRadioButton(self.color, "Gray Scale (W to B)", 2))
+        self.color.SetButton(0)
+        self.controls.AddFrame(self.color, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
+        self.color.Connect("Pressed(Int_t)", "TPyDispatcher", self.main_dispatch, "Dispatch(Long_t)")
+
+        self.contents = ROOT.TGHorizontalFrame(self)
+        self.AddFrame(self.contents, ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
+
+        # Enable/disable the LAT all-sky image
+        self.cat_group = ROOT.TGGroupFrame(self.controls, "Catalog")
+        self.cat_group.SetTitlePos(ROOT.TGGroupFrame.kCenter)
+        self.cat_check = [ROOT.TGCheckButton(self.cat_group, "Default Catalog"),
+                          ROOT.TGCheckButton(self.cat_group, "Newly Announced"),
+                          ROOT.TGCheckButton(self.cat_group, "Other Sources"),
+                          ROOT.TGCheckButton(self.cat_group, "Source Candidates")]
+        for i in range(len(self.cat_check)):
+            if i < 2:
+                self.cat_check[i].SetOn()
+            self.cat_check[i].Connect("Toggled(Bool_t)", "TPyDispatcher", self.filter_dispatch, "Dispatch()")
+            self.cat_group.AddFrame(self.cat_check[i], ROOT.TGLayoutHints(ROOT.kLHintsExpandX | ROOT.kLHintsExpandY))
+        self.controls.AddFrame(self.cat_group, ROOT.TGLayoutHints(ROOT.kLHintsExpandX))
+
+        # main canvas
+        self.mainCanvas = ROOT.TRootEmbeddedCanvas('mainCanvas', self.contents, self.xsize + 4, self.ysize + 4)
+        self.mainCanvas.GetCanvas().SetMargin(0, 0, 0, 0)
+        self.contents.AddFrame(self.mainCanvas, ROOT.TGLayoutHints(ROOT.kLHintsCenterX | ROOT.kLHintsCenterY))
+
+        __main__.tevcatDummyGlobalFunction = self.sub_update
+
+        self.mainCanvas.GetCanvas().AddExec('dynamic', 'TPython::Exec("tevcatDummyGlobalFunction()");')
+        self.mainCanvas.GetCanvas().Update()
+
+        self.SetWindowName('TeVCat Viewer')
+        self.MapSubwindows()
+        self.Resize()
+        self.MapWindow()
+        self.MapRaised()
+
+        self.main_update(0)
+
+    @timed('sub_update')
+    def sub_update(self):
+        canvas = self.subCanvas.GetCanvas()
+        canvas.Clear()
+        canvas.cd()
+
+        if self.sub_image != None:
+            px = int(self.mainCanvas.GetCanvas().GetEventX())
+            py = int(self.ysize - self.mainCanvas.GetCanvas().GetEventY())
+            self.info_update(px, py)
+
+            half = self.subsize/(2.*self.zoom)
+            x0, y0, x1, y1 = px - half, py - half, px + half, py + half
+
+            pyramid = self.getTilePyramid()
+            if pyramid != None and not self.drawTiles(pyramid, x0, y0, x1, y1):
+                # the tiles were removed or cannot be read anymore
+                self.tile_pyramids[self.colormap] = pyramid = None
+            if pyramid == None:
+                # without tiles, the whole image is zoomed as before
+                if x0 >= 0 and y0 >= 0:
+                    self.sub_image.Zoom(int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+                self.sub_image.SetEditable(1)
+                self.sub_image.Draw()
+
+            canvas.cd()
+            canvas.Range(x0/self.xsize, y0/self.ysize, x1/self.xsize, y1/self.ysize)
+            self.drawSubOverlays(x0/self.xsize, y0/self.ysize, x1/self.xsize, y1/self.ysize)
+
+            canvas.Update()
+
+    def generateTiles(self):
+        """
+        Generates the tiles of all the colormaps at the zoom factor of the
+        sub canvas. Runs in a background thread, and touches no ROOT object.
+        """
+        try:
+            from .tiles import TilePyramid
+        except ImportError:
+            TilePyramid = None
+
+        for colormap in sorted(ImageCache.files):
+            pyramid = None
+            if TilePyramid != None:
+                try:
+                    pyramid = TilePyramid(colormap)
+                    pyramid.generate([self.zoom])
+                except (ImportError, OSError):
+                    # e.g. a read-only or full cache directory
+                    pyramid = None
+            self.tile_pyramids[colormap] = pyramid
+
+    def getTilePyramid(self):
+        """
+        Returns the TilePyramid of the current colormap, or None if its tiles
+        are not ready yet or cannot be generated (e.g. without Pillow)
+        """
+        return self.tile_pyramids.get(self.colormap)
+
+    def drawTiles(self, pyramid, x0, y0, x1, y1):
+        """
+        Draws the tiles under the window [x0, x1) x [y0, y1) (pixels of the
+        main canvas) in the sub canvas, each in its own pad. Returns False,
+        drawing nothing, if the tiles are not available.
+        """
+        self.sub_tiles = []
+        try:
+            tiles = pyramid.getVisibleTiles(self.zoom, x0, y0, x1, y1, generate=False)
+        except OSError:
+            return False
+
+        for path, (left, top, width, height), (fx0, fy0, fx1, fy1) in tiles:
+            tile = self.tile_images.get(path)
+            if tile == None:
+                if len(self.tile_images) >= 256:
+                    self.tile_images.clear()
+                tile = self.tile_images[path] = ROOT.TImage.Open(path)
+
+            # the window is at the same scale as the tiles, so only a crop is needed
+            image = tile.Clone('')
+            image.Crop(left, top, width, height)
+            pad = ROOT.TPad('tile', '', fx0, fy0, fx1, fy1)
+            pad.SetMargin(0, 0, 0, 0)
+            pad.SetBorderMode(0)
+            pad.Draw()
+            pad.cd()
+            image.SetEditable(1)
+            image.Draw()
+            self.subCanvas.GetCanvas().cd()
+            self.sub_tiles.append((pad, image))
+
+        return True
+
+    def drawSubOverlays(self, x0, y0, x1, y1):
+        """
+        Draws the markers and the large labels of the sources shown now in
+        the window (normalized pad coordinates) of the sub canvas
+        """
+        if self.mask is None:
+            return
+
+        # labels are drawn to the upper right of the sources, so those to the
+        # lower left of the window may still be seen
+        margin = (x1 - x0)*0.02
+        inside = self.mask & (self.xs >= x0 - margin) & (self.xs <= x1 + margin) & (self.ys >= y0 - margin) & (self.ys <= y1 + margin)
+
+        self.sub_graphs = []
+        type_groups = self.tevcat.getGroups('source_type_name')
+        for source_type_name in self.graphs:
+            indices = type_groups[source_type_name]
+            indices = indices[inside[indices]]
+            if len(indices) == 0:
+                continue
+
+            graph = ROOT.TGraph(len(indices), self.xs[indices], self.ys[indices])
+            graph.SetEditable(0)
+            color, style = self.marker_styles[source_type_name]
+            graph.SetMarkerColor(color)
+            graph.SetMarkerStyle(style)
+            graph.SetMarkerSize(1)
+            graph.Draw('p same')
+            self.sub_graphs.append(graph)
+
+        if self.show_names:
+            labelled = self.mask & (self.xs >= x0 - (x1 - x0)) & (self.xs <= x1) & (self.ys >= y0 - (y1 - y0)) & (self.ys <= y1)
+            for i in numpy.nonzero(labelled)[0]:
+                self.getLabel(i)[1].Draw()
+
+    @timed('main_update')
+    def main_update(self, button = 100):
+        self.mainCanvas.GetCanvas().Clear()
+        self.mainCanvas.GetCanvas().cd()
+
+        if self.lat.IsOn():
+            if button == 0 or (button == 100 and self.color.GetButton(0).IsOn()):
+                self.image, self.sub_image = self.image_cache.get(0)
+                self.colormap = 0
+                self.grid_color = 0
+            elif button == 1 or (button == 100 and self.color.GetButton(1).IsOn()):
+                self.image, self.sub_image = self.image_cache.get(1)
+                self.colormap = 1
+                self.grid_color = 0
+            elif button == 2 or (button == 100 and self.color.GetButton(2).IsOn()):
+                self.image, self.sub_image = self.image_cache.get(2)
+                self.colormap = 2
+                self.grid_color = 1
+
+            self.image.SetEditable(1)
+            self.image.Draw()
+        else:
+            self.color.SetState(False)
+            self.image = None
+            self.sub_image = None
+
+        # Draw coordinate grids
+        self.grid = []
+        for x, y in grid_lines():
+            self.grid.append(ROOT.TPolyLine(len(x), x, y))
+
+        for grid in self.grid:
+            grid.SetLineStyle(2)
+            grid.SetLineColor(self.grid_color)
+            grid.Draw()
+
+        # Draw grid labels
+        self.label = [ROOT.TLatex(0.975, 0.5, '-180#circ'),
+                      ROOT.TLatex(0.025, 0.5, '+180#circ'),
+                      ROOT.TLatex(0.5, 0.98, '+90#circ'),
+                      ROOT.TLatex(0.5, 0.02, '-90#circ')]
+        for label in self.label:
+            label.SetTextAlign(22)
+            label.SetTextSize(0.03)
+            label.Draw()
+
+        self.copyright = ROOT.TLatex(0.99, 0.01, 'TeVCat Ver. %s' % self.tevcat.version)
+        self.copyright.SetTextAlign(31)
+        self.copyright.SetTextSize(0.03)
+        self.copyright.Draw()
+
+        self.sources_update(True)
+
+    def search_changed(self):
+        """
+        Restarts the search timer so that a burst of key strokes causes
+        only one redraw
+        """
+        self.search_timer.Start(self.search_delay, ROOT.kTRUE)
+
+    def filterMask(self):
+        """
+        Returns the boolean array of the sources selected by the catalog
+        check buttons and the search box
+        """
+        titles = [check.GetTitle() for check in self.cat_check if check.IsOn()]
+        mask = self.tevcat.select(mask=True, catalog=titles)
+
+        return mask & self.tevcat.search(self.search_box.GetText(), mask=True)
+
+    def getLabel(self, i):
+        """
+        Returns the (small, large) name labels of the i-th source
+        """
+        try:
+            return self.labels[i]
+        except KeyError:
+            name = ROOT.TText(float(self.xs[i]), float(self.ys[i]), '  %s' % self.tevcat.getSources()[i].getCanonicalName())
+            name.SetTextAngle(45)
+            name.SetTextColor(self.grid_color)
+            name.SetTextSize(0.015)
+            name.SetTextAlign(12)
+            name_large = name.Clone()
+            name_large.SetTextSize(0.06)
+            self.labels[i] = (name, name_large)
+            return self.labels[i]
+
+    @timed('sources_update')
+    def sources_update(self, force=False):
+        """
+        Draws the sources selected by the filters. Only the source types
+        and the labels affected by the change of the selection are
+        redrawn, unless `force` is True (after the canvas is cleared).
+        """
+        canvas = self.mainCanvas.GetCanvas()
+        canvas.cd()
+        primitives = canvas.GetListOfPrimitives()
+
+        table = self.tevcat.getTable()
+        mask = self.filterMask()
+        show_names = bool(self.name.IsOn())
+
+        if force or self.mask is None:
+            changed = numpy.ones(len(mask), dtype=bool)
+        else:
+            changed = mask != self.mask
+            if not changed.any() and show_names == self.show_names:
+                return
+        if changed.any():
+            self.hit_map = None
+
+        # Draw sources. The legend refers to the graphs, so it is rebuilt
+        # whenever one of them is replaced.
+        replaced = False
+        type_groups = self.tevcat.getGroups('source_type_name')
+        for source_type_name in set(table['source_type_name'][changed]):
+            graph = self.graphs.pop(source_type_name, None)
+            if graph != None:
+                primitives.Remove(graph)
+                replaced = True
+
+            indices = type_groups[source_type_name]
+            indices = indices[mask[indices]]
+            if len(indices) == 0:
+                continue
+
+            graph = ROOT.TGraph(len(indices), self.xs[indices], self.ys[indices])
+            graph.SetEditable(0)
+            color, style = self.marker_styles[source_type_name]
+            graph.SetMarkerColor(color)
+            graph.SetMarkerStyle(style)
+            graph.SetMarkerSize(1)
+            graph.Draw('p same')
+            self.graphs[source_type_name] = graph
+            replaced = True
+
+        # Draw source Names
+        if show_names:
+            visible = set(numpy.nonzero(mask)[0])
+        else:
+            visible = set()
+        if force or self.mask is None or not self.show_names:
+            shown = set()
+        else:
+            shown = set(numpy.nonzero(self.mask)[0])
+
+        for i in shown - visible:
+            primitives.Remove(self.labels[i][0])
+        for i in (visible - shown):
+            name = self.getLabel(i)[0]
+            name.SetTextColor(self.grid_color)
+            name.Draw()
+        self.source_names = [self.labels[i][0] for i in sorted(visible)]
+        self.source_names_large = [self.labels[i][1] for i in sorted(visible)]
+        for name in self.source_names_large:
+            name.SetTextColor(self.grid_color)
+
+        # Draw legend
+        if force or replaced:
+            if self.legend != None:
+                primitives.Remove(self.legend)
+            self.legend = ROOT.TLegend(0., 0., 0.22, 0.18)
+            self.legend.SetNColumns(2)
+            self.legend.SetBorderSize(0)
+            self.legend.SetFillStyle(0)
+            self.legend.SetLineStyle(0)
+            for source_type in self.marker_styles:
+                if source_type in self.graphs:
+                    self.legend.AddEntry(self.graphs[source_type], source_type, 'p')
+            self.legend.Draw()
+
+        self.mask = mask
+        self.show_names = show_names
+
+        canvas.Modified()
+        canvas.Update()
+
+    def getHitMap(self):
+        """
+        Returns the hit-map of the sources shown now (see tevcat.hitmap),
+        which is rebuilt only after the filters change
+        """
+        if self.hit_map is None:
+            table = self.tevcat.getTable()
+            mask = self.filterMask() if self.mask is None else self.mask
+            self.hit_map = buildHitMap(table['glon'], table['glat'], numpy.nonzero(mask)[0], 3., self.xsize, self.ysize)
+
+        return self.hit_map
+
+    @timed('info_update')
+    def info_update(self, px, py):
+        """
+        Shows the parameters of the source within 3 deg from the pixel under
+        the cursor
+        """
+        if 0 <= px < self.xsize and 0 <= py < self.ysize:
+            i = int(self.getHitMap()[py, px])
+        else:
+            i = -1
+
+        if i == self.info_index:
+            return
+        self.info_index = i
+
+        if i < 0:
+            self.info.SetText(ROOT.TGText(""))
+            return
+
+        text = ROOT.TGText('')
+        info = self.tevcat.getSources()[i].__str__().replace(u'\xb0', u'') # another candidate?
+        info = str(info.replace(u'\u2212', u'-').replace(u'\u2013', u'-'))
+
+        for i, line in enumerate(info.split('\n')):
+            text.InsLine(i, line)
+        self.info.SetText(text)
+        self.info.Update()
+
+    def pad2sky(self, x, y):
+        """
+        Returns (l, b) in degrees at the normalized pad coordinates, or
+        None if it is outside of the sky
+        """
+        l, b = aitoff_inverse(x, y)
+        if numpy.isnan(l):
+            return None
+
+        return (float(l), float(b))
+
+    def sky2pad(self, l, b):
+        """
+        Returns the normalized pad coordinates of (l, b) in degrees
+        """
+        x, y = aitoff_forward(l, b)
+        return float(x), float(y)